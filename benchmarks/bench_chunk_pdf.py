@@ -0,0 +1,64 @@
+# Benchmarks chunk_pdf's page extraction: the original sequential loop against the process pool.
+# Run from the repo root: python -m benchmarks.bench_chunk_pdf [pages] [workers]
+
+import os
+import sys
+import tempfile
+import time
+
+import PyPDF2
+
+from benchmarks.synthetic_pdf import write_synthetic_pdf
+from src import chunk_pdf
+
+
+def extract_text_sequential(pdf_path):
+    # The extraction loop chunk_pdf used before pages were spread over worker processes
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        text = ''
+        for page_num, page in enumerate(reader.pages, start=1):
+            page_text = page.extract_text()
+            if page_text:
+                text += f'Page {page_num}:' + page_text + '\n'
+    return text
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    cpus = os.cpu_count() or 1
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else cpus
+    # extract_text_from_pdf starts no more processes than there are page ranges
+    used = min(workers, -(-pages // chunk_pdf.PAGES_PER_TASK))
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = write_synthetic_pdf(os.path.join(directory, "synthetic.pdf"), pages)
+        print(f"Synthetic PDF: {pages} pages, {os.path.getsize(pdf_path) / 1e6:.1f} MB, "
+              f"{used} worker processes on {cpus} CPUs")
+        if used > cpus:
+            print(f"Warning: more workers than CPUs, so the speedup is at most {cpus}x")
+
+        baseline, baseline_time = timed(extract_text_sequential, pdf_path)
+        print(f"sequential:   {baseline_time:7.2f}s  {pages / baseline_time:8.1f} pages/s")
+
+        parallel, parallel_time = timed(chunk_pdf.extract_text_from_pdf, pdf_path, workers=workers, backend="pypdf2")
+        if used <= 1 or cpus == 1:
+            # One worker runs the sequential path, and one CPU runs the workers one after another, so the
+            # comparison below would only measure noise; the output is still checked
+            print(f"process pool: {parallel_time:7.2f}s  {pages / parallel_time:8.1f} pages/s  "
+                  f"(not compared: nothing runs in parallel with {used} workers on {cpus} CPUs)")
+        else:
+            print(f"process pool: {parallel_time:7.2f}s  {pages / parallel_time:8.1f} pages/s  "
+                  f"({baseline_time / parallel_time:.2f}x)")
+
+        if parallel != baseline:
+            raise SystemExit("Parallel extraction produced different text than the sequential path")
+
+
+if __name__ == "__main__":
+    main()
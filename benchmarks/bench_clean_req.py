@@ -0,0 +1,88 @@
+# Benchmarks clean_req's JSON extraction: the original regex extractor against the raw_decode scanner.
+# Run from the repo root: python -m benchmarks.bench_clean_req [objects per response] [responses]
+
+import json
+import random
+import re
+import sys
+import time
+
+from benchmarks.synthetic_pdf import requirement_sentence
+from src.clean_req import APIResponseCleaner
+
+
+def synthetic_objects(rng, count, chunk_id):
+    # Requirement objects like the model returns, some with a nested object
+    objects = []
+    for _ in range(count):
+        obj = {"chunk_id": chunk_id, "text": requirement_sentence(rng), "probability": round(rng.random(), 2),
+               "justification": "Uses a modal verb {shall} and describes [a capability] of the system."}
+        if rng.random() < 0.3:
+            obj["source"] = {"page": rng.randint(1, 500), "section": {"number": rng.randint(1, 40)}}
+        objects.append(obj)
+    return objects
+
+
+def synthetic_responses(objects_per_response, responses, seed=0):
+    """Return (shape, content) pairs for the ways models lay out their answers."""
+    rng = random.Random(seed)
+    contents = []
+    for i in range(responses):
+        objects = synthetic_objects(rng, objects_per_response, i + 1)
+        shape = ("fenced array", "bare objects", "trailing commas")[i % 3]
+        if shape == "fenced array":
+            content = "Here are the requirements:\n```json\n" + json.dumps(objects, indent=2) + "\n```"
+        elif shape == "bare objects":
+            content = "\n\n".join(json.dumps(obj, indent=2) for obj in objects)
+        else:
+            content = "[\n" + "".join(json.dumps(obj) + ",\n" for obj in objects) + "]"
+        contents.append((shape, content))
+    return contents
+
+
+def extract_objects_regex(content):
+    # The extraction clean_req used before the raw_decode scanner
+    code_block_pattern = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL | re.IGNORECASE)
+    json_blocks = [match.strip() for match in code_block_pattern.findall(content)]
+    if not json_blocks:
+        match = re.compile(r'(\{.*?\}|\[.*?\])', re.DOTALL).search(content)
+        json_blocks = [match.group(1).strip()] if match else []
+    objects = []
+    for json_str in json_blocks:
+        cleaned_json = re.sub(r',\s*(\}|\])', r'\1', json_str).strip()
+        try:
+            parsed_json = json.loads(cleaned_json)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(parsed_json, dict):
+            objects.append(parsed_json)
+        elif isinstance(parsed_json, list):
+            objects.extend(parsed_json)
+    return objects
+
+
+def measure(extract, contents):
+    start = time.perf_counter()
+    found = sum(len(extract(content)) for content in contents)
+    return found, time.perf_counter() - start
+
+
+def main():
+    objects_per_response = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    responses = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    contents = synthetic_responses(objects_per_response, responses)
+    cleaner = APIResponseCleaner("", "")
+
+    for shape in ("fenced array", "bare objects", "trailing commas"):
+        shaped = [content for content_shape, content in contents if content_shape == shape]
+        megabytes = sum(len(content) for content in shaped) / 1e6
+        expected = len(shaped) * objects_per_response
+        print(f"{shape}: {len(shaped)} responses, {megabytes:.1f} MB, {expected} objects")
+        for name, extract in (("regex", extract_objects_regex),
+                              ("raw_decode", lambda content: cleaner.extract_objects(content, 0))):
+            found, elapsed = measure(extract, shaped)
+            print(f"  {name:10s} {elapsed:7.3f}s  {megabytes / elapsed:7.1f} MB/s  {found:8d} objects found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Benchmarks csv_to_cypher's per-edge script: the original iterrows loop against the chunked, column-wise version.
+# Run from the repo root: python -m benchmarks.bench_csv_to_cypher [rows]
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_pdf import ACTIONS, MODALS, OBJECTS, SUBJECTS
+from src import csv_to_cypher
+from src.csv_to_cypher import escape_quotes, sanitize_relationship
+
+
+def write_synthetic_triples(path, rows, seed=0):
+    """Write a triples.csv of `rows` requirement-style triples and return its path."""
+    rng = random.Random(seed)
+    # Numbered entities so the node count grows with the file, like a real corpus
+    entities = [f"{name} {i}" for i in range(max(1, rows // 20)) for name in (rng.choice(SUBJECTS), rng.choice(OBJECTS))]
+    entities += ["the agency's records", "O'Brien"]
+    predicates = [f"{modal} {action}" for modal in MODALS for action in ACTIONS]
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Subject", "Predicate", "Object"])
+        for _ in range(rows):
+            writer.writerow([rng.choice(entities), rng.choice(predicates), rng.choice(entities)])
+    return path
+
+
+def generate_cypher_script_iterrows(file_path, output_dir):
+    # The conversion csv_to_cypher used before it was chunked and vectorized
+    triples_df = pd.read_csv(file_path)
+    unique_nodes = set()
+    cypher_statements = []
+    for _, row in triples_df.iterrows():
+        subject = escape_quotes(row['Subject'])
+        obj = escape_quotes(row['Object'])
+        predicate = sanitize_relationship(row['Predicate']).upper()
+        unique_nodes.add(subject)
+        unique_nodes.add(obj)
+        relationship_statement = f"MATCH (a:Node {{name: '{subject}'}}), (b:Node {{name: '{obj}'}}) CREATE (a)-[:{predicate}]->(b);"
+        cypher_statements.append(relationship_statement)
+    node_statements = [f"MERGE (n:Node {{name: '{node}'}});" for node in unique_nodes]
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'triples.cypher'), 'w') as file:
+        file.write("\n".join(node_statements + cypher_statements))
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def statements(output_dir):
+    with open(os.path.join(output_dir, 'triples.cypher')) as file:
+        return sorted(file.read().split("\n"))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = write_synthetic_triples(os.path.join(directory, "triples.csv"), rows)
+        print(f"Synthetic triples.csv: {rows} rows, {os.path.getsize(csv_path) / 1e6:.1f} MB")
+
+        baseline_dir = os.path.join(directory, "iterrows")
+        baseline_time = timed(generate_cypher_script_iterrows, csv_path, baseline_dir)
+        print(f"iterrows:    {baseline_time:7.2f}s  {rows / baseline_time:10.0f} rows/s")
+
+        chunked_dir = os.path.join(directory, "chunked")
+        chunked_time = timed(csv_to_cypher.generate_cypher_script, csv_path, chunked_dir)
+        print(f"vectorized:  {chunked_time:7.2f}s  {rows / chunked_time:10.0f} rows/s  "
+              f"({baseline_time / chunked_time:.1f}x)")
+
+        batched_time = timed(csv_to_cypher.generate_batched_cypher_script, csv_path, os.path.join(directory, "batched"))
+        print(f"batched:     {batched_time:7.2f}s  {rows / batched_time:10.0f} rows/s")
+
+        # Node statements come out in a different order, so compare the scripts as sets of lines
+        if statements(baseline_dir) != statements(chunked_dir):
+            raise SystemExit("The vectorized script differs from the iterrows script")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Benchmarks dedup's MinHash/LSH clustering against comparing every pair of requirements.
+# Run from the repo root: python -m benchmarks.bench_dedup [requirements] [requirements.json]
+# By default it uses synthetic requirements built from a small vocabulary, so many repeat with small changes
+# the way restated requirements do; given clean_req's requirements.json it uses those instead.
+
+import random
+import sys
+import time
+
+from benchmarks.synthetic_pdf import requirement_sentence
+from src import dedup
+from src.clean_req import APIResponseCleaner
+
+# Brute force compares every pair, so it is only run up to this many requirements
+BRUTE_FORCE_LIMIT = 5000
+
+
+def restate(rng, sentence):
+    # The same requirement as another section might word it
+    words = sentence.rstrip(".").split()
+    change = rng.random()
+    if change < 0.3:
+        return sentence.upper()
+    if change < 0.6:
+        return " ".join(words) + ";"
+    if change < 0.8:
+        return " ".join(words + ["as", "specified"]) + "."
+    return sentence
+
+
+def synthetic_requirements(count, seed=0):
+    rng = random.Random(seed)
+    texts = []
+    while len(texts) < count:
+        texts.append(requirement_sentence(rng) if not texts or rng.random() < 0.7 else restate(rng, rng.choice(texts)))
+    return texts
+
+
+def brute_force(texts, threshold=dedup.THRESHOLD):
+    """Cluster by comparing every pair, returning (clusters, pairs compared)."""
+    sets = [set(dedup.shingles(text).tolist()) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(index):
+        while parent[index] != index:
+            index = parent[index]
+        return index
+
+    for i in range(len(texts)):
+        for j in range(i):
+            if dedup.jaccard(sets[i], sets[j]) >= threshold:
+                low, high = sorted((find(i), find(j)))
+                parent[high] = low
+    clusters = {}
+    for index in range(len(texts)):
+        clusters.setdefault(find(index), []).append(index)
+    return list(clusters.values()), len(texts) * (len(texts) - 1) // 2
+
+
+def main():
+    args = sys.argv[1:]
+    if args and not args[0].isdigit():
+        texts = [obj["text"] for obj in APIResponseCleaner(args[0], '').load_input_file() if "text" in obj]
+        print(f"{len(texts)} requirements from '{args[0]}'")
+    else:
+        texts = synthetic_requirements(int(args[0]) if args else 5000)
+        print(f"{len(texts)} synthetic requirements")
+
+    start = time.perf_counter()
+    clusters, compared = dedup.cluster(texts)
+    elapsed = time.perf_counter() - start
+    removed = len(texts) - len(clusters)
+    characters = sum(len(texts[members[0]]) for members in clusters)
+    print(f"MinHash/LSH ({dedup.BANDS} bands x {dedup.ROWS} rows): {elapsed:.2f}s, {compared} pairs compared, "
+          f"{len(clusters)} clusters, {removed} near-duplicates removed "
+          f"({1 - characters / max(1, sum(map(len, texts))):.1%} of the text sent to call_api_trip)")
+
+    if len(texts) > BRUTE_FORCE_LIMIT:
+        print(f"Brute force skipped above {BRUTE_FORCE_LIMIT} requirements")
+        return
+    start = time.perf_counter()
+    exact, pairs = brute_force(texts)
+    elapsed = time.perf_counter() - start
+    # Clusters found by both agree member for member; LSH can only miss merges, never add wrong ones
+    missed = len(clusters) - len(exact)
+    print(f"Brute force: {elapsed:.2f}s, {pairs} pairs compared, {len(exact)} clusters; "
+          f"LSH {'agrees' if sorted(clusters) == sorted(exact) else f'missed {missed} merges'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Reports pages/sec and peak memory for every installed PDF backend on the files in data/in_chunk_pdf.
+# Run from the repo root: python -m benchmarks.bench_pdf_backends [pdf directory]
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.pdf_backends import BACKENDS, get_backend
+
+
+def peak_memory_mb():
+    # Peak resident memory of this process; ru_maxrss is in KB on Linux and bytes on macOS
+    try:
+        import resource
+    except ImportError:
+        # Windows has no resource module; report the Python heap peak instead
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def measure(backend_name, pdf_path):
+    # Runs in a fresh process so each backend's peak memory is measured on its own
+    import tracemalloc
+    tracemalloc.start()
+    backend = get_backend(backend_name)
+    start = time.perf_counter()
+    pages = backend.page_count(pdf_path)
+    texts = backend.extract_pages(pdf_path, 0, pages)
+    elapsed = time.perf_counter() - start
+    return pages, elapsed, sum(len(t) for t in texts), peak_memory_mb()
+
+
+def main():
+    pdf_directory = sys.argv[1] if len(sys.argv) > 1 else "data/in_chunk_pdf"
+    pdf_files = [os.path.join(pdf_directory, f) for f in sorted(os.listdir(pdf_directory)) if f.lower().endswith(".pdf")]
+    if not pdf_files:
+        raise SystemExit(f"No PDF files found in {pdf_directory}")
+
+    print(f"{'file':30} {'backend':10} {'pages':>6} {'seconds':>8} {'pages/s':>9} {'chars':>9} {'peak MB':>8}")
+    for pdf_path in pdf_files:
+        for name, backend in BACKENDS.items():
+            if not backend.available():
+                print(f"{os.path.basename(pdf_path)[:30]:30} {name:10} not installed")
+                continue
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                pages, elapsed, chars, peak = executor.submit(measure, name, pdf_path).result()
+            print(f"{os.path.basename(pdf_path)[:30]:30} {name:10} {pages:6d} {elapsed:8.2f} "
+                  f"{pages / elapsed:9.1f} {chars:9d} {peak:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# Benchmarks main.py's eight steps end to end on synthetic specifications, against a local mock API server.
+# Run from the repo root: python -m benchmarks.bench_pipeline [pages,pages,...] [latency] [error rate]
+# Each run is compared with the baseline in benchmarks/baselines/bench_pipeline.json, stage by stage, if that
+# baseline was measured with the same tokenizer, sentence splitter and CPU count.
+# Add --save-baseline to store the results as the new baseline, and --in-memory to run the steps the way
+# main.py --in-memory does.
+# Needs no API key or network, but tiktoken's encodings and NLTK's punkt data are downloaded on first use:
+# on a machine without network access, run it once online or copy the tiktoken cache (TIKTOKEN_CACHE_DIR) and
+# nltk_data over.
+
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import nltk
+
+from benchmarks.synthetic_pdf import MODALS, write_synthetic_pdf
+from src import (call_api_req, call_api_trip, chunk_pdf, chunk_req, clean_req, clean_trip, csv_to_cypher,
+                 group_req, handoff, metrics)
+from src.chunker import get_encoding
+from src.mock_api import MockAPIServer
+
+BASELINE_PATH = "benchmarks/baselines/bench_pipeline.json"
+
+# A run slower (or bigger) than its baseline by more than this fraction is reported as a regression
+REGRESSION_THRESHOLD = 0.20
+# Stages quicker than this are too noisy to compare
+MIN_COMPARED_SECONDS = 0.05
+
+# The mock server has no rate limits, so the client only limits concurrency
+MAX_WORKERS = 32
+UNLIMITED = 10 ** 9
+# The API stages send as fast as the mock server answers and are never cached
+API_OPTIONS = {"max_workers": MAX_WORKERS, "requests_per_minute": UNLIMITED, "tokens_per_minute": UNLIMITED,
+               "use_cache": False}
+
+# Requirement objects returned per chunk, at most
+REQUIREMENTS_PER_CHUNK = 8
+
+MODAL_SENTENCE = re.compile(r'[^.]*\b(?:' + '|'.join(MODALS) + r')\b[^.]*\.')
+TRIPLE_PATTERN = re.compile(r'^(.*?)\s+(' + '|'.join(MODALS) + r')\s+(\w+)\s+(.*?)\.?$')
+
+
+def canned_responder(request):
+    """Answer like the models do: requirement JSON for a chunk, triple text for a batch of requirements."""
+    user = request["messages"][-1]["content"]
+    if user.startswith("Chunk ID:"):
+        chunk_id = user.split()[2]
+        sentences = MODAL_SENTENCE.findall(user)[:REQUIREMENTS_PER_CHUNK]
+        return json.dumps({"requirements": [
+            {"chunk_id": chunk_id, "text": sentence.strip(), "probability": 0.9,
+             "justification": "Uses a modal verb and describes a capability of the system."}
+            for sentence in sentences]})
+    triples = []
+    for line in user.splitlines():
+        match = TRIPLE_PATTERN.match(line.strip())
+        if match:
+            subject, modal, action, obj = match.groups()
+            triples.append(f"{subject}, {modal} {action}, {obj.replace(',', '')}")
+    return ". ".join(triples) + "."
+
+
+def stages():
+    # main.py's eight steps, each reading the files the one before it wrote
+    return [
+        ("chunk_pdf", chunk_pdf.main),
+        ("call_api_req", lambda: call_api_req.main(**API_OPTIONS)),
+        ("clean_req", clean_req.main),
+        ("group_req", group_req.main),
+        ("chunk_req", chunk_req.main),
+        ("call_api_trip", lambda: call_api_trip.main(**API_OPTIONS)),
+        ("clean_trip", clean_trip.main),
+        ("csv_to_cypher", csv_to_cypher.main),
+    ]
+
+
+def check_prerequisites():
+    """Exit with instructions if the tokenizers or the sentence splitter can't be loaded."""
+    for model in (call_api_req.MODEL, call_api_trip.MODEL):
+        try:
+            get_encoding(model)
+        except Exception as e:
+            raise SystemExit(f"bench_pipeline needs tiktoken's encoding for {model}, which is downloaded on first "
+                             f"use and could not be loaded ({e}). Run it once with network access, or set "
+                             f"TIKTOKEN_CACHE_DIR to a directory holding the cached encoding.")
+    try:
+        nltk.tokenize.sent_tokenize("One sentence. Another one.")
+    except LookupError:
+        raise SystemExit("bench_pipeline needs NLTK's punkt sentence tokenizer. Install it with "
+                         "python -c \"import nltk; nltk.download('punkt_tab'); nltk.download('punkt')\"")
+
+
+# Environment fields that must match the baseline's for the timings to be compared at all: the tokenizer and
+# sentence splitter decide how the document is chunked, and the CPU count how much runs in parallel
+COMPARED_ENVIRONMENT = ("tokenizer", "sentence_splitter", "cpus")
+
+
+def environment():
+    # What a result was measured on
+    splitter = nltk.tokenize.sent_tokenize
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "tokenizer": getattr(get_encoding(call_api_req.MODEL), "name", "unknown"),
+            "sentence_splitter": f"{splitter.__module__}.{splitter.__qualname__} (nltk {nltk.__version__})"}
+
+
+def environment_mismatch(result, baseline):
+    """Describe how the environment of a result differs from its baseline's, or return None if they match."""
+    base = baseline.get("environment") or {}
+    different = [f"{field} {base.get(field)!r} vs {result['environment'].get(field)!r}"
+                 for field in COMPARED_ENVIRONMENT if base.get(field) != result["environment"].get(field)]
+    return ", ".join(different) if different else None
+
+
+def run_pipeline(pages, latency, error_rate, in_memory=False):
+    """Run every stage on a synthetic document of `pages` pages in a scratch directory and return the run report."""
+    repo_dir = os.getcwd()
+    server = MockAPIServer(latency=latency, error_rate=error_rate, responder=canned_responder).start()
+    os.environ["API_URL"] = server.url
+    os.environ.setdefault("API_KEY", "benchmark")
+    with tempfile.TemporaryDirectory() as directory:
+        # The stages read and write paths under data/, so each run gets a data/ of its own
+        shutil.copytree(os.path.join(repo_dir, "data", "prompts"), os.path.join(directory, "data", "prompts"))
+        os.makedirs(os.path.join(directory, "data", "in_chunk_pdf"))
+        write_synthetic_pdf(os.path.join(directory, "data", "in_chunk_pdf", "spec.pdf"), pages)
+        os.chdir(directory)
+        report = metrics.start_report()
+        try:
+            # The stages print a line per request; keep the benchmark's output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                if in_memory:
+                    # handoff measures its steps in the active report itself
+                    handoff.run(**API_OPTIONS)
+                else:
+                    for name, stage in stages():
+                        with report.stage(name):
+                            stage()
+        finally:
+            metrics.stop_report()
+            os.chdir(repo_dir)
+            server.stop()
+    return report.to_dict()
+
+
+def summarize(pages, report):
+    stages = report["stages"]
+    peaks = [values["peak_memory_bytes"] for values in stages.values() if values["peak_memory_bytes"]]
+    return {
+        "pages": pages,
+        "wall_seconds": round(sum(values["wall_seconds"] for values in stages.values()), 3),
+        "peak_memory_bytes": max(peaks) if peaks else None,
+        "stages": {name: {"wall_seconds": values["wall_seconds"],
+                          "pages_per_second": round(pages / values["wall_seconds"], 1) if values["wall_seconds"] else None}
+                   for name, values in stages.items()},
+        "requests": sum(stats["requests"] for models in report["api"].values() for stats in models.values()),
+        "environment": environment(),
+    }
+
+
+def print_summary(result):
+    print(f"{result['pages']} pages: {result['wall_seconds']:.2f}s end to end, {result['requests']} API requests"
+          + (f", {result['peak_memory_bytes'] / 1e6:.0f} MB peak RSS" if result["peak_memory_bytes"] else ""))
+    for name, values in result["stages"].items():
+        print(f"  {name:14s} {values['wall_seconds']:8.3f}s  {values['pages_per_second'] or 0:10.1f} pages/s")
+
+
+def print_comparison(result, baseline):
+    """Print each measurement next to its baseline with the change in percent."""
+    rows = [("end to end", result["wall_seconds"], baseline["wall_seconds"])]
+    rows += [(name, values["wall_seconds"], baseline["stages"][name]["wall_seconds"])
+             for name, values in result["stages"].items() if name in baseline["stages"]]
+    for name, value, base in rows:
+        change = f"{(value / base - 1) * 100:+5.0f}%" if base else "    -"
+        print(f"  {name:14s} {value:8.3f}s  baseline {base:8.3f}s  {change}")
+    if result["peak_memory_bytes"] and baseline.get("peak_memory_bytes"):
+        print(f"  {'peak RSS':14s} {result['peak_memory_bytes'] / 1e6:7.0f} MB  baseline "
+              f"{baseline['peak_memory_bytes'] / 1e6:7.0f} MB  "
+              f"{(result['peak_memory_bytes'] / baseline['peak_memory_bytes'] - 1) * 100:+5.0f}%")
+
+
+def regressions(result, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return a description of every measurement that is worse than the baseline by more than the threshold."""
+    found = []
+    compared = [("end to end", result["wall_seconds"], baseline["wall_seconds"])]
+    compared += [(name, values["wall_seconds"], baseline["stages"][name]["wall_seconds"])
+                 for name, values in result["stages"].items() if name in baseline["stages"]]
+    for name, value, base in compared:
+        if max(value, base) >= MIN_COMPARED_SECONDS and value > base * (1 + threshold):
+            found.append(f"{name}: {value:.3f}s vs {base:.3f}s baseline (+{(value / base - 1) * 100:.0f}%)")
+    if result["peak_memory_bytes"] and baseline.get("peak_memory_bytes") and \
+            result["peak_memory_bytes"] > baseline["peak_memory_bytes"] * (1 + threshold):
+        found.append(f"peak RSS: {result['peak_memory_bytes'] / 1e6:.0f} MB vs "
+                     f"{baseline['peak_memory_bytes'] / 1e6:.0f} MB baseline")
+    return found
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    sizes = [int(pages) for pages in args[0].split(",")] if args else [10, 100, 1000]
+    latency = float(args[1]) if len(args) > 1 else 0.2
+    error_rate = float(args[2]) if len(args) > 2 else 0.0
+    in_memory = "--in-memory" in sys.argv[1:]
+    check_prerequisites()
+    print(f"Mock API latency {latency}s, error rate {error_rate:.0%}" + (", steps handed off in memory" if in_memory else ""))
+
+    results = {}
+    for pages in sizes:
+        start = time.perf_counter()
+        results[str(pages)] = summarize(pages, run_pipeline(pages, latency, error_rate, in_memory))
+        print_summary(results[str(pages)])
+        print(f"  (benchmark took {time.perf_counter() - start:.1f}s including the synthetic PDF)")
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    if "--save-baseline" in sys.argv[1:]:
+        baselines.update(results)
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=4)
+        print(f"Baselines saved to '{BASELINE_PATH}'")
+        return
+
+    failed = False
+    mismatched = False
+    for size, result in results.items():
+        if size not in baselines:
+            print(f"{size} pages: no baseline (run with --save-baseline to store one)")
+            continue
+        mismatch = environment_mismatch(result, baselines[size])
+        if mismatch:
+            # Timings from a different tokenizer, splitter or CPU count would only give meaningless deltas
+            print(f"{size} pages: not compared, the baseline was measured in another environment ({mismatch})")
+            mismatched = True
+            continue
+        print(f"{size} pages compared with the baseline:")
+        print_comparison(result, baselines[size])
+        found = regressions(result, baselines[size])
+        for line in found:
+            print(f"{size} pages: REGRESSION {line}")
+        if not found:
+            print(f"{size} pages: within {REGRESSION_THRESHOLD:.0%} of the baseline")
+        failed = failed or bool(found)
+    if failed:
+        raise SystemExit(1)
+    if mismatched:
+        raise SystemExit("The baseline doesn't match this environment; record one here with --save-baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Measures what the prefilter saves and which requirements it would have kept from the model.
+# Run from the repo root: python -m benchmarks.bench_prefilter [pages] [chunks.json requirements.json]
+# Recall is measured against requirements found without the prefilter: by default data/out_chunk_pdf and
+# data/out_clean_req from the last full run (a hand-labeled requirements.json works too). Without those files,
+# or given a page count, it uses a synthetic specification with table of contents and glossary pages,
+# labeled the way the mock API in bench_pipeline answers.
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_pipeline import MODAL_SENTENCE
+from benchmarks.synthetic_pdf import write_synthetic_pdf
+from src import chunk_pdf, prefilter
+from src.incremental import ChunkIds
+
+CHUNKS_FILE = "data/out_chunk_pdf/spec_chunks.json"
+REQUIREMENTS_FILE = "data/out_clean_req/requirements.json"
+
+# Fraction of the synthetic pages that hold no requirements
+BOILERPLATE = 0.3
+THRESHOLDS = (prefilter.THRESHOLD, 1.0)
+# Missed requirements printed per setting
+SHOW_MISSED = 5
+
+
+def synthetic_sample(pages):
+    """Chunk a synthetic specification and label its requirement sentences; returns (chunks, requirements)."""
+    with tempfile.TemporaryDirectory() as directory:
+        write_synthetic_pdf(os.path.join(directory, "spec.pdf"), pages, boilerplate=BOILERPLATE)
+        chunk_pdf.download_nltk_resources()
+        chunk_id = ChunkIds()
+        chunks = [{"chunk_id": chunk_id(item), "chunk": item} for item, _ in chunk_pdf.iter_chunks(directory, {})]
+    requirements = [{"chunk_id": chunk["chunk_id"], "text": sentence.strip()}
+                    for chunk in chunks for sentence in MODAL_SENTENCE.findall(chunk["chunk"])]
+    return chunks, requirements
+
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and not args[0].isdigit():
+        chunks, requirements = load_json(args[0]), load_json(args[1])
+        print(f"{len(chunks)} chunks from '{args[0]}', labels from '{args[1]}'")
+    elif not args and os.path.exists(CHUNKS_FILE) and os.path.exists(REQUIREMENTS_FILE):
+        chunks, requirements = load_json(CHUNKS_FILE), load_json(REQUIREMENTS_FILE)
+        print(f"{len(chunks)} chunks from '{CHUNKS_FILE}', labels from '{REQUIREMENTS_FILE}'")
+    else:
+        pages = int(args[0]) if args else 200
+        chunks, requirements = synthetic_sample(pages)
+        print(f"Synthetic specification: {pages} pages, {BOILERPLATE:.0%} of them boilerplate, {len(chunks)} chunks")
+
+    for mode in prefilter.MODES:
+        for threshold in THRESHOLDS:
+            start = time.perf_counter()
+            kept, stats = prefilter.filter_chunks(chunks, mode, threshold)
+            elapsed = time.perf_counter() - start
+            found = prefilter.recall(requirements, chunks, kept)
+            total = stats["tokens_saved"] + stats["tokens_sent"]
+            recall = f"{found['recall']:.1%}" if found["recall"] is not None else "n/a"
+            print(f"{mode:10s} threshold {threshold:.1f}: {stats['kept_chunks']:5d}/{stats['chunks']} chunks, "
+                  f"{stats['tokens_saved'] / total if total else 0:5.1%} of input tokens saved, "
+                  f"recall {recall} ({found['kept']}/{found['found']} of {found['labels']} labels), "
+                  f"{elapsed * 1000 / max(1, len(chunks)):.2f} ms per chunk")
+            for text in found["missed"][:SHOW_MISSED]:
+                print(f"    missed: {text[:100]}")
+
+
+if __name__ == "__main__":
+    main()
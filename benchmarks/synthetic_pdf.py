@@ -0,0 +1,99 @@
+# Writes synthetic requirement-style PDFs of any size for the benchmarks, without needing a PDF library
+
+import random
+
+SUBJECTS = ["The system", "The agency", "The vendor", "The application", "The database", "Each user",
+            "The reporting module", "The interface", "The contractor", "The payment service"]
+MODALS = ["shall", "must", "should", "will", "may"]
+ACTIONS = ["record", "validate", "encrypt", "display", "export", "archive", "audit", "approve", "notify", "reconcile"]
+OBJECTS = ["every transaction", "the inventory records", "user credentials", "monthly financial reports",
+           "supplies and materials", "all audit logs", "the decision making dashboard", "invoice data",
+           "agency management reporting", "access requests"]
+QUALIFIERS = ["within 24 hours", "in real time", "at the end of each month", "before it is stored",
+              "for at least seven years", "using approved methods", "without manual intervention", ""]
+GLOSSARY = ["Audit log", "Vendor", "Agency", "Dashboard", "Reconciliation", "Credential", "Archive", "Invoice"]
+FILLER = ["This section describes the scope of the procurement.", "See Appendix B for definitions.",
+          "The following table summarizes the current environment.", "Background information is provided below."]
+
+
+def requirement_sentence(rng):
+    """Return one random sentence, most of them requirement statements."""
+    if rng.random() < 0.25:
+        return rng.choice(FILLER)
+    parts = [rng.choice(SUBJECTS), rng.choice(MODALS), rng.choice(ACTIONS), rng.choice(OBJECTS), rng.choice(QUALIFIERS)]
+    return " ".join(p for p in parts if p) + "."
+
+
+def page_lines(rng, page_num, lines_per_page):
+    lines = [f"Section {page_num}"]
+    line = ""
+    while len(lines) < lines_per_page:
+        sentence = requirement_sentence(rng)
+        # Wrap at roughly 90 characters, like a real page of text
+        if len(line) + len(sentence) > 90 and line:
+            lines.append(line)
+            line = sentence
+        else:
+            line = f"{line} {sentence}".strip()
+    return lines
+
+
+def boilerplate_lines(rng, page_num, lines_per_page, glossary=False):
+    """Return a table of contents or glossary page, which holds no requirements."""
+    if not glossary:
+        return ["Table of Contents"] + [f"{page_num}.{n} {rng.choice(OBJECTS).capitalize()} {'.' * 20} "
+                                        f"{rng.randint(1, 400)}" for n in range(1, lines_per_page)]
+    return ["Glossary"] + [f"{rng.choice(GLOSSARY)}: the {rng.choice(OBJECTS)} kept by {rng.choice(SUBJECTS).lower()}."
+                           for _ in range(1, lines_per_page)]
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_synthetic_pdf(path, pages, lines_per_page=50, seed=0, boilerplate=0.0):
+    """Write a PDF of `pages` pages of requirement-style text and return its path.
+
+    A `boilerplate` fraction of the pages are a table of contents at the front and a glossary at the back instead.
+    """
+    front = int(pages * boilerplate / 2)
+    back = pages - int(pages * boilerplate) + front
+    rng = random.Random(seed)
+    # Object 1 is the catalog, 2 the page tree and 3 the font; each page adds a page and a content object
+    offsets = []
+    chunks = [b"%PDF-1.4\n"]
+    size = len(chunks[0])
+
+    def add(obj_bytes):
+        nonlocal size
+        offsets.append(size)
+        chunks.append(obj_bytes)
+        size += len(obj_bytes)
+
+    page_ids = [4 + 2 * i for i in range(pages)]
+    add(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    add(f"2 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {pages} >>\nendobj\n".encode("latin-1"))
+    add(b"3 0 obj\n<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>\nendobj\n")
+
+    for i, pid in enumerate(page_ids, start=1):
+        text_ops = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        if i <= front or i > back:
+            lines = boilerplate_lines(rng, i, lines_per_page, glossary=i > back)
+        else:
+            lines = page_lines(rng, i, lines_per_page)
+        text_ops += [f"({escape(line)}) '" for line in lines]
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode("latin-1")
+        add((f"{pid} 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+             f"/Resources << /Font << /F1 3 0 R >> >> /Contents {pid + 1} 0 R >>\nendobj\n").encode("latin-1"))
+        add(f"{pid + 1} 0 obj\n<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream\nendobj\n")
+
+    xref = [f"xref\n0 {len(offsets) + 1}\n", "0000000000 65535 f \n"]
+    xref += [f"{offset:010d} 00000 n \n" for offset in offsets]
+    xref.append(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{size}\n%%EOF\n")
+    chunks.append("".join(xref).encode("latin-1"))
+
+    with open(path, "wb") as file:
+        file.write(b"".join(chunks))
+    return path
@@ -1,38 +1,212 @@
-from src import chunk_pdf
-from src import call_api_req
-from src import clean_req
-from src import group_req
-from src import chunk_req
-from src import call_api_trip
-from src import clean_trip
-from src import csv_to_cypher
+import argparse
+import importlib
+import inspect
+import sys
 
-def main():
+# Only the run report is imported up front; each step's module (and the libraries it needs, such as
+# PyPDF2, nltk, tiktoken and pandas) is imported when the step runs, so rerunning the last steps starts quickly
+from src import metrics
 
-    # Step 1: Divide the input PDF into LLM-manageable chunks
-    chunk_pdf.main()
+# The steps in order: name (a module in src), the main() parameter for its input and the one for its output.
+# Step 1: Divide the input PDF into LLM-manageable chunks
+# (Optional) Drop the chunks without requirement candidates before they are sent, with --prefilter
+# Step 2: Make an API call for each chunk of the PDF to identify requirements
+# Step 3: Transform the API response into readable JSON
+# (Optional) Merge near-duplicate requirements so each is only turned into triples once, with --dedup
+# Step 4: Extract the requirements only
+# Step 5: Split the requirements up for feeding back to the API
+# Step 6: Make an API call for each chunk of the requirements to transform them into RDF triples
+# Step 7: Clean RDF triples and convert to CSV
+# Step 8: Transform RDF to cypher
+STAGES = [
+    ("chunk_pdf", "pdf_directory", "output_file"),
+    ("prefilter", "input_file", "output_file"),
+    ("call_api_req", "input_file", "output_file"),
+    ("clean_req", "input_file", "output_file"),
+    ("dedup", "input_file", "output_file"),
+    ("group_req", "input_file", "output_file"),
+    ("chunk_req", "input_file", "output_folder"),
+    ("call_api_trip", "input_directory", "output_file"),
+    ("clean_trip", "input_file", "output_file"),
+    ("csv_to_cypher", "input_file_path", "output_directory"),
+]
+STAGE_NAMES = [name for name, _, _ in STAGES]
 
-    # Step 2: Make an API call for each chunk of the PDF to identify requirements
-    call_api_req.main()
+# Steps that only run when asked for, with where they write; when one is off the next step reads what the step
+# before it wrote, and when it is on the next step reads its output even if it isn't run this time
+OPTIONAL_STAGES = {"prefilter": "data/out_prefilter/spec_chunks.json", "dedup": "data/out_dedup/requirements.json"}
 
-    # Step 3: Transform the API response into readable JSON
-    clean_req.main()
+# In incremental mode only new or changed chunks are sent; the rest reuse the previous run's responses.
+# In batch mode the requests go through the Batch API, which is cheaper but can take hours.
+STAGE_OPTIONS = {
+    "chunk_pdf": ("incremental",),
+    "prefilter": ("mode",),
+    "call_api_req": ("incremental", "batch"),
+    "chunk_req": ("incremental",),
+    "call_api_trip": ("incremental", "batch"),
+}
 
-    # Step 4: Extract the requirements only
-    group_req.main()
 
-    # Step 5: Split the requirements up for feeding back to the API
-    chunk_req.main()
+def select_stages(first=None, last=None, only=None):
+    """Return the names of the steps to run: `only` those, or every step from `first` to `last`."""
+    if only:
+        return [name for name in STAGE_NAMES if name in only]
+    start = STAGE_NAMES.index(first) if first else 0
+    end = STAGE_NAMES.index(last) if last else len(STAGE_NAMES) - 1
+    return STAGE_NAMES[start:end + 1]
 
-    # Step 6: Make an API call for each chunk of the requirements to transform them into RDF triples.
-    call_api_trip.main()
 
-    # Step 7: Clean RDF triples and convert to CSV.
-    clean_trip.main()
+def main(streaming=False, incremental=False, batch=False, sse=False, corpus_mode=False,
+         first=None, last=None, only=None, inputs=None, outputs=None, in_memory=False, persist="background",
+         prefilter=None, dedup=False):
+    # Each step's time, CPU and memory, and the API stages' latency, tokens and cost, go into a run report
+    report = metrics.start_report()
+    try:
+        run_steps(report, streaming, incremental, batch, sse, corpus_mode, select_stages(first, last, only),
+                  inputs or {}, outputs or {}, in_memory, persist, prefilter, dedup)
+    finally:
+        metrics.stop_report()
+        report_path = report.save()
+        print(report.summary())
+        print(f"Run report saved to '{report_path}' and '{metrics.PROMETHEUS_PATH}'")
 
-    # Step 8: Transform RDF to cypher
-    csv_to_cypher.main()
 
+def run_steps(report, streaming, incremental, batch, sse, corpus_mode, stages=STAGE_NAMES, inputs=None, outputs=None,
+              in_memory=False, persist="background", prefilter=None, dedup=False):
+    inputs, outputs = inputs or {}, outputs or {}
+
+    if in_memory:
+        # The steps pass their results along in memory; the files in data/ are saved off the critical path
+        # (persist="background"), before the next step ("sync") or not at all ("none")
+        handoff = importlib.import_module("src.handoff")
+        handoff.run(incremental=incremental, batch=batch, persist=persist, prefilter=prefilter, dedup=dedup)
+        return
+
+    if corpus_mode:
+        # Every PDF gets its own run of steps 1 to 7, side by side, and the graphs are merged for step 8
+        corpus = importlib.import_module("src.corpus")
+        with report.stage("corpus"):
+            corpus.run()
+        return
+
+    if streaming:
+        chunk_pdf = importlib.import_module("src.chunk_pdf")
+        with report.stage("chunk_pdf"):
+            chunk_pdf.main(incremental=incremental)
+        # Steps 2 to 8 run concurrently, handing results to the next step as soon as they are ready
+        # With sse=True each requirement moves on as soon as the model has written it
+        stream_pipeline = importlib.import_module("src.stream_pipeline")
+        with report.stage("stream_pipeline"):
+            stream_pipeline.run(sse=sse)
+        return
+
+    # prefilter is "skip" or "candidates" (see src/prefilter.py), or None to send every chunk
+    flags = {"incremental": incremental, "batch": batch, "mode": prefilter}
+    enabled = {"prefilter": bool(prefilter), "dedup": dedup}
+    chained = None
+    for name, input_param, output_param in STAGES:
+        # A step reads what the step before it wrote, so moving one step's output moves the next one's input
+        input_path = inputs.get(name) or chained
+        if not enabled.get(name, True):
+            continue
+        chained = outputs.get(name) or OPTIONAL_STAGES.get(name)
+        if name not in stages:
+            continue
+        kwargs = {option: flags[option] for option in STAGE_OPTIONS.get(name, ())}
+        if input_path:
+            kwargs[input_param] = input_path
+        if outputs.get(name):
+            kwargs[output_param] = outputs[name]
+        stage = importlib.import_module(f"src.{name}")
+        with report.stage(name):
+            stage.main(**kwargs)
+
+
+def stage_paths(values, parser, flag):
+    # Turn repeated STAGE=PATH arguments into a dict, rejecting unknown steps
+    paths = {}
+    for value in values or []:
+        name, separator, path = value.partition("=")
+        if not separator or name not in STAGE_NAMES:
+            parser.error(f"{flag} takes STAGE=PATH with STAGE one of {', '.join(STAGE_NAMES)}")
+        paths[name] = path
+    return paths
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Extract requirements from PDFs and turn them into a Neo4j graph.")
+    parser.add_argument("--stream", action="store_true",
+                        help="overlap the API stages instead of running them one after another")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only send the parts of a revised document that changed")
+    parser.add_argument("--batch", action="store_true",
+                        help="send the API requests through the Batch API for unattended runs")
+    parser.add_argument("--sse", action="store_true",
+                        help="with --stream, also stream each requirements response as it is written")
+    parser.add_argument("--corpus", action="store_true",
+                        help="process each PDF on its own and record which document every triple came from")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="pass each step's result to the next in memory instead of through data/")
+    parser.add_argument("--persist", choices=("background", "sync", "none"),
+                        help="with --in-memory, save the intermediate files in a background thread (the default), "
+                             "before the next step, or not at all")
+    parser.add_argument("--prefilter", nargs="?", const="skip", choices=("skip", "candidates"),
+                        help="don't send chunks without a sentence that looks like a requirement (skip, the default), "
+                             "or send only those sentences and their neighbours (candidates)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="merge near-duplicate requirements before they are turned into triples")
+    parser.add_argument("--from", dest="first", choices=STAGE_NAMES, help="first step to run")
+    parser.add_argument("--to", dest="last", choices=STAGE_NAMES, help="last step to run")
+    parser.add_argument("--only", type=lambda value: value.split(","), metavar="STAGE[,STAGE...]",
+                        help="run only these steps")
+    parser.add_argument("--in", dest="inputs", action="append", metavar="STAGE=PATH",
+                        help="read a step's input from PATH instead of its data/ folder")
+    parser.add_argument("--out", dest="outputs", action="append", metavar="STAGE=PATH",
+                        help="write a step's output to PATH (the next step then reads it from there)")
+    parser.add_argument("--list", action="store_true", help="list the steps with their default input and output")
+    args = parser.parse_args(argv)
+
+    for name in args.only or []:
+        if name not in STAGE_NAMES:
+            parser.error(f"unknown step '{name}'; choose from {', '.join(STAGE_NAMES)}")
+    if args.only and (args.first or args.last):
+        parser.error("--only can't be combined with --from or --to")
+    if args.first and args.last and STAGE_NAMES.index(args.first) > STAGE_NAMES.index(args.last):
+        parser.error("--from must not come after --to")
+    if (args.stream or args.corpus) and (args.first or args.last or args.only or args.inputs or args.outputs):
+        parser.error("step selection and path overrides apply to the step-by-step run, not --stream or --corpus")
+    if args.in_memory and (args.stream or args.corpus or args.first or args.last or args.only or
+                           args.inputs or args.outputs):
+        parser.error("--in-memory runs every step with the default paths and can't be combined with other modes")
+    for name in OPTIONAL_STAGES:
+        if not getattr(args, name) and name in [args.first, args.last, *(args.only or [])]:
+            parser.error(f"the {name} step only runs with --{name}")
+        if getattr(args, name) and (args.stream or args.corpus):
+            parser.error(f"--{name} applies to the step-by-step and --in-memory runs, not --stream or --corpus")
+    if args.persist and not args.in_memory:
+        parser.error("--persist only applies with --in-memory")
+    if args.sse and not args.stream:
+        parser.error("--sse only applies with --stream")
+    if args.batch and (args.stream or args.corpus):
+        parser.error("--batch applies to the step-by-step and --in-memory runs, not --stream or --corpus")
+    args.inputs = stage_paths(args.inputs, parser, "--in")
+    args.outputs = stage_paths(args.outputs, parser, "--out")
+    return args
+
+
+def list_stages():
+    # The default paths are read from each step's main(), so this imports every step
+    for number, (name, input_param, output_param) in enumerate(STAGES, start=1):
+        parameters = inspect.signature(importlib.import_module(f"src.{name}").main).parameters
+        print(f"{number}. {name}: {parameters[input_param].default or '(found automatically)'} "
+              f"-> {parameters[output_param].default}" + (f" (only with --{name})" if name in OPTIONAL_STAGES else ""))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args(sys.argv[1:])
+    if args.list:
+        list_stages()
+    else:
+        main(streaming=args.stream, incremental=args.incremental, batch=args.batch, sse=args.sse,
+             corpus_mode=args.corpus, first=args.first, last=args.last, only=args.only,
+             inputs=args.inputs, outputs=args.outputs, in_memory=args.in_memory,
+             persist=args.persist or "background", prefilter=args.prefilter, dedup=args.dedup)
@@ -0,0 +1,281 @@
+# Shared client for the chat completions API used by call_api_req.py and call_api_trip.py
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from dotenv import load_dotenv
+
+from src.chunker import get_encoding
+from src.metrics import active_report
+from src.response_cache import ResponseCache
+
+DEFAULT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Defaults sized for a typical OpenAI usage tier. Override them per stage if your limits differ.
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+DEFAULT_MAX_RETRIES = 5
+
+# Status codes that are worth retrying after a pause
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def load_api_key() -> str:
+    """Load the API key (and any API_URL override) from api-key.env."""
+    load_dotenv(dotenv_path="api-key.env")
+    api_key = os.getenv("API_KEY")
+    if not api_key:
+        raise ValueError("API key is missing. Please check api-key.env")
+    return api_key
+
+
+class TokenBucket:
+    """A thread-safe token bucket that refills its capacity evenly over one minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        # Add the tokens earned since the last refill without exceeding capacity
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> None:
+        """Block until `amount` tokens are available, then take them."""
+        # A single request larger than the whole bucket can only ever wait for a full bucket
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the server reports that the limit was hit."""
+        with self.lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class RateLimiter:
+    """Governs both requests per minute and tokens per minute."""
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int) -> None:
+        """Block until one request of `tokens` tokens may be sent."""
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+def estimate_tokens(data: Dict[str, Any], encoding) -> int:
+    """Estimate how many tokens a chat completions request will count against the limit."""
+    # Every message carries a few tokens of overhead on top of its content
+    tokens = 3
+    for message in data.get("messages", []):
+        tokens += 4 + len(encoding.encode(message.get("content", ""), disallowed_special=()))
+    # The API reserves max_tokens for the completion when it is set
+    tokens += data.get("max_tokens", 0) or 0
+    return tokens
+
+
+def retry_delay(response: Optional[requests.Response], attempt: int) -> float:
+    """Return how long to wait before retrying, honoring Retry-After when it is sent."""
+    if response is not None:
+        retry_after_ms = response.headers.get("retry-after-ms")
+        retry_after = response.headers.get("Retry-After")
+        try:
+            if retry_after_ms is not None:
+                return float(retry_after_ms) / 1000.0
+            if retry_after is not None:
+                return float(retry_after)
+        except ValueError:
+            pass
+    # Otherwise back off exponentially with jitter, capped at one minute
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def read_stream(response: requests.Response,
+                on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Assemble a streamed (server-sent events) chat completion into the body a normal request returns.
+
+    `on_delta(text)` is called with each piece of the reply as it arrives.
+    """
+    # Event streams carry UTF-8 but rarely say so, and requests would otherwise assume Latin-1
+    response.encoding = "utf-8"
+    body: Dict[str, Any] = {"object": "chat.completion"}
+    parts = []
+    finish_reason = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        event = json.loads(payload)
+        for key in ("id", "created", "model", "system_fingerprint"):
+            if key in event:
+                body[key] = event[key]
+        # With stream_options.include_usage the last event carries the token counts
+        if event.get("usage"):
+            body["usage"] = event["usage"]
+        for choice in event.get("choices", []):
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                parts.append(text)
+                if on_delta:
+                    on_delta(text)
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+    else:
+        raise requests.exceptions.ConnectionError("The response stream ended before [DONE]")
+    body["choices"] = [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)},
+                        "finish_reason": finish_reason}]
+    return body
+
+
+class APIClient:
+    """Sends chat completion requests concurrently within rate limits."""
+
+    def __init__(self, api_key: str, url: Optional[str] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 timeout: float = 600,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 cache: Optional[ResponseCache] = None):
+        # The URL can be pointed at a local stand-in server through the API_URL variable
+        self.url = url or os.getenv("API_URL") or DEFAULT_URL
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._encodings: Dict[str, Any] = {}
+        self._encodings_lock = threading.Lock()
+
+    def _encoding(self, model: str):
+        # Cache encodings because loading one is slow
+        with self._encodings_lock:
+            if model not in self._encodings:
+                self._encodings[model] = get_encoding(model)
+            return self._encodings[model]
+
+    def post(self, data: Dict[str, Any], on_delta: Optional[Callable[[Optional[str]], None]] = None) -> Dict[str, Any]:
+        """Send one request, retrying throttled and failed attempts.
+
+        Returns a dict with `status` and either `response` (the parsed JSON body) or `error`.
+        Cached responses are returned without touching the API or the rate limits.
+        Requests with "stream": True are read as they arrive and `on_delta(text)` gets each piece;
+        if a stream breaks off and is retried, `on_delta(None)` says the reply is starting over.
+        While main.py keeps a run report, the request's latency, retries and token usage are recorded in it.
+        """
+        start = time.perf_counter()
+        result, attempts, waited = self._post(data, on_delta)
+        report = active_report()
+        if report is not None:
+            # Time spent waiting on the rate limiter is the client's choice, not the API's latency
+            report.record_request(data.get("model", ""), result, time.perf_counter() - start - waited, attempts)
+        return result
+
+    def _post(self, data: Dict[str, Any], on_delta: Optional[Callable[[Optional[str]], None]]):
+        # Returns the result, the number of attempts made and the seconds spent waiting on the rate limiter
+        if self.cache is not None:
+            cached = self.cache.get(data)
+            if cached is not None:
+                return {"status": 200, "response": cached, "cached": True}, 0, 0.0
+
+        tokens = estimate_tokens(data, self._encoding(data.get("model", "")))
+        streaming = bool(data.get("stream"))
+        response = None
+        error = ""
+        waited = 0.0
+        for attempt in range(self.max_retries + 1):
+            wait_start = time.perf_counter()
+            self.rate_limiter.acquire(tokens)
+            waited += time.perf_counter() - wait_start
+            response = None
+            try:
+                response = self.session.post(self.url, headers=self.headers, json=data, timeout=self.timeout,
+                                             stream=streaming)
+                if response.status_code == 200:
+                    response_data = read_stream(response, on_delta) if streaming else response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Connection problems, including a stream cut off part-way, are retried like server errors
+                if streaming and on_delta and response is not None and response.status_code == 200:
+                    on_delta(None)
+                response = None
+                error = str(e)
+            else:
+                if response.status_code == 200:
+                    if self.cache is not None:
+                        self.cache.put(data, response_data)
+                    return {"status": 200, "response": response_data}, attempt + 1, waited
+                error = response.text
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+                if response.status_code == 429:
+                    # Stop every worker from piling onto a limit the server says is exhausted
+                    self.rate_limiter.requests.drain()
+            if attempt < self.max_retries:
+                time.sleep(retry_delay(response, attempt))
+        return {"status": response.status_code if response is not None else None, "error": error}, attempt + 1, waited
+
+    def map(self, payloads: List[Dict[str, Any]],
+            on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+            on_delta: Optional[Callable[[int, Optional[str]], None]] = None) -> List[Dict[str, Any]]:
+        """Send every payload concurrently and return the results in the original order.
+
+        `on_result(index, result)` is called from a worker thread as each request finishes,
+        and `on_delta(index, text)` as each piece of a streamed reply arrives (see post()).
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+        # Callbacks run one at a time so they can print and write files without interleaving
+        callback_lock = threading.Lock()
+
+        def delta(index: int, text: Optional[str]) -> None:
+            with callback_lock:
+                on_delta(index, text)
+
+        def worker(index: int) -> None:
+            result = self.post(payloads[index], on_delta=(lambda text: delta(index, text)) if on_delta else None)
+            results[index] = result
+            if on_result:
+                with callback_lock:
+                    on_result(index, result)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            # Consume the iterator so worker exceptions are raised here
+            list(executor.map(worker, range(len(payloads))))
+        finally:
+            # On Ctrl-C let the in-flight requests finish but drop the ones still queued
+            executor.shutdown(wait=True, cancel_futures=True)
+        return results
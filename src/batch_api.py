@@ -0,0 +1,202 @@
+# Client for the OpenAI Batch API, used by call_api_req.py and call_api_trip.py for offline bulk runs.
+# Batches cost half as much as the chat completions endpoint and finish within 24 hours.
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from src.api_client import DEFAULT_URL
+from src.metrics import active_report
+from src.response_cache import ResponseCache
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+
+# The Batch API accepts at most this many requests per input file
+MAX_BATCH_REQUESTS = 50000
+
+# Seconds between status checks while a batch runs
+DEFAULT_POLL_INTERVAL = 30
+
+# Statuses after which a batch no longer changes
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def api_base(url: str) -> str:
+    """Return the API root, e.g. https://api.openai.com/v1, for a chat completions URL."""
+    url = url.rstrip("/")
+    return url[:-len("/chat/completions")] if url.endswith("/chat/completions") else url
+
+
+def batch_lines(payloads: List[Dict[str, Any]], custom_ids: List[str]) -> str:
+    """Return the Batch API input file for the payloads, one request per line."""
+    return "".join(
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": payload},
+                   ensure_ascii=False, separators=(",", ":")) + "\n"
+        for custom_id, payload in zip(custom_ids, payloads)
+    )
+
+
+class BatchClient:
+    """Submits chat completion requests as batches and collects their results.
+
+    map() has the same shape as APIClient.map(), so a stage can use either client.
+    """
+
+    def __init__(self, api_key: str, url: Optional[str] = None, work_dir: str = "data/batches",
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, timeout: float = 600,
+                 cache: Optional[ResponseCache] = None):
+        # Like APIClient, the API_URL variable can point the client at a local stand-in server
+        self.base_url = api_base(url or os.getenv("API_URL") or DEFAULT_URL)
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(method, self.base_url + path, headers=self.headers,
+                                        timeout=self.timeout, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"Batch API error {response.status_code} on {path}: {response.text}")
+        return response
+
+    def upload(self, path: str) -> str:
+        """Upload a batch input file and return its file ID."""
+        with open(path, "rb") as file:
+            response = self._request("POST", "/files", data={"purpose": "batch"},
+                                     files={"file": (os.path.basename(path), file, "application/jsonl")})
+        return response.json()["id"]
+
+    def create(self, input_file_id: str) -> Dict[str, Any]:
+        return self._request("POST", "/batches", json={"input_file_id": input_file_id, "endpoint": ENDPOINT,
+                                                       "completion_window": COMPLETION_WINDOW}).json()
+
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def download(self, file_id: str) -> List[Dict[str, Any]]:
+        """Return the records of a batch output or error file."""
+        text = self._request("GET", f"/files/{file_id}/content").text
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def wait(self, batch_id: str) -> Dict[str, Any]:
+        """Poll a batch until it reaches a final status and return it."""
+        while True:
+            batch = self.retrieve(batch_id)
+            counts = batch.get("request_counts") or {}
+            print(f"Batch {batch_id}: {batch['status']} "
+                  f"({counts.get('completed', 0)} done, {counts.get('failed', 0)} failed of {counts.get('total', '?')})")
+            if batch["status"] in FINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    def submit(self, payloads: List[Dict[str, Any]], custom_ids: List[str], name: str) -> str:
+        """Write, upload and start one batch, returning its ID.
+
+        The batch ID is saved next to the input file, so rerunning after an interruption
+        resumes waiting on the same batch instead of paying for it twice.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        lines = batch_lines(payloads, custom_ids)
+        digest = hashlib.sha256(lines.encode("utf-8")).hexdigest()
+        state_path = os.path.join(self.work_dir, f"{name}.batch.json")
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            if state.get("input_sha256") == digest:
+                try:
+                    status = self.retrieve(state["batch_id"])["status"]
+                except RuntimeError:
+                    status = None
+                # A batch that failed, expired or can no longer be found is submitted again
+                if status is not None and status not in FINAL_STATUSES - {"completed"}:
+                    print(f"Resuming batch {state['batch_id']}")
+                    return state["batch_id"]
+
+        input_path = os.path.join(self.work_dir, f"{name}.jsonl")
+        with open(input_path, "w", encoding="utf-8") as file:
+            file.write(lines)
+        batch = self.create(self.upload(input_path))
+        with open(state_path, "w", encoding="utf-8") as file:
+            json.dump({"batch_id": batch["id"], "input_sha256": digest}, file)
+        print(f"Submitted batch {batch['id']} with {len(payloads)} requests")
+        return batch["id"]
+
+    def collect(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Return each request's result by custom_id, in the shape APIClient.post() returns."""
+        results: Dict[str, Dict[str, Any]] = {}
+        for file_key in ("output_file_id", "error_file_id"):
+            if not batch.get(file_key):
+                continue
+            for record in self.download(batch[file_key]):
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[record["custom_id"]] = {"status": 200, "response": response["body"]}
+                else:
+                    error = record.get("error") or response.get("body", {}).get("error") or {}
+                    results[record["custom_id"]] = {"status": response.get("status_code"),
+                                                    "error": error.get("message", str(error))}
+        return results
+
+    def map(self, payloads: List[Dict[str, Any]],
+            on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+            custom_ids: Optional[List[str]] = None, name: str = "batch") -> List[Dict[str, Any]]:
+        """Run every payload through the Batch API and return the results in the original order.
+
+        `custom_ids` label the requests in the batch files (default: their index) and must be unique.
+        Cached responses are reused and only the rest are submitted.
+        """
+        custom_ids = [str(i) for i in range(len(payloads))] if custom_ids is None else [str(c) for c in custom_ids]
+        if len(set(custom_ids)) != len(custom_ids):
+            # The Batch API rejects the input file, and results are matched back to requests by custom_id
+            repeated = sorted({c for c in custom_ids if custom_ids.count(c) > 1})
+            raise ValueError(f"custom_ids must be unique; repeated: {', '.join(repeated[:5])}")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(payloads)
+
+        pending = []
+        for index, payload in enumerate(payloads):
+            cached = self.cache.get(payload) if self.cache is not None else None
+            if cached is not None:
+                results[index] = {"status": 200, "response": cached, "cached": True}
+            else:
+                pending.append(index)
+
+        # Large runs are split into several batches, all submitted before waiting on any
+        groups = [pending[i:i + MAX_BATCH_REQUESTS] for i in range(0, len(pending), MAX_BATCH_REQUESTS)]
+        names = [f"{name}_{number}" if len(groups) > 1 else name for number in range(len(groups))]
+        batch_ids = [self.submit([payloads[i] for i in group], [custom_ids[i] for i in group], group_name)
+                     for group, group_name in zip(groups, names)]
+
+        for group, batch_id in zip(groups, batch_ids):
+            batch = self.wait(batch_id)
+            collected = self.collect(batch)
+            for index in group:
+                result = collected.get(custom_ids[index])
+                if result is None:
+                    result = {"status": None, "error": f"No result in batch {batch_id} ({batch['status']})"}
+                elif result["status"] == 200 and self.cache is not None:
+                    self.cache.put(payloads[index], result["response"])
+                results[index] = result
+
+        report = active_report()
+        if report is not None:
+            # Batches report no per-request latency; their tokens are priced at the batch discount
+            for payload, result in zip(payloads, results):
+                report.record_request(payload.get("model", ""), result, batch=True)
+
+        if on_result:
+            for index, result in enumerate(results):
+                on_result(index, result)
+
+        # Forget finished batches so the next run submits fresh ones
+        for group_name in names:
+            state_path = os.path.join(self.work_dir, f"{group_name}.batch.json")
+            if os.path.exists(state_path):
+                os.remove(state_path)
+        return results
@@ -1,76 +1,323 @@
-import requests
 import json
-from dotenv import load_dotenv
 import os
 import glob
+from src.api_client import APIClient, load_api_key, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from src.batch_api import BatchClient
+from src.response_cache import ResponseCache
+from src.jsonl import JSONLWriter, checkpoint_status, jsonl_path, read_jsonl
+from src.incremental import compact_jsonl
+from src.chunker import get_encoding
+from src.clean_req import APIResponseCleaner, JSONExtractor
 
-def main():
-    # Load the API key
-    load_dotenv(dotenv_path="api-key.env")
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        raise ValueError("API key is missing. Please check api-key.env")
+# The model used to find requirements in each chunk
+MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT_PATH = "data/prompts/system_prompt.txt"
+
+# Structured output: the model must answer with requirement objects in the shape system_prompt.txt describes.
+# A chunk without requirements comes back as an empty list instead of a null object.
+REQUIREMENTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "requirements": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk_id": {"type": "string"},
+                    "text": {"type": "string"},
+                    "probability": {"type": "number"},
+                    "justification": {"type": "string"}
+                },
+                "required": ["chunk_id", "text", "probability", "justification"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["requirements"],
+    "additionalProperties": False
+}
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "requirements", "strict": True, "schema": REQUIREMENTS_SCHEMA}
+}
+
+# Structured output for a packed request: one entry per passage with that passage's requirements, so a passage
+# without requirements comes back with an empty list instead of looking like one the model left out
+PACKED_REQUIREMENTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "passages": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk_id": {"type": "string"},
+                    "requirements": REQUIREMENTS_SCHEMA["properties"]["requirements"]
+                },
+                "required": ["chunk_id", "requirements"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["passages"],
+    "additionalProperties": False
+}
+PACKED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "packed_requirements", "strict": True, "schema": PACKED_REQUIREMENTS_SCHEMA}
+}
+
+# In packing mode, consecutive chunks share one request until their text reaches this many tokens
+PACK_TOKENS = 4000
 
+# Added to a packed request so the model labels every object with the chunk it came from
+PACK_INSTRUCTIONS = ("There are {count} passages below, each starting with its Chunk ID. Analyze each passage "
+                     "separately and give every JSON object the chunk_id of the passage it came from, including "
+                     "the null object for a passage without requirements.")
+# The same for a structured packed request, which answers in the shape of PACKED_REQUIREMENTS_SCHEMA
+STRUCTURED_PACK_INSTRUCTIONS = ("There are {count} passages below, each starting with its Chunk ID. Analyze each "
+                                "passage separately and answer with one entry for every passage: its chunk_id and "
+                                "the requirements found in it, or an empty list for a passage without requirements.")
+
+def load_system_prompt():
     # Load the system prompt which stays the same for each API call
-    with open("data/prompts/system_prompt.txt", "r", encoding="utf-8") as file:
-        system_prompt = file.read().strip()
+    with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as file:
+        return file.read().strip()
 
-    # Find the input file in data/out_chunk_pdf
-    input_files = glob.glob("data/out_chunk_pdf/*.json")
-    if not input_files:
-        raise FileNotFoundError("No input file found in data/out_chunk_pdf")
-    input_file_path = input_files[0]
+def build_payload(chunk, system_prompt, structured=True, stream=False):
+    # Structure the API call for one chunk and designate the model used
+    payload = {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Chunk ID: {chunk['chunk_id']} {chunk['chunk']}"}
+        ]
+    }
+    return with_options(payload, structured, stream)
 
-    # Load the individual prompts which differ for each API call
-    with open(input_file_path, "r", encoding="utf-8") as file:
-        doc_chunks = json.load(file)
+def with_options(payload, structured=True, stream=False):
+    # structured=True holds the answer to REQUIREMENTS_SCHEMA, so it parses without any cleanup;
+    # stream=True sends the answer as it is written, with the token usage at the end
+    if structured:
+        payload["response_format"] = RESPONSE_FORMAT
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
 
-    # Set the URL and headers for the API
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
+def build_packed_payload(chunks, system_prompt, structured=True):
+    # Structure one API call for several chunks, each introduced by its chunk ID as in build_payload
+    passages = "\n\n".join(f"Chunk ID: {chunk['chunk_id']} {chunk['chunk']}" for chunk in chunks)
+    instructions = STRUCTURED_PACK_INSTRUCTIONS if structured else PACK_INSTRUCTIONS
+    payload = {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": instructions.format(count=len(chunks)) + "\n\n" + passages}
+        ]
     }
+    if structured:
+        payload["response_format"] = PACKED_RESPONSE_FORMAT
+    return payload
 
-    # Make a list to store API responses
-    responses = []
-
-    # Call the API for each chunk that the PDF has been divided into
-    for chunk in doc_chunks:
-        # Structure the API call and designate the model used
-        data = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Chunk ID: {chunk['chunk_id']} {chunk['chunk']}"}
-            ]
-        }
+def pack_chunks(doc_chunks, pack_tokens):
+    # Group consecutive chunks (by position) so the text of each group fits in pack_tokens tokens
+    encoding = get_encoding(MODEL)
+    sizes = [len(tokens) for tokens in encoding.encode_ordinary_batch([chunk["chunk"] for chunk in doc_chunks])]
+    packs = []
+    current = []
+    current_tokens = 0
+    for index, size in enumerate(sizes):
+        if current and current_tokens + size > pack_tokens:
+            packs.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += size
+    if current:
+        packs.append(current)
+    return packs
 
-        # Make the API call
-        response = requests.post(url, headers=headers, json=data)
+def unpack_response(response, chunk_ids, pack_number=0):
+    # Split a packed response into one response per chunk, using the chunk_id of each returned passage
+    # (structured output) or object. Chunks the answer doesn't mention are left out so they can be re-sent
+    # on their own.
+    content = response["choices"][0]["message"]["content"]
+    by_chunk = {str(chunk_id): [] for chunk_id in chunk_ids}
+    answered = set()
+    passages = [passage for value in JSONExtractor.iter_json(content)
+                if isinstance(value, dict) and isinstance(value.get("passages"), list)
+                for passage in value["passages"]]
+    if passages:
+        # A passage listed with an empty list had no requirements, which is an answer too
+        for passage in passages:
+            if isinstance(passage, dict) and str(passage.get("chunk_id")) in by_chunk:
+                by_chunk[str(passage["chunk_id"])].extend(passage.get("requirements") or [])
+                answered.add(str(passage["chunk_id"]))
+    else:
+        for obj in APIResponseCleaner("", "").extract_objects(content, pack_number):
+            if isinstance(obj, dict) and str(obj.get("chunk_id")) in by_chunk:
+                by_chunk[str(obj["chunk_id"])].append(obj)
+                answered.add(str(obj["chunk_id"]))
 
-        # Check if the response was successful
-        if response.status_code == 200:
-            response_data = response.json()
-            # Add the response to the list of responses
-            responses.append({"chunk_id": chunk["chunk_id"], "response": response_data})
+    unpacked = {}
+    for chunk_id in chunk_ids:
+        if str(chunk_id) not in answered:
+            continue
+        chunk_response = dict(response)
+        chunk_response["choices"] = [{**response["choices"][0], "message": {
+            "role": "assistant", "content": json.dumps(by_chunk[str(chunk_id)], ensure_ascii=False)}}]
+        # The pack's token usage is counted once, on its first chunk
+        if unpacked:
+            chunk_response.pop("usage", None)
+        unpacked[chunk_id] = chunk_response
+    return unpacked
+
+def run(doc_chunks, max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, use_cache=True, refresh_cache=False,
+        resume=False, retry_failed=False, compress=False, incremental=False, batch=False,
+        pack=False, pack_tokens=PACK_TOKENS, structured=True,
+        output_file="data/out_call_api_req/api_response.jsonl"):
+    # Send the chunks to the API and return the response records, one per chunk in document order.
+    # The records still go to output_file as they arrive; resume and incremental runs read them from there.
+    # Load the API key
+    api_key = load_api_key()
+
+    # Load the system prompt which stays the same for each API call
+    system_prompt = load_system_prompt()
+
+    # Each response is appended to a compact JSON Lines file as soon as it arrives, so an
+    # interrupted run keeps everything it has already paid for
+    output_directory = os.path.dirname(output_file) or "."
+    output_file_path = jsonl_path(output_file, compress)
+
+    # Every current ID, in document order, for tidying up the output file in incremental mode
+    all_ids = [chunk["chunk_id"] for chunk in doc_chunks]
+
+    # resume=True skips every chunk already in the output file; retry_failed=True only re-sends the failed ones
+    done, failed = checkpoint_status(output_file_path, "chunk_id")
+    if retry_failed:
+        doc_chunks = [chunk for chunk in doc_chunks if chunk["chunk_id"] in failed]
+    elif resume:
+        attempted = done | failed
+        doc_chunks = [chunk for chunk in doc_chunks if chunk["chunk_id"] not in attempted]
+    elif incremental:
+        # IDs come from content, so only new or changed chunks lack a response from an earlier run
+        doc_chunks = [chunk for chunk in doc_chunks if chunk["chunk_id"] not in done]
+    append = resume or retry_failed or incremental
+    print(f"Sending {len(doc_chunks)} chunks to the API")
+
+    # Responses are cached by model, prompt and chunk so unchanged chunks cost nothing on a rerun.
+    # use_cache=False bypasses the cache entirely; refresh_cache=True re-sends everything and overwrites it.
+    cache = ResponseCache(refresh=refresh_cache) if use_cache else None
+
+    if batch:
+        # Submit every request as one Batch API job and wait for it, for runs that don't need quick answers
+        client = BatchClient(api_key, work_dir=output_directory, cache=cache)
+    else:
+        # Set up the client that sends requests concurrently within the rate limits
+        client = APIClient(api_key, max_workers=max_workers, requests_per_minute=requests_per_minute,
+                           tokens_per_minute=tokens_per_minute, cache=cache)
+
+    # pack=True sends several chunks per request, so the long system prompt is paid for once per pack.
+    # Packs hold positions in doc_chunks; without packing every chunk is a pack of its own.
+    packs = pack_chunks(doc_chunks, pack_tokens) if pack else [[index] for index in range(len(doc_chunks))]
+    if pack:
+        print(f"Packed {len(doc_chunks)} chunks into {len(packs)} requests")
+    missing = []
+    succeeded = 0
+    # The record written for each chunk, by position in doc_chunks
+    records = {}
+
+    # Record each result and give user feedback as its API call completes
+    def report(pack_number, result):
+        nonlocal succeeded
+        pack = packs[pack_number]
+        if result["status"] != 200:
+            for index in pack:
+                chunk = doc_chunks[index]
+                # Failed chunks are recorded too so they can be re-sent with retry_failed=True
+                records[index] = {"chunk_id": chunk["chunk_id"], "status": result["status"], "error": result["error"]}
+                writer.write(records[index], index)
+                print(f"Error with Chunk ID {chunk['chunk_id']}: {result['status']}, {result['error']}")
+            return
+        if len(pack) == 1:
+            responses = {doc_chunks[pack[0]]["chunk_id"]: result["response"]}
         else:
-            print(f"Error with Chunk ID {chunk['chunk_id']}: {response.status_code}, {response.text}")
+            responses = unpack_response(result["response"], [doc_chunks[index]["chunk_id"] for index in pack], pack_number)
+        for index in pack:
+            chunk = doc_chunks[index]
+            if chunk["chunk_id"] in responses:
+                records[index] = {"chunk_id": chunk["chunk_id"], "response": responses[chunk["chunk_id"]]}
+                writer.write(records[index], index)
+                print(f"Chunk ID {chunk['chunk_id']} sent to API")
+                succeeded += 1
+            else:
+                missing.append(index)
+
+    def send(payloads):
+        if batch:
+            # Packs are labelled by their number and the range of chunks they hold; the number keeps the labels
+            # unique (the Batch API rejects repeats) even when two chunks have the same ID
+            custom_ids = [f"{number}_{doc_chunks[pack[0]]['chunk_id']}" if len(pack) == 1 else
+                          f"{number}_chunks_{doc_chunks[pack[0]]['chunk_id']}_{doc_chunks[pack[-1]]['chunk_id']}"
+                          for number, pack in enumerate(packs)]
+            return client.map(payloads, on_result=report, custom_ids=custom_ids)
+        return client.map(payloads, on_result=report)
 
-        # User feedback for each chunk sent to the API
-        print(f"Chunk ID {chunk['chunk_id']} sent to API")
+    # Call the API for each pack, writing the responses in the original chunk order
+    with JSONLWriter(output_file_path, append=append) as writer:
+        results = send([build_payload(doc_chunks[pack[0]], system_prompt, structured) if len(pack) == 1 else
+                        build_packed_payload([doc_chunks[index] for index in pack], system_prompt, structured)
+                        for pack in packs])
 
-    # Ensure the output directory exists
-    output_directory = "data/out_call_api_req"
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+        if missing:
+            # Chunks whose IDs didn't come back from a packed request are re-sent one at a time
+            print(f"Chunk IDs missing from packed responses, re-sending individually: "
+                  f"{', '.join(str(doc_chunks[index]['chunk_id']) for index in sorted(missing))}")
+            packs = [[index] for index in sorted(missing)]
+            missing = []
+            results += send([build_payload(doc_chunks[pack[0]], system_prompt, structured) for pack in packs])
 
-    # Save all API responses to a JSON file for clean up
-    output_file_path = os.path.join(output_directory, "api_response.json")
-    with open(output_file_path, "w", encoding="utf-8") as output_file:
-        json.dump(responses, output_file, indent=4, ensure_ascii=False)
+    print(f"{succeeded} of {len(doc_chunks)} chunks succeeded in {len(results)} requests")
 
+    if incremental:
+        # Merge the new responses with the ones kept from earlier runs, in document order,
+        # dropping the responses of chunks that are no longer in the document
+        dropped = compact_jsonl(output_file_path, "chunk_id", all_ids)
+        print(f"Dropped {dropped} old or superseded responses")
     print(f"API responses saved to '{output_file_path}'")
+    if cache is not None:
+        cache.report("Requirements")
+        cache.close()
+
+    if append:
+        # Only some chunks were sent; the output file has the responses of the others from earlier runs
+        return list(read_jsonl(output_file_path))
+    return [records[index] for index in sorted(records)]
+
+def main(max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+         tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, use_cache=True, refresh_cache=False,
+         resume=False, retry_failed=False, compress=False, incremental=False, batch=False,
+         pack=False, pack_tokens=PACK_TOKENS, structured=True, input_file=None,
+         output_file="data/out_call_api_req/api_response.jsonl"):
+    # Unless an input file is given, find it in data/out_chunk_pdf
+    # (the manifest that chunk_pdf keeps next to the chunks is not an input)
+    if input_file is None:
+        input_files = [f for f in glob.glob("data/out_chunk_pdf/*.json") if os.path.basename(f) != "manifest.json"]
+        if not input_files:
+            raise FileNotFoundError("No input file found in data/out_chunk_pdf")
+        input_file = input_files[0]
+    input_file_path = input_file
+
+    # Load the individual prompts which differ for each API call
+    with open(input_file_path, "r", encoding="utf-8") as file:
+        doc_chunks = json.load(file)
+
+    run(doc_chunks, max_workers=max_workers, requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute, use_cache=use_cache, refresh_cache=refresh_cache, resume=resume,
+        retry_failed=retry_failed, compress=compress, incremental=incremental, batch=batch, pack=pack,
+        pack_tokens=pack_tokens, structured=structured, output_file=output_file)
 
 # Ensure main() only runs when this script is executed directly
 if __name__ == "__main__":
@@ -1,22 +1,126 @@
-import requests
-import json
-from dotenv import load_dotenv
 import os
+from src.api_client import APIClient, load_api_key, DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from src.batch_api import BatchClient
+from src.response_cache import ResponseCache
+from src.jsonl import JSONLWriter, checkpoint_status, jsonl_path, read_jsonl
+from src.incremental import compact_jsonl
 
+# The model used to turn requirements into triples
+MODEL = "gpt-4o"
+AXIOM_PROMPT_PATH = "data/prompts/triples_prompt.txt"
 
-def main():
+
+def load_axiom_prompt():
+    # Load the axiom prompt which stays the same for each API call
+    with open(AXIOM_PROMPT_PATH, "r", encoding="utf-8") as file:
+        return file.read().strip()
+
+
+def build_payload(content, axiom_prompt):
+    # Structure the API call for one chunk of requirements and designate the model used
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": axiom_prompt},
+            {"role": "user", "content": content}
+        ]
+    }
+
+
+def run(doc_chunks, max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, use_cache=True, refresh_cache=False,
+        resume=False, retry_failed=False, compress=False, incremental=False, batch=False,
+        output_file="data/out_call_api_trip/api_response.jsonl"):
+    # Send the chunks of requirements to the API and return a response record for each, in order
     # Load the API key
-    load_dotenv(dotenv_path="api-key.env")
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        raise ValueError("API key is missing. Please check api-key.env")
+    api_key = load_api_key()
 
     # Load the axiom prompt which stays the same for each API call
-    with open("data/prompts/triples_prompt.txt", "r", encoding="utf-8") as file:
-        axiom_prompt = file.read().strip()
+    axiom_prompt = load_axiom_prompt()
+
+    # Each response is appended to a compact JSON Lines file as soon as it arrives, so an
+    # interrupted run keeps everything it has already paid for
+    output_directory = os.path.dirname(output_file) or "."
+    output_file_path = jsonl_path(output_file, compress)
+
+    # Every current ID, in document order, for tidying up the output file in incremental mode
+    all_ids = [chunk["filename"] for chunk in doc_chunks]
+
+    # resume=True skips every file already in the output file; retry_failed=True only re-sends the failed ones
+    done, failed = checkpoint_status(output_file_path, "filename")
+    if retry_failed:
+        doc_chunks = [chunk for chunk in doc_chunks if chunk["filename"] in failed]
+    elif resume:
+        attempted = done | failed
+        doc_chunks = [chunk for chunk in doc_chunks if chunk["filename"] not in attempted]
+    elif incremental:
+        # IDs come from content, so only new or changed files lack a response from an earlier run
+        doc_chunks = [chunk for chunk in doc_chunks if chunk["filename"] not in done]
+    append = resume or retry_failed or incremental
+    print(f"Sending {len(doc_chunks)} files to the API")
+
+    # Responses are cached by model, prompt and chunk so unchanged chunks cost nothing on a rerun.
+    # use_cache=False bypasses the cache entirely; refresh_cache=True re-sends everything and overwrites it.
+    cache = ResponseCache(refresh=refresh_cache) if use_cache else None
+
+    if batch:
+        # Submit every request as one Batch API job and wait for it, for runs that don't need quick answers
+        client = BatchClient(api_key, work_dir=output_directory, cache=cache)
+    else:
+        # Set up the client that sends requests concurrently within the rate limits
+        client = APIClient(api_key, max_workers=max_workers, requests_per_minute=requests_per_minute,
+                           tokens_per_minute=tokens_per_minute, cache=cache)
+
+    # Structure the API call for each chunk
+    payloads = [build_payload(chunk["content"], axiom_prompt) for chunk in doc_chunks]
+
+    # The record written for each chunk, by position in doc_chunks
+    records = {}
+
+    # Record each result and give user feedback as its API call completes
+    def report(index, result):
+        chunk = doc_chunks[index]
+        if result["status"] == 200:
+            records[index] = {"filename": chunk["filename"], "response": result["response"]}
+            writer.write(records[index], index)
+            print(f"File '{chunk['filename']}' sent to API")
+        else:
+            # Failed files are recorded too so they can be re-sent with retry_failed=True
+            records[index] = {"filename": chunk["filename"], "status": result["status"], "error": result["error"]}
+            writer.write(records[index], index)
+            print(f"Error with File '{chunk['filename']}': {result['status']}, {result['error']}")
+
+    # Call the API for each file, writing the responses in the original order
+    with JSONLWriter(output_file_path, append=append) as writer:
+        if batch:
+            results = client.map(payloads, on_result=report, custom_ids=[chunk["filename"] for chunk in doc_chunks])
+        else:
+            results = client.map(payloads, on_result=report)
+
+    succeeded = sum(1 for result in results if result["status"] == 200)
+    print(f"{succeeded} of {len(results)} requests succeeded")
+
+    if incremental:
+        # Merge the new responses with the ones kept from earlier runs, in document order,
+        # dropping the responses of files that are no longer in the document
+        dropped = compact_jsonl(output_file_path, "filename", all_ids)
+        print(f"Dropped {dropped} old or superseded responses")
+    print(f"API responses saved to '{output_file_path}'")
+    if cache is not None:
+        cache.report("Triples")
+        cache.close()
 
+    if append:
+        # Only some files were sent; the output file has the responses of the others from earlier runs
+        return list(read_jsonl(output_file_path))
+    return [records[index] for index in sorted(records)]
+
+
+def main(max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+         tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, use_cache=True, refresh_cache=False,
+         resume=False, retry_failed=False, compress=False, incremental=False, batch=False,
+         input_directory="data/out_chunk_req/", output_file="data/out_call_api_trip/api_response.jsonl"):
     # Load the individual prompts from text files in the specified directory
-    input_directory = "data/out_chunk_req/"
     doc_chunks = []
 
     # Iterate through all text files in the directory
@@ -27,51 +131,9 @@ def main():
                 chunk_content = file.read().strip()
                 doc_chunks.append({"filename": filename, "content": chunk_content})
 
-    # Set the URL and headers for the API
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-
-    # Make a list to store API responses
-    responses = []
-
-    # Call the API for each chunk (file) in the directory
-    for chunk in doc_chunks:
-        # Structure the API call and designate the model used
-        data = {
-            "model": "gpt-4o",
-            "messages": [
-                {"role": "system", "content": axiom_prompt},
-                {"role": "user", "content": chunk["content"]}
-            ]
-        }
-
-        # Make the API call
-        response = requests.post(url, headers=headers, json=data)
-
-        # Check if the response was successful
-        if response.status_code == 200:
-            response_data = response.json()
-            # Add the response to the list of responses
-            responses.append({"filename": chunk["filename"], "response": response_data})
-        else:
-            print(f"Error with File '{chunk['filename']}': {response.status_code}, {response.text}")
-
-        # User feedback for each chunk sent to the API
-        print(f"File '{chunk['filename']}' sent to API")
-
-    # Ensure the output directory exists
-    output_directory = "data/out_call_api_trip/"
-    os.makedirs(output_directory, exist_ok=True)
-
-    # Save all API responses to a JSON file for clean up
-    output_file_path = os.path.join(output_directory, "api_response.json")
-    with open(output_file_path, "w", encoding="utf-8") as output_file:
-        json.dump(responses, output_file, indent=4, ensure_ascii=False)
-
-    print(f"API responses saved to '{output_file_path}'")
+    run(doc_chunks, max_workers=max_workers, requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute, use_cache=use_cache, refresh_cache=refresh_cache, resume=resume,
+        retry_failed=retry_failed, compress=compress, incremental=incremental, batch=batch, output_file=output_file)
 
 
 # Ensure main() only runs when this script is executed directly
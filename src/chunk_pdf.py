@@ -1,8 +1,12 @@
-import PyPDF2
 import nltk
 import json
 import re
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.pdf_backends import get_backend
+from src.incremental import ChunkIds, content_id, load_manifest, save_manifest, report_changes
+from src.chunker import pack_sentences, get_encoding, context_budget
 
 # Download necessary NLTK data
 def download_nltk_resources():
@@ -12,19 +16,69 @@ def download_nltk_resources():
     except LookupError:
         nltk.download('punkt')
 
+# Pages handed to each worker process at a time
+PAGES_PER_TASK = 50
+# Page ranges iter_pages keeps submitted per worker, so a worker that finishes can start the next right away
+TASKS_PER_WORKER = 2
+
+# The model call_api_req sends the chunks to, which decides how tokens are counted
+MODEL = "gpt-4o-mini"
+# Tokens of document text per chunk (about 500 words); smaller chunks get more careful answers from the model
+MAX_TOKENS = 650
+# Tokens of trailing sentences repeated at the start of the next chunk, so requirements split across chunks are seen whole
+OVERLAP_TOKENS = 0
+
+# Which extraction backend to use: "auto" picks the fastest one installed (see src/pdf_backends.py)
+PDF_BACKEND = "auto"
+
+# Extract the text of pages [start, end) from a PDF file, opening it in this process
+def extract_page_range(pdf_path, start, end, backend_name=PDF_BACKEND):
+    return get_backend(backend_name).extract_pages(pdf_path, start, end)
+
 # Extract text from a PDF file
-def extract_text_from_pdf(pdf_path):
-    # Open the PDF file in binary read mode
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        text = ''
-        # Iterate through each page in the PDF and extract text
-        for page_num, page in enumerate(reader.pages, start=1):
-            page_text = page.extract_text()
-            if page_text:
-                # Append the page number and the extracted text
-                text += f'Page {page_num}:' + page_text + '\n'
-    return text
+def extract_text_from_pdf(pdf_path, workers=None, backend=PDF_BACKEND):
+    extractor = get_backend(backend)
+    workers = workers or os.cpu_count() or 1
+    page_count = extractor.page_count(pdf_path)
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+
+    if workers == 1 or len(ranges) <= 1:
+        # Small documents (or single-CPU machines) aren't worth starting worker processes for
+        page_texts = extractor.extract_pages(pdf_path, 0, page_count)
+    else:
+        # Each worker opens the PDF itself and extracts one range of pages; results come back in page order
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+            results = executor.map(extract_page_range, [pdf_path] * len(ranges),
+                                   [start for start, _ in ranges], [end for _, end in ranges],
+                                   [extractor.name] * len(ranges))
+            page_texts = [text for texts in results for text in texts]
+
+    # Join the page number and the extracted text of every page in one pass
+    return ''.join(f'Page {page_num}:' + page_text + '\n'
+                   for page_num, page_text in enumerate(page_texts, start=1) if page_text)
+
+# Yield the text of each page in order, holding only a few page ranges in memory at a time
+def iter_pages(pdf_path, workers=None, backend=PDF_BACKEND):
+    extractor = get_backend(backend)
+    workers = workers or os.cpu_count() or 1
+    page_count = extractor.page_count(pdf_path)
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+
+    if workers == 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from extractor.extract_pages(pdf_path, start, end)
+        return
+
+    # Submitted ranges in page order; a new one is submitted each time the oldest is yielded, so a slow range
+    # doesn't hold up the others and at most TASKS_PER_WORKER ranges per worker wait in memory
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        pending = deque()
+        for start, end in ranges:
+            if len(pending) == TASKS_PER_WORKER * workers:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(extract_page_range, pdf_path, start, end, extractor.name))
+        while pending:
+            yield from pending.popleft().result()
 
 # Clean the extracted text
 def clean_text(text):
@@ -32,37 +86,57 @@ def clean_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-# Split the text into chunks based on sentence count and word limit
-def item_text_by_sentence(text, item_word_limit=500):
+# Tokens per chunk: MAX_TOKENS, but never more than fits in the model's context next to the system prompt
+def chunk_token_budget():
+    with open('data/prompts/system_prompt.txt', 'r', encoding='utf-8') as file:
+        prompt_tokens = len(get_encoding(MODEL).encode_ordinary(file.read()))
+    return min(MAX_TOKENS, context_budget(MODEL, prompt_tokens))
+
+# Split the text into chunks of whole sentences within the token budget
+def item_text_by_sentence(text, max_tokens=None):
     # Split the text into individual sentences using NLTK's tokenizer
     sentences = nltk.tokenize.sent_tokenize(text)
-    items = []
-    current_item = []
-    current_word_count = 0
-
-    # Iterate over each sentence and group them into chunks based on the word limit
-    for sentence in sentences:
-        word_count = len(sentence.split())
-        if current_word_count + word_count <= item_word_limit:
-            # Add the sentence to the current chunk
-            current_item.append(sentence)
-            current_word_count += word_count
-        else:
-            # If the word limit is exceeded, finalize the current chunk and start a new one
-            items.append(' '.join(current_item).strip())
-            current_item = [sentence]
-            current_word_count = word_count
-
-    # Append the last chunk if it contains text
-    if current_item:
-        items.append(' '.join(current_item).strip())
-
-    return items
+    items = pack_sentences(((sentence, []) for sentence in sentences), max_tokens or chunk_token_budget(),
+                           get_encoding(MODEL), OVERLAP_TOKENS)
+    return [item for item, _ in items]
+
+# Yield (sentence, pages) pairs from a stream of (page, text) pairs, normalizing whitespace page by page.
+# The last sentence of each page may continue on the next one, so it is carried over until then.
+def iter_sentences(pages):
+    carry = ''
+    carry_pages = []
+    for page, page_text in pages:
+        page_text = clean_text(page_text)
+        if not page_text:
+            continue
+        text = f'{carry} {page_text}' if carry else page_text
+        sentences = nltk.tokenize.sent_tokenize(text)
+        if not sentences:
+            continue
+        # Only the first sentence can include the text carried over from earlier pages
+        first_pages = carry_pages + [page] if carry else [page]
+        for i, sentence in enumerate(sentences[:-1]):
+            yield sentence, first_pages if i == 0 else [page]
+        carry = sentences[-1]
+        carry_pages = first_pages if len(sentences) == 1 else [page]
+    if carry:
+        yield carry, carry_pages
+
+# Yield a ("file.pdf#N", marked page text) pair for every page of every PDF in a directory, one page at a time
+def iter_directory_pages(pdf_directory, workers=None, backend=PDF_BACKEND):
+    for filename in os.listdir(pdf_directory):
+        if filename.lower().endswith('.pdf'):
+            pdf_path = os.path.join(pdf_directory, filename)
+            for page_num, page_text in enumerate(iter_pages(pdf_path, workers, backend), start=1):
+                if page_text:
+                    yield f'{filename}#{page_num}', f'Page {page_num}:' + page_text
 
 # Save the text chunks to a single JSON file
 def save_items_to_single_json(items, output_file):
     # Create a list of dictionaries containing chunk IDs and their respective text
-    items_list = [{"chunk_id": i+1, "chunk": item} for i, item in enumerate(items)]
+    # Chunk IDs come from the chunk's content so they stay the same when the document is revised
+    chunk_id = ChunkIds()
+    items_list = [{"chunk_id": chunk_id(item), "chunk": item} for item in items]
     try:
         # Write all items to a single JSON file
         with open(output_file, 'w', encoding='utf-8') as file:
@@ -71,20 +145,89 @@ def save_items_to_single_json(items, output_file):
         # Handle file write errors
         print(f"Error saving to {output_file}: {e}")
 
-def main():
-    # Directory containing the PDF files to be processed
-    pdf_directory = 'data/in_chunk_pdf'
-    # Output file to save the processed chunks
-    output_file = 'data/out_chunk_pdf/spec_chunks.json'
+# Write (item, pages) pairs to a JSON file as they are produced, returning a map of chunk ID to source pages
+def save_items_streaming(items, output_file):
+    chunk_pages = {}
+    chunk_ids = ChunkIds()
+    with open(output_file, 'w', encoding='utf-8') as file:
+        file.write('[\n')
+        for item, pages in items:
+            if chunk_pages:
+                file.write(',\n')
+            # Chunk IDs come from the chunk's content so they stay the same when the document is revised
+            chunk_id = chunk_ids(item)
+            chunk_pages[chunk_id] = pages
+            file.write('    ' + json.dumps({"chunk_id": chunk_id, "chunk": item}, ensure_ascii=False))
+        file.write('\n]\n')
+    return chunk_pages
+
+# Yield (item, pages) chunks of every PDF in a directory, extracting, cleaning and splitting page by page.
+# Every page is fingerprinted into page_hashes on the way through so the next run can tell what changed.
+def iter_chunks(pdf_directory, page_hashes, incremental=False):
+    def fingerprint(pages):
+        for page, text in pages:
+            page_hashes[page] = content_id(text)
+            yield page, text
+
+    pages = fingerprint(iter_directory_pages(pdf_directory))
+    return pack_sentences(iter_sentences(pages), chunk_token_budget(), get_encoding(MODEL),
+                          OVERLAP_TOKENS, stable=incremental)
+
+# Record which pages each chunk came from next to the chunks and report what changed
+def update_manifest(page_hashes, chunk_pages):
+    manifest = {"pages": page_hashes, "chunks": chunk_pages}
+    report_changes(load_manifest(), manifest)
+    save_manifest(manifest)
+
+# Divide the PDFs into chunks in memory and return them, for main.py to hand straight to call_api_req
+def run(incremental=False, pdf_directory='data/in_chunk_pdf'):
+    download_nltk_resources()
+    page_hashes = {}
+    chunk_pages = {}
+    chunk_ids = ChunkIds()
+    chunks = []
+    for item, pages in iter_chunks(pdf_directory, page_hashes, incremental):
+        chunk_id = chunk_ids(item)
+        chunk_pages[chunk_id] = pages
+        chunks.append({"chunk_id": chunk_id, "chunk": item})
+    if not chunks:
+        print("No text could be extracted from any PDF in the directory.")
+        return chunks
+    update_manifest(page_hashes, chunk_pages)
+    print(f'PDFs have been divided into {len(chunks)} items.')
+    return chunks
+
+# Save chunks returned by run() in the same layout main() writes
+def save(chunks, output_file='data/out_chunk_pdf/spec_chunks.json'):
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as file:
+        file.write('[\n' + ',\n'.join('    ' + json.dumps(chunk, ensure_ascii=False) for chunk in chunks)
+                   + ('\n' if chunks else '') + ']\n')
+
+# pdf_directory holds the PDF files to be processed and output_file receives the chunks
+def main(streaming=True, incremental=False, pdf_directory='data/in_chunk_pdf',
+         output_file='data/out_chunk_pdf/spec_chunks.json'):
     # Create the output directory if it doesn't exist
     output_dir = os.path.dirname(output_file)
-    if not os.path.exists(output_dir):
+    if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # Download necessary resources for sentence tokenization
     download_nltk_resources()
-    
-    all_text = ''
+
+    if streaming:
+        # Save chunk by chunk so memory stays flat however large the documents are
+        page_hashes = {}
+        chunk_pages = save_items_streaming(iter_chunks(pdf_directory, page_hashes, incremental), output_file)
+        if not chunk_pages:
+            print("No text could be extracted from any PDF in the directory.")
+            return
+
+        update_manifest(page_hashes, chunk_pages)
+        print(f'PDFs have been divided into {len(chunk_pages)} items and saved to "{output_file}".')
+        return
+
+    texts = []
     # Iterate over all PDF files in the specified directory
     for filename in os.listdir(pdf_directory):
         if filename.lower().endswith('.pdf'):
@@ -92,7 +235,8 @@ def main():
             # Extract text from the current PDF file
             text = extract_text_from_pdf(pdf_path)
             if text.strip():
-                all_text += text + '\n'
+                texts.append(text + '\n')
+    all_text = ''.join(texts)
 
     # If no text could be extracted from any PDF, print an error message and exit
     if not all_text.strip():
@@ -101,7 +245,7 @@ def main():
 
     # Clean the extracted text to remove unnecessary whitespace
     cleaned_text = clean_text(all_text)
-    # Split the cleaned text into chunks based on sentence count and word limit
+    # Split the cleaned text into chunks of whole sentences within the token budget
     items = item_text_by_sentence(cleaned_text)
     
     # Save the chunks to a single JSON file
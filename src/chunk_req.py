@@ -1,40 +1,58 @@
 import os
-import re
-import tiktoken
+import glob
+from src.chunker import split_sentences, pack_sentences, get_encoding, context_budget
+from src.incremental import ChunkIds
 
-# Function to split text into chunks of 3000 tokens without cutting mid-sentence
-def split_text_into_chunks(text, max_tokens, tokenizer):
-    # Split text into sentences using punctuation marks (., ?, !) as delimiters
-    sentences = re.split(r'(\.|\?|!)', text)
-    chunks = []  # List to store the chunks of text
-    current_chunk = ""  # Variable to store the current chunk being built
-    current_tokens = 0  # Counter for the number of tokens in the current chunk
+# The model call_api_trip sends the chunks to, which decides how tokens are counted
+MODEL = "gpt-4o"
+# Tokens of requirements per chunk; smaller chunks get more careful answers from the model
+MAX_TOKENS = 2000
+# Tokens of trailing requirements repeated at the start of the next chunk for context
+OVERLAP_TOKENS = 0
 
-    # Iterate over the sentences in pairs (sentence and its punctuation)
-    for i in range(0, len(sentences) - 1, 2):
-        sentence = sentences[i] + sentences[i + 1]  # Reconstruct sentence with punctuation
-        sentence_tokens = len(tokenizer.encode(sentence))  # Get the number of tokens in the sentence
+# Function to split text into chunks of max_tokens tokens without cutting mid-sentence
+def split_text_into_chunks(text, max_tokens, tokenizer, stable=False, overlap=0):
+    sentences = ((sentence, []) for sentence in split_sentences([text]))
+    # Sentences keep their own leading whitespace, so they are joined as they are
+    return [chunk for chunk, _ in pack_sentences(sentences, max_tokens, tokenizer, overlap, stable, joiner="")]
 
-        # Check if adding the current sentence would exceed the maximum token limit
-        if current_tokens + sentence_tokens > max_tokens:
-            # If it exceeds, save the current chunk and start a new one
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence
-            current_tokens = sentence_tokens
-        else:
-            # Otherwise, add the sentence to the current chunk
-            current_chunk += sentence
-            current_tokens += sentence_tokens
+# Split the requirements text into chunks for call_api_trip, each a {"filename", "content"} dict
+def run(text, incremental=False):
+    # Initialize the tokenizer of the model the chunks are sent to
+    tokenizer = get_encoding(MODEL)
 
-    # Add the last chunk if there is any remaining text
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    # Split text into chunks of MAX_TOKENS tokens or less, never more than fits next to the prompt
+    with open('data/prompts/triples_prompt.txt', 'r', encoding='utf-8') as file:
+        prompt_tokens = len(tokenizer.encode_ordinary(file.read()))
+    max_tokens = min(MAX_TOKENS, context_budget(MODEL, prompt_tokens))
+    chunks = split_text_into_chunks(text, max_tokens, tokenizer, stable=incremental, overlap=OVERLAP_TOKENS)
 
-    return chunks
+    named = []
+    chunk_ids = ChunkIds()
+    for idx, chunk in enumerate(chunks, start=1):
+        if incremental:
+            # Name the file after its content so an unchanged chunk keeps its name (and its triples) across runs;
+            # two chunks with the same text still get files of their own
+            idx = chunk_ids(chunk)
+        named.append({"filename": f'requirements_{idx}.txt', "content": chunk})
+    return named
+
+# Save each chunk to a separate file in the output folder
+def save(chunks, output_folder='data/out_chunk_req'):
+    os.makedirs(output_folder, exist_ok=True)  # Create the output directory if it doesn't exist
+
+    # Remove the chunks of the previous run so none of them are sent to the API again
+    for old_file in glob.glob(f'{output_folder}/requirements_*.txt'):
+        os.remove(old_file)
+
+    for idx, chunk in enumerate(chunks, start=1):
+        output_file = f'{output_folder}/{chunk["filename"]}'
+        with open(output_file, 'w', encoding='utf-8') as file:
+            file.write(chunk["content"])  # Write the chunk to the output file
+        print(f"Saved chunk {idx} to {output_file}")
 
-def main():
+def main(incremental=False, input_file='data/out_group_req/requirements_all.txt', output_folder='data/out_chunk_req'):
     # Load the text from requirements.txt
-    input_file = 'data/out_group_req/requirements_all.txt'
     try:
         with open(input_file, 'r', encoding='utf-8') as file:
             text = file.read()  # Read the entire content of the input file
@@ -42,23 +60,7 @@ def main():
         print(f"Error: The file {input_file} does not exist.")
         return
 
-    # Initialize tokenizer (using tiktoken, compatible with OpenAI models)
-    tokenizer = tiktoken.get_encoding("cl100k_base")
-
-    # Split text into chunks of 3000 tokens or less
-    max_tokens = 2000
-    chunks = split_text_into_chunks(text, max_tokens, tokenizer)
-
-    # Save each chunk to a separate file in the output folder
-    output_folder = 'data/out_chunk_req'
-    os.makedirs(output_folder, exist_ok=True)  # Create the output directory if it doesn't exist
-
-    # Iterate over each chunk and save it to a separate file
-    for idx, chunk in enumerate(chunks, start=1):
-        output_file = f'{output_folder}/requirements_{idx}.txt'
-        with open(output_file, 'w', encoding='utf-8') as file:
-            file.write(chunk)  # Write the chunk to the output file
-        print(f"Saved chunk {idx} to {output_file}")
+    save(run(text, incremental), output_folder)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,138 @@
+# Token-aware chunking shared by chunk_pdf.py and chunk_req.py
+
+import os
+import re
+from typing import Any, Iterable, Iterator, List, Tuple
+
+import tiktoken
+
+from src.incremental import is_cut_point
+
+# Context window of each model, in tokens
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Room left in the context window for the model's answer
+OUTPUT_RESERVE_TOKENS = 4096
+
+# Sentences tokenized together in one call, spread over every CPU. A batch is only encoded once it is full,
+# so a live source (such as the streaming pipeline's queue) is encoded one sentence at a time instead
+ENCODE_BATCH_SIZE = 1024
+
+
+def get_encoding(model: str):
+    """Return the tiktoken encoding for a model, falling back to cl100k_base."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def context_budget(model: str, prompt_tokens: int = 0, output_tokens: int = OUTPUT_RESERVE_TOKENS) -> int:
+    """Return how many tokens of input fit in a model's context next to the prompt and the answer."""
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS) - prompt_tokens - output_tokens
+
+
+def split_sentences(texts: Iterable[str]) -> Iterator[str]:
+    """Split a stream of texts into sentences ending in ., ? or !
+
+    The texts are treated as one newline-joined document, so a sentence may span two of them.
+    Text after the last punctuation mark is kept as a final sentence.
+    """
+    pending = None  # Text after the last punctuation mark, waiting for the rest of its sentence
+    for text in texts:
+        pending = text if pending is None else pending + "\n" + text
+        parts = re.split(r'(\.|\?|!)', pending)
+        # Iterate over the parts in pairs (sentence and its punctuation)
+        for i in range(0, len(parts) - 1, 2):
+            yield parts[i] + parts[i + 1]
+        pending = parts[-1]
+    if pending and pending.strip():
+        yield pending
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def tokenize(sentences: Iterable[Tuple[str, List[Any]]], encoding,
+             batch_size: int = ENCODE_BATCH_SIZE) -> Iterator[Tuple[str, List[Any], List[int]]]:
+    """Attach the token IDs to each (sentence, pages) pair, encoding a batch of sentences per call."""
+    for batch in _batches(sentences, batch_size):
+        token_lists = encoding.encode_ordinary_batch([text for text, _ in batch], num_threads=os.cpu_count() or 1)
+        for (text, pages), tokens in zip(batch, token_lists):
+            yield text, pages, tokens
+
+
+def pack_sentences(sentences: Iterable[Tuple[str, List[Any]]], max_tokens: int, encoding,
+                   overlap: int = 0, stable: bool = False, joiner: str = " ",
+                   batch_size: int = ENCODE_BATCH_SIZE) -> Iterator[Tuple[str, List[Any]]]:
+    """Group (sentence, pages) pairs into chunks of at most max_tokens tokens.
+
+    Yields each chunk's text and the pages it came from as soon as the chunk is full.
+    overlap repeats up to that many tokens of trailing sentences at the start of the next chunk.
+    With stable=True chunks also end at content-chosen sentences, so an edit only moves nearby boundaries.
+    batch_size sentences are read ahead and tokenized together; pass 1 when the sentences arrive over time.
+    """
+    current: List[Tuple[str, List[Any], int]] = []
+    current_tokens = 0
+    fresh = 0  # Sentences in the current chunk that were not carried over from the previous one
+
+    def emit():
+        pages = []
+        for _, sentence_pages, _ in current:
+            pages.extend(page for page in sentence_pages if page not in pages)
+        return joiner.join(text for text, _, _ in current).strip(), pages
+
+    def carry_over():
+        # Keep the trailing sentences that fit in the overlap window
+        kept = []
+        kept_tokens = 0
+        for sentence in reversed(current):
+            if kept_tokens + sentence[2] > overlap:
+                break
+            kept.insert(0, sentence)
+            kept_tokens += sentence[2]
+        return kept, kept_tokens
+
+    for text, pages, tokens in tokenize(sentences, encoding, batch_size):
+        # A sentence longer than a whole chunk is cut into chunk-sized pieces
+        if len(tokens) > max_tokens:
+            pieces = [(encoding.decode(tokens[i:i + max_tokens]), min(max_tokens, len(tokens) - i))
+                      for i in range(0, len(tokens), max_tokens)]
+        else:
+            pieces = [(text, len(tokens))]
+
+        for piece, piece_tokens in pieces:
+            if fresh and current_tokens + piece_tokens > max_tokens:
+                yield emit()
+                current, current_tokens = carry_over()
+                fresh = 0
+            # Make room for the new sentence by dropping overlap from the front
+            while current and current_tokens + piece_tokens > max_tokens:
+                current_tokens -= current.pop(0)[2]
+            current.append((piece, pages, piece_tokens))
+            current_tokens += piece_tokens
+            fresh += 1
+
+        if stable and current_tokens >= max_tokens // 4 and is_cut_point(text):
+            yield emit()
+            current, current_tokens = carry_over()
+            fresh = 0
+
+    # Emit the last chunk unless it only holds overlap from the one before
+    if fresh:
+        yield emit()
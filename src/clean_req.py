@@ -3,26 +3,66 @@
 import json
 import re
 import os
-from typing import List, Optional, Dict, Union, Any
+import textwrap
+from typing import Iterable, List, Optional, Dict, Tuple, Union, Any, Iterator
+from src.jsonl import read_jsonl, find_jsonl
 
 class JSONExtractor:
     """A class to handle extraction of JSON content from various formats."""
-    
-    @staticmethod
-    def extract_from_code_blocks(content: str) -> List[str]:
-        """Extract JSON content from markdown code blocks."""
-        # This method searches for JSON content within markdown code blocks using a regular expression.
-        code_block_pattern = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL | re.IGNORECASE)
-        return [match.strip() for match in code_block_pattern.findall(content)]
-    
-    @staticmethod
-    def extract_raw_json(content: str) -> Optional[str]:
-        """Extract JSON content that's not in code blocks."""
-        # This method searches for JSON content that is not wrapped in code blocks.
-        json_pattern = re.compile(r'(\{.*?\}|\[.*?\])', re.DOTALL)
-        match = json_pattern.search(content)
-        return match.group(1).strip() if match else None
-    
+
+    decoder = json.JSONDecoder()
+    # Where a JSON object or array may start
+    start_pattern = re.compile(r'[\[{]')
+    # Strings (skipped whole, so brackets inside them don't count) and brackets
+    bracket_pattern = re.compile(r'"(?:\\.|[^"\\])*"|[\[\]{}]')
+
+    @classmethod
+    def iter_json(cls, content: str) -> Iterator[Union[Dict, List]]:
+        """Yield every top-level JSON object or array in the content, reading it once from left to right."""
+        # Where each bracket matched so far closes (None if never), so no stretch is matched twice
+        closings: Dict[int, Optional[int]] = {}
+        pos = 0
+        while True:
+            match = cls.start_pattern.search(content, pos)
+            if not match:
+                return
+            start = match.start()
+            if start in closings and closings[start] is None:
+                # Never closed, so no complete value starts here; brackets inside it are tried next
+                pos = start + 1
+                continue
+            try:
+                # Decode the value starting here, nested objects and all
+                value, end = cls.decoder.raw_decode(content, start)
+            except json.JSONDecodeError:
+                # Try again without trailing commas; if that fails too, look for JSON inside this bracket instead
+                if start not in closings:
+                    closings.update(cls.find_closings(content, start))
+                end = closings[start]
+                value = cls.parse_json(cls.clean_json_string(content[start:end])) if end else None
+                if value is None:
+                    pos = start + 1
+                    continue
+            yield value
+            pos = end
+
+    @classmethod
+    def find_closings(cls, content: str, start: int) -> Dict[int, Optional[int]]:
+        """Match brackets from `start` until the one there closes, returning the index just past where each
+        opening bracket met on the way closes, or None for those never closed."""
+        closings: Dict[int, Optional[int]] = {}
+        # Opening brackets not closed yet
+        stack = []
+        for match in cls.bracket_pattern.finditer(content, start):
+            if match.group() in '[{':
+                stack.append(match.start())
+            elif match.group() in ']}' and stack:
+                closings[stack.pop()] = match.end()
+                if not stack:
+                    return closings
+        closings.update(dict.fromkeys(stack))
+        return closings
+
     @staticmethod
     def clean_json_string(json_str: str) -> str:
         """Clean JSON string by removing trailing commas and extra whitespace."""
@@ -40,6 +80,59 @@ class JSONExtractor:
         except json.JSONDecodeError:
             return None
 
+def is_wrapper(value: Any) -> bool:
+    """Return True for the {"requirements": [...]} object that structured output answers with."""
+    return isinstance(value, dict) and list(value) == ['requirements'] and isinstance(value['requirements'], list)
+
+class StreamingJSONParser:
+    """Parses requirement objects out of a response while it is still arriving.
+
+    feed() returns each object as soon as its closing brace comes in. Objects are the items of a
+    top-level array or of a structured {"requirements": [...]} answer, or bare top-level objects.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything fed so far, e.g. when a broken-off response starts over."""
+        self.buffer = ''
+        self.pos = 0
+        # Open brackets and where they start in the buffer
+        self.stack: List[Tuple[str, int]] = []
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> List[Dict]:
+        self.buffer += text
+        objects = []
+        for i in range(self.pos, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.stack:
+                # Quotes only start strings inside JSON, not in the prose around it
+                self.in_string = True
+            elif char in '[{':
+                self.stack.append((char, i))
+            elif char in ']}' and self.stack:
+                opening, start = self.stack.pop()
+                if char == '}' and opening == '{' and [kind for kind, _ in self.stack] in ([], ['['], ['{', '[']):
+                    parsed = JSONExtractor.parse_json(JSONExtractor.clean_json_string(self.buffer[start:i + 1]))
+                    if isinstance(parsed, dict) and not is_wrapper(parsed):
+                        objects.append(parsed)
+        self.pos = len(self.buffer)
+        # Between top-level values nothing earlier is needed again
+        if not self.stack:
+            self.buffer = ''
+            self.pos = 0
+        return objects
+
 class APIResponseCleaner:
     """A class to clean and process API responses."""
     
@@ -48,8 +141,16 @@ class APIResponseCleaner:
         self.input_file = input_file
         self.output_file = output_file
         self.json_extractor = JSONExtractor()
-        self.collected_objects: List[Dict] = []
         
+    def iter_input_file(self) -> Iterator[Dict]:
+        """Yield the entries of the input file one at a time."""
+        # The API stages write JSON Lines (optionally gzipped), which is read one line at a time.
+        if self.input_file.endswith(('.jsonl', '.gz')):
+            yield from read_jsonl(self.input_file)
+            return
+        # Otherwise fall back to loading the whole file as JSON.
+        yield from self.load_input_file()
+
     def load_input_file(self) -> List[Dict]:
         """Load and parse the input file."""
         # This method attempts to load the input file as JSON.
@@ -65,79 +166,102 @@ class APIResponseCleaner:
             print(f"Error loading input file: {e}")
             return []
 
-    def process_content(self, content: str, entry_idx: int) -> None:
-        """Process content to extract JSON objects."""
-        # Attempt to extract JSON content from code blocks first.
-        json_blocks = self.json_extractor.extract_from_code_blocks(content)
-        
-        if not json_blocks:
-            # If no code blocks are found, attempt to extract raw JSON.
-            raw_json = self.json_extractor.extract_raw_json(content)
-            if raw_json:
-                json_blocks = [raw_json]
+    def iter_objects(self, content: str, entry_idx: int) -> Iterator[Dict]:
+        """Yield the JSON objects in one response's content as they are found."""
+        # A refusal comes back with "content": null
+        if not isinstance(content, str):
+            print(f"[Entry {entry_idx}] The response has no content. Skipping this entry.")
+            return
+        found = False
+        for parsed_json in self.json_extractor.iter_json(content):
+            found = True
+            # Structured output wraps the objects in {"requirements": [...]}.
+            if is_wrapper(parsed_json):
+                yield from parsed_json['requirements']
+            # Handle both single JSON objects and arrays of objects.
+            elif isinstance(parsed_json, dict):
+                yield parsed_json
             else:
-                print(f"[Entry {entry_idx}] JSON content not found. Skipping this entry.")
-                return
+                yield from parsed_json
+        if not found:
+            print(f"[Entry {entry_idx}] JSON content not found. Skipping this entry.")
 
-        # Process each JSON block that was extracted.
-        for json_str in json_blocks:
-            cleaned_json = self.json_extractor.clean_json_string(json_str)
-            
-            try:
-                parsed_json = self.json_extractor.parse_json(cleaned_json)
-                if parsed_json is None:
-                    continue
-                
-                # Handle both single JSON objects and arrays of objects.
-                if isinstance(parsed_json, dict):
-                    self.collected_objects.append(parsed_json)
-                elif isinstance(parsed_json, list):
-                    self.collected_objects.extend(parsed_json)
-                    
-            except json.JSONDecodeError as e:
-                print(f"[Entry {entry_idx}] Error decoding JSON content: {e}")
-                print(f"[Entry {entry_idx}] JSON content that caused the error:\n{cleaned_json}\n")
-
-    def process_responses(self) -> None:
-        """Process all API responses."""
-        # Load the list of responses from the input file.
-        data_list = self.load_input_file()
-        
-        # Iterate through each entry in the data list and process it.
-        for idx, data_dict in enumerate(data_list, start=1):
+    def extract_objects(self, content: str, entry_idx: int) -> List[Dict]:
+        """Extract the JSON objects from one response's content."""
+        return list(self.iter_objects(content, entry_idx))
+
+    def process_responses(self) -> Iterator[Dict]:
+        """Yield the JSON objects of all API responses, one response at a time."""
+        # Stream the responses from the input file and process each entry as it is read.
+        yield from self.process_records(self.iter_input_file())
+
+    def process_records(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield the JSON objects of the given API response records, e.g. those call_api_req.run() returns."""
+        for idx, data_dict in enumerate(records, start=1):
+            # Requests that failed are recorded without a response; they are re-sent, not cleaned.
+            if 'response' not in data_dict and 'error' in data_dict:
+                print(f"[Entry {idx}] Skipping failed request for chunk {data_dict.get('chunk_id')}")
+                continue
             try:
                 # Extract the content from the response dictionary.
                 content = data_dict['response']['choices'][0]['message']['content']
-                self.process_content(content, idx)
             except (KeyError, IndexError, TypeError) as e:
                 # Handle cases where expected keys are missing.
                 print(f"[Entry {idx}] Skipping due to missing keys: {e}")
                 continue
+            yield from self.iter_objects(content, idx)
+
+    def save_output(self, objects: Iterable[Dict]) -> None:
+        """Save processed JSON objects to output file as they are produced."""
+        with JSONArrayWriter(self.output_file) as writer:
+            for obj in objects:
+                writer.write(obj)
+
+        print(f"Collected {writer.count} JSON objects and wrote them to '{self.output_file}'.")
+
+class JSONArrayWriter:
+    """Writes a JSON array one element at a time, laid out like json.dump(..., indent=4)."""
 
-    def save_output(self) -> None:
-        """Save processed JSON objects to output file."""
+    def __init__(self, output_file: str):
         # Ensure the output directory exists.
-        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
-        
-        # Write the collected JSON objects to the output file.
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(self.collected_objects, f, indent=4, ensure_ascii=False)
-        
-        print(f"Collected {len(self.collected_objects)} JSON objects and wrote them to '{self.output_file}'.")
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        self.file = open(output_file, 'w', encoding='utf-8')
+        self.count = 0
+
+    def write(self, obj: Any) -> None:
+        element = textwrap.indent(json.dumps(obj, indent=4, ensure_ascii=False), '    ')
+        self.file.write(('[\n' if self.count == 0 else ',\n') + element)
+        self.count += 1
+
+    def close(self) -> None:
+        self.file.write('\n]' if self.count else '[]')
+        self.file.close()
+
+    def __enter__(self) -> "JSONArrayWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def run(records: Iterable[Dict]) -> List[Dict]:
+    """Return the requirement objects found in call_api_req's response records."""
+    return list(APIResponseCleaner('', '').process_records(records))
+
+def save(objects: Iterable[Dict], output_file: str = 'data/out_clean_req/requirements.json') -> None:
+    """Save requirement objects where main() would write them."""
+    APIResponseCleaner('', output_file).save_output(objects)
+
+def main(input_file='data/out_call_api_req/api_response.jsonl', output_file='data/out_clean_req/requirements.json'):
+    # Read whichever of the plain and compressed response files was written last.
+    input_file = find_jsonl(input_file)
 
-def main():
-    # Define the input and output file paths.
-    input_file = 'data/out_call_api_req/api_response.json'
-    output_file = 'data/out_clean_req/requirements.json'
-    
     # Check if the input file exists, otherwise raise an error.
     if not os.path.exists(input_file):
         raise FileNotFoundError(f"The file '{input_file}' does not exist.")
     
     # Create an instance of APIResponseCleaner and run the processing steps.
     cleaner = APIResponseCleaner(input_file, output_file)
-    cleaner.process_responses()
-    cleaner.save_output()
+    cleaner.save_output(cleaner.process_responses())
 
 if __name__ == "__main__":
     main()
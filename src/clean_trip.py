@@ -1,40 +1,61 @@
-import json
 import csv
 import os
+from src.jsonl import read_jsonl, find_jsonl
+from src.triple_store import TripleStore, STORE_DIR
 
-def main():
-    input_path = 'data/out_call_api_trip/api_response.json'
-    # Load the JSON file
-    if not os.path.exists(input_path):
-        print(f"Error: Input file not found at {input_path}")
-        return
-    
-    with open(input_path, 'r') as file:
-        data = json.load(file)
-
-    # Extract triples from "content"
+def parse_triples(response_content):
+    # Split the content by periods and commas
     triples = []
-    for item in data:
-        response_content = item.get("response", {}).get("choices", [])[0].get("message", {}).get("content", "")
+    for triple in response_content.split("."):
+        parts = [x.strip() for x in triple.split(",") if x.strip()]
+        if len(parts) == 3:
+            triples.append(parts)
+    return triples
+
+# Extract the triples from call_api_trip's response records into a store, returning it and the number parsed.
+# The store keeps each distinct triple once, with every entity and predicate interned to an integer ID.
+def run(records):
+    store = TripleStore()
+    parsed = 0
+    for item in records:
+        # Failed requests are recorded without a response
+        choices = item.get("response", {}).get("choices", [])
+        if not choices:
+            continue
+        response_content = choices[0].get("message", {}).get("content", "")
         if response_content:
-            # Split the content by periods and commas
-            triples_content = response_content.split(".")
-            for triple in triples_content:
-                parts = [x.strip() for x in triple.split(",") if x.strip()]
-                if len(parts) == 3:
-                    triples.append(parts)
+            for triple in parse_triples(response_content):
+                store.add(*triple)
+                parsed += 1
+    return store, parsed
 
+# Write the triples to a CSV file, with the store's dictionaries and ID columns next to it
+def save(store, output_file='data/out_clean_trip/triples.csv'):
     # Ensure the output directory exists
-    output_dir = 'data/out_clean_trip'
+    output_dir = os.path.dirname(output_file) or '.'
     os.makedirs(output_dir, exist_ok=True)
 
-    # Write the triples to a CSV file
-    with open(f'{output_dir}/triples.csv', 'w', newline='') as csvfile:
+    with open(output_file, 'w', newline='') as csvfile:
         csvwriter = csv.writer(csvfile)
         csvwriter.writerow(['Subject', 'Predicate', 'Object'])
-        csvwriter.writerows(triples)
+        csvwriter.writerows(store)
+
+    # Exporters that work on integer IDs read the store
+    store.save(os.path.join(output_dir, os.path.basename(STORE_DIR)))
+
+def main(input_file='data/out_call_api_trip/api_response.jsonl', output_file='data/out_clean_trip/triples.csv'):
+    input_path = find_jsonl(input_file)
+    # Check that the API responses exist
+    if not os.path.exists(input_path):
+        print(f"Error: Input file not found at {input_path}")
+        return
+
+    # Extract triples from "content", reading the responses one line at a time
+    store, parsed = run(read_jsonl(input_path))
+    save(store, output_file)
 
-    print("CSV file created successfully.")
+    print(f"CSV file created successfully: {len(store)} unique triples of {parsed} parsed, "
+          f"{len(store.entities)} entities, {len(store.predicates)} predicates.")
 
 if __name__ == "__main__":
     main()
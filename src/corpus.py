@@ -0,0 +1,241 @@
+# Corpus mode for main.py: every PDF in data/in_chunk_pdf goes through a pipeline of its own.
+# Documents are extracted and chunked in parallel worker processes. As each one is ready its API stages start
+# in a thread, sharing one rate limiter per model with the other documents, and the per-document graphs are
+# merged at the end. Every chunk, requirement and triple records the document and pages it came from.
+
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from src import call_api_req, call_api_trip, chunk_pdf, chunk_req, csv_to_cypher
+from src.api_client import (APIClient, RateLimiter, load_api_key, DEFAULT_MAX_WORKERS,
+                            DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+from src.chunker import pack_sentences, get_encoding
+from src.clean_req import APIResponseCleaner
+from src.clean_trip import parse_triples
+from src.group_req import extract_texts
+from src.incremental import ChunkIds
+from src.jsonl import JSONLWriter
+from src.response_cache import ResponseCache
+from src.triple_store import TripleStore, STORE_DIR
+
+PDF_DIRECTORY = "data/in_chunk_pdf"
+# Each document's intermediate files go in a folder of its own here
+CORPUS_DIR = "data/corpus"
+
+# Documents whose API stages run at the same time; the shared rate limiters keep them within the account's limits
+DOCUMENT_WORKERS = 4
+
+PROVENANCE_HEADER = ['Subject', 'Predicate', 'Object', 'Document', 'Pages']
+
+
+def document_dir(filename):
+    # Folder for one document's files, named after the PDF
+    return os.path.join(CORPUS_DIR, os.path.splitext(filename)[0])
+
+
+def format_pages(pages):
+    return ";".join(str(page) for page in sorted(pages))
+
+
+def add_with_sources(store, rows, sources, triple, triple_sources):
+    # Add a triple to the store and record where it came from; `rows` maps each stored triple's IDs to its row
+    store.add(*triple)
+    key = (store.entities.get(triple[0]), store.predicates.get(triple[1]), store.entities.get(triple[2]))
+    if key not in rows:
+        rows[key] = len(sources)
+        sources.append(set())
+    sources[rows[key]].update(triple_sources)
+
+
+def chunk_document(pdf_path):
+    """Extract and chunk one PDF into its corpus folder and return the number of chunks. Runs in a worker process."""
+    document = os.path.basename(pdf_path)
+    # The worker pool already spreads the documents over the CPUs, so each PDF is read by one process
+    pages = ((page_num, f'Page {page_num}:' + page_text)
+             for page_num, page_text in enumerate(chunk_pdf.iter_pages(pdf_path, workers=1), start=1) if page_text)
+    items = pack_sentences(chunk_pdf.iter_sentences(pages), chunk_pdf.chunk_token_budget(),
+                           get_encoding(chunk_pdf.MODEL), chunk_pdf.OVERLAP_TOKENS)
+    chunk_id = ChunkIds()
+    chunks = [{"chunk_id": chunk_id(item), "chunk": item, "document": document, "pages": item_pages}
+              for item, item_pages in items]
+    output_dir = document_dir(document)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "spec_chunks.json"), "w", encoding="utf-8") as file:
+        json.dump(chunks, file, ensure_ascii=False, indent=4)
+    return len(chunks)
+
+
+def run_document(document, req_client, trip_client, system_prompt, axiom_prompt):
+    """Send one document's chunks through the requirement and triple stages.
+
+    Writes the document's responses, requirements and triples to its corpus folder and returns
+    its tagged requirements and its unique triples with the pages each was extracted from.
+    """
+    output_dir = document_dir(document)
+    with open(os.path.join(output_dir, "spec_chunks.json"), "r", encoding="utf-8") as file:
+        doc_chunks = json.load(file)
+
+    # Steps 2 and 3: find the requirements in each chunk and tag them with the chunk's document and pages
+    with JSONLWriter(os.path.join(output_dir, "req_responses.jsonl")) as writer:
+        def report_requirements(index, result):
+            chunk = doc_chunks[index]
+            if result["status"] == 200:
+                writer.write({"chunk_id": chunk["chunk_id"], "response": result["response"]}, index)
+            else:
+                writer.write({"chunk_id": chunk["chunk_id"], "status": result["status"], "error": result["error"]}, index)
+                print(f"[{document}] Error with Chunk ID {chunk['chunk_id']}: {result['status']}, {result['error']}")
+
+        results = req_client.map([call_api_req.build_payload(chunk, system_prompt) for chunk in doc_chunks],
+                                 on_result=report_requirements)
+
+    cleaner = APIResponseCleaner("", "")
+    requirements = []
+    for index, (chunk, result) in enumerate(zip(doc_chunks, results)):
+        if result["status"] != 200:
+            continue
+        try:
+            content = result["response"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            print(f"[{document}] Skipping Chunk ID {chunk['chunk_id']} due to missing keys: {e}")
+            continue
+        # A refusal has no content; one chunk without an answer shouldn't stop the whole corpus
+        if not isinstance(content, str):
+            print(f"[{document}] Skipping Chunk ID {chunk['chunk_id']}: the response has no content")
+            continue
+        for obj in cleaner.extract_objects(content, index + 1):
+            if isinstance(obj, dict):
+                requirements.append({**obj, "document": document, "pages": chunk["pages"]})
+    with open(os.path.join(output_dir, "requirements.json"), "w", encoding="utf-8") as file:
+        json.dump(requirements, file, ensure_ascii=False, indent=4)
+
+    # Steps 4 and 5: pack whole requirements into batches, each remembering the pages of its requirements
+    tokenizer = get_encoding(chunk_req.MODEL)
+    # The null object of a chunk without requirements has no text
+    texts = ((obj["text"].strip(), obj["pages"]) for obj in requirements if isinstance(obj.get("text"), str))
+    batches = list(pack_sentences(texts, chunk_req.MAX_TOKENS, tokenizer, chunk_req.OVERLAP_TOKENS, joiner="\n"))
+
+    # Steps 6 and 7: extract the triples of each batch, keeping each distinct triple once with every page it came from
+    store = TripleStore()
+    triple_pages = []
+    with JSONLWriter(os.path.join(output_dir, "trip_responses.jsonl")) as writer:
+        def report_triples(index, result):
+            filename = f"requirements_{index + 1}.txt"
+            if result["status"] == 200:
+                writer.write({"filename": filename, "response": result["response"]}, index)
+            else:
+                writer.write({"filename": filename, "status": result["status"], "error": result["error"]}, index)
+                print(f"[{document}] Error with batch {index + 1}: {result['status']}, {result['error']}")
+
+        results = trip_client.map([call_api_trip.build_payload(batch, axiom_prompt) for batch, _ in batches],
+                                  on_result=report_triples)
+
+    rows = {}
+    for (_, pages), result in zip(batches, results):
+        if result["status"] != 200:
+            continue
+        choices = result["response"].get("choices", [])
+        if not choices or not choices[0].get("message", {}).get("content"):
+            continue
+        for triple in parse_triples(choices[0]["message"]["content"]):
+            add_with_sources(store, rows, triple_pages, triple, pages)
+
+    triples = [(*store.triple(index), pages) for index, pages in enumerate(triple_pages)]
+    with open(os.path.join(output_dir, "triples.csv"), "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(PROVENANCE_HEADER)
+        writer.writerows([subject, predicate, obj, document, format_pages(pages)]
+                         for subject, predicate, obj, pages in triples)
+    print(f"[{document}] {len(doc_chunks)} chunks, {len(requirements)} requirements, {len(triples)} triples")
+    return requirements, triples
+
+
+def merge(documents):
+    """Merge the per-document triples into the corpus graph and write it where csv_to_cypher reads it.
+
+    `documents` maps each document to what run_document returned for it.
+    """
+    # The corpus's requirements, each tagged with its document and pages, for rerunning later steps on their own
+    for directory in ('data/out_clean_req', 'data/out_group_req'):
+        os.makedirs(directory, exist_ok=True)
+    requirements = [obj for document in sorted(documents) for obj in documents[document][0]]
+    with open('data/out_clean_req/requirements.json', 'w', encoding='utf-8') as file:
+        json.dump(requirements, file, ensure_ascii=False, indent=4)
+    with open('data/out_group_req/requirements_all.txt', 'w', encoding='utf-8') as file:
+        file.write('\n'.join(extract_texts(requirements)))
+
+    store = TripleStore()
+    rows = {}
+    sources = []
+    for document in sorted(documents):
+        for subject, predicate, obj, pages in documents[document][1]:
+            add_with_sources(store, rows, sources, (subject, predicate, obj), [(document, page) for page in pages])
+
+    output_dir = 'data/out_clean_trip'
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'triples.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Subject', 'Predicate', 'Object'])
+        writer.writerows(store)
+    store.save(STORE_DIR)
+
+    # One row per triple and document it appears in
+    with open(os.path.join(output_dir, 'provenance.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(PROVENANCE_HEADER)
+        for index, triple_sources in enumerate(sources):
+            by_document = {}
+            for document, page in triple_sources:
+                by_document.setdefault(document, set()).add(page)
+            for document in sorted(by_document):
+                writer.writerow([*store.triple(index), document, format_pages(by_document[document])])
+    shared = sum(1 for triple_sources in sources if len({document for document, _ in triple_sources}) > 1)
+    print(f"Merged {len(documents)} documents: {len(requirements)} requirements and {len(store)} unique triples, "
+          f"{shared} of them found in more than one document")
+
+
+def run(max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, document_workers=DOCUMENT_WORKERS, use_cache=True):
+    """Run the whole pipeline once per PDF in data/in_chunk_pdf and merge the results into one graph."""
+    filenames = sorted(f for f in os.listdir(PDF_DIRECTORY) if f.lower().endswith('.pdf'))
+    if not filenames:
+        print(f"No PDF files found in {PDF_DIRECTORY}")
+        return
+
+    api_key = load_api_key()
+    system_prompt = call_api_req.load_system_prompt()
+    axiom_prompt = call_api_trip.load_axiom_prompt()
+    chunk_pdf.download_nltk_resources()
+
+    # One limiter per model, shared by every document, so running documents side by side never exceeds the limits
+    req_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    trip_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    cache = ResponseCache() if use_cache else None
+
+    def pipeline(document):
+        req_client = APIClient(api_key, max_workers=max_workers, rate_limiter=req_limiter, cache=cache)
+        trip_client = APIClient(api_key, max_workers=max_workers, rate_limiter=trip_limiter, cache=cache)
+        return run_document(document, req_client, trip_client, system_prompt, axiom_prompt)
+
+    documents = {}
+    with ProcessPoolExecutor(max_workers=min(len(filenames), os.cpu_count() or 1)) as processes, \
+            ThreadPoolExecutor(max_workers=document_workers) as threads:
+        # Step 1 runs in the worker processes; each document's API stages start as soon as its chunks are saved
+        chunking = {processes.submit(chunk_document, os.path.join(PDF_DIRECTORY, filename)): filename
+                    for filename in filenames}
+        running = {}
+        for future in as_completed(chunking):
+            filename = chunking[future]
+            print(f"[{filename}] Divided into {future.result()} chunks")
+            running[threads.submit(pipeline, filename)] = filename
+        for future in as_completed(running):
+            documents[running[future]] = future.result()
+
+    if cache is not None:
+        cache.report("Corpus")
+        cache.close()
+
+    # Step 8: one Cypher script for the merged graph
+    merge(documents)
+    csv_to_cypher.main()
@@ -1,3 +1,4 @@
+import itertools
 import pandas as pd
 import os
 import re
@@ -10,48 +11,122 @@ def sanitize_relationship(value):
     # Replace any non-alphanumeric characters with underscores for valid relationship names
     return re.sub(r"[^a-zA-Z0-9_]", "_", value)
 
-def generate_cypher_script(file_path, output_dir):
-    # Load the CSV file
-    triples_df = pd.read_csv(file_path)
+# Relationships loaded per UNWIND statement in batched mode
+BATCH_SIZE = 1000
 
-    # Initialize sets to keep track of unique subjects and objects
-    unique_nodes = set()
-    cypher_statements = []
-
-    # Create unique node creation statements for subjects and objects
-    for _, row in triples_df.iterrows():
-        subject = escape_quotes(row['Subject'])
-        obj = escape_quotes(row['Object'])
-        predicate = sanitize_relationship(row['Predicate']).upper()
-        
-        # Add subject and object to unique nodes set
-        unique_nodes.add(subject)
-        unique_nodes.add(obj)
-        
-        # Create relationship statement
-        relationship_statement = f"MATCH (a:Node {{name: '{subject}'}}), (b:Node {{name: '{obj}'}}) CREATE (a)-[:{predicate}]->(b);"
-        cypher_statements.append(relationship_statement)
-
-    # Create node creation statements
-    node_statements = [f"MERGE (n:Node {{name: '{node}'}});" for node in unique_nodes]
-
-    # Combine node and relationship statements
-    full_cypher_script = "\n".join(node_statements + cypher_statements)
+# Rows of triples.csv held in memory at a time
+CHUNK_SIZE = 100000
+
+def cypher_string(value):
+    # Quote a value as a Cypher string literal, escaping backslashes and single quotes
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def cypher_strings(values):
+    # Column-wise version of cypher_string for a whole Series at once
+    return "'" + values.str.replace("\\", "\\\\", regex=False).str.replace("'", "\\'", regex=False) + "'"
+
+def add_relationships(chunk):
+    # Add the sanitized relationship type of each triple, dropping triples whose predicate has no letter or digit
+    # (an empty type would make the relationship pattern invalid Cypher, and one of underscores means nothing)
+    chunk['Relationship'] = chunk['Predicate'].str.replace(r"[^a-zA-Z0-9_]", "_", regex=True).str.upper()
+    empty = ~chunk['Relationship'].str.contains(r"[A-Z0-9]", regex=True)
+    if empty.any():
+        print(f"Skipping {int(empty.sum())} triples without a usable predicate")
+    return chunk[~empty]
+
+def read_triples(file_path, chunksize=CHUNK_SIZE):
+    # Stream the CSV file in chunks, skipping incomplete triples. Every value is kept as written, so terms
+    # like "NA", "null" or "None" stay names instead of becoming missing values; missing ones read as ''
+    for chunk in pd.read_csv(file_path, dtype=str, keep_default_na=False, na_filter=False, chunksize=chunksize):
+        yield add_relationships(chunk[(chunk[['Subject', 'Predicate', 'Object']] != '').all(axis=1)])
+
+def store_triples(store, chunksize=CHUNK_SIZE):
+    # The same chunks as read_triples, taken from a TripleStore in memory instead of triples.csv
+    triples = iter(store)
+    while True:
+        rows = list(itertools.islice(triples, chunksize))
+        if not rows:
+            return
+        yield add_relationships(pd.DataFrame(rows, columns=['Subject', 'Predicate', 'Object']))
 
+def generate_batched_cypher_script(file_path, output_dir, batch_size=BATCH_SIZE, chunksize=CHUNK_SIZE):
+    write_batched_cypher(read_triples(file_path, chunksize), output_dir, batch_size)
+
+def write_batched_cypher(chunks, output_dir, batch_size=BATCH_SIZE):
     # Create the output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, 'triples.cypher')
+    total = 0
+
+    with open(output_path, 'w', encoding='utf-8') as file:
+        # A uniqueness constraint gives MERGE an index to look nodes up in instead of scanning every node
+        # (CREATE CONSTRAINT ... IF NOT EXISTS needs Neo4j 4.4 or later)
+        file.write("CREATE CONSTRAINT node_name IF NOT EXISTS FOR (n:Node) REQUIRE n.name IS UNIQUE;")
+
+        for chunk in chunks:
+            total += len(chunk)
+            row_literals = "{s: " + cypher_strings(chunk['Subject']) + ", o: " + cypher_strings(chunk['Object']) + "}"
+
+            # Relationship types can't be parameters, so each type gets its own batches. The rows are written
+            # inline rather than as a :param, which only cypher-shell and Neo4j Browser understand, and each
+            # row CREATEs its relationship as the one-statement-per-edge script does
+            for relationship, rows in row_literals.groupby(chunk['Relationship'], sort=True):
+                rows = rows.tolist()
+                for start in range(0, len(rows), batch_size):
+                    file.write(f"\nUNWIND [{', '.join(rows[start:start + batch_size])}] AS r "
+                               f"MERGE (a:Node {{name: r.s}}) MERGE (b:Node {{name: r.o}}) "
+                               f"CREATE (a)-[:`{relationship}`]->(b);")
 
-    # Output the generated Cypher script
+    print(f"Cypher script with {total} relationships in batches of {batch_size} has been generated "
+          f"and saved as '{output_path}'")
+
+def generate_cypher_script(file_path, output_dir, chunksize=CHUNK_SIZE):
+    write_cypher(read_triples(file_path, chunksize), output_dir)
+
+def write_cypher(chunks, output_dir):
+    # Create the output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, 'triples.cypher')
+
+    # Keep track of the nodes already created so each is merged once
+    unique_nodes = set()
+
     with open(output_path, 'w') as file:
-        file.write(full_cypher_script)
+        first = True
+        for chunk in chunks:
+            subjects = chunk['Subject'].str.replace("'", "\\'", regex=False)
+            objects = chunk['Object'].str.replace("'", "\\'", regex=False)
+
+            # Create the nodes first seen in this chunk before the relationships that MATCH them
+            new_nodes = [node for node in pd.unique(pd.concat([subjects, objects], ignore_index=True))
+                         if node not in unique_nodes]
+            unique_nodes.update(new_nodes)
+            statements = [f"MERGE (n:Node {{name: '{node}'}});" for node in new_nodes]
+
+            # Create relationship statements for the whole chunk at once
+            statements += ("MATCH (a:Node {name: '" + subjects + "'}), (b:Node {name: '" + objects +
+                           "'}) CREATE (a)-[:" + chunk['Relationship'] + "]->(b);").tolist()
+
+            if statements:
+                file.write(("" if first else "\n") + "\n".join(statements))
+                first = False
 
     print(f"Cypher script has been generated and saved as '{output_path}'")
 
-def main():
-    input_file_path = 'data/out_clean_trip/triples.csv'
-    output_directory = 'data/out_csv_to_cypher'
-    generate_cypher_script(input_file_path, output_directory)
+def run(store, batched=False, output_directory='data/out_csv_to_cypher'):
+    # Write the Cypher script for the triples of a TripleStore, e.g. the one clean_trip.run() returns
+    if batched:
+        write_batched_cypher(store_triples(store), output_directory)
+    else:
+        write_cypher(store_triples(store), output_directory)
+
+def main(batched=False, input_file_path='data/out_clean_trip/triples.csv', output_directory='data/out_csv_to_cypher'):
+    if batched:
+        # A uniqueness constraint and one UNWIND statement per batch of relationships, for large graphs
+        generate_batched_cypher_script(input_file_path, output_directory)
+    else:
+        # One statement per node and per relationship, as the script has always been written
+        generate_cypher_script(input_file_path, output_directory)
 
 if __name__ == "__main__":
     main()
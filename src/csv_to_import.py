@@ -0,0 +1,125 @@
+# Turns triples.csv into the node and relationship files that `neo4j-admin database import` loads,
+# for graphs too big to load through Cypher. Optionally also writes the triple table as Parquet (needs pyarrow).
+
+import csv
+import importlib.util
+import os
+import sys
+
+from src.csv_to_cypher import sanitize_relationship
+from src.triple_store import TripleStore, STORE_DIR
+
+# Triples buffered per Parquet row group
+PARQUET_BATCH_SIZE = 100000
+
+NODE_HEADER = ['nodeId:ID', 'name', ':LABEL']
+RELATIONSHIP_HEADER = [':START_ID', ':END_ID', ':TYPE']
+
+
+def generate_import_files(file_path, output_dir, parquet=False):
+    # Create the output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    nodes_path = os.path.join(output_dir, 'nodes.csv')
+    relationships_path = os.path.join(output_dir, 'relationships.csv')
+
+    parquet_writer = None
+    if parquet:
+        if importlib.util.find_spec('pyarrow') is None:
+            print("pyarrow is not installed; skipping the Parquet export (pip install pyarrow)")
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([('subject', pa.string()), ('predicate', pa.string()), ('object', pa.string()),
+                                ('subject_id', pa.int64()), ('object_id', pa.int64()),
+                                ('relationship', pa.string())])
+            parquet_writer = pq.ParquetWriter(os.path.join(output_dir, 'triples.parquet'), schema)
+    columns = {name: [] for name in ('subject', 'predicate', 'object', 'subject_id', 'object_id', 'relationship')}
+
+    def flush_parquet():
+        if parquet_writer and columns['subject']:
+            parquet_writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            for values in columns.values():
+                values.clear()
+
+    # Integer node IDs, handed out the first time a name is seen
+    node_ids = {}
+    relationship_count = 0
+
+    # One pass over the triples writes both files; a node is written when it first appears
+    with open(file_path, 'r', encoding='utf-8', newline='') as input_file, \
+            open(nodes_path, 'w', encoding='utf-8', newline='') as nodes_file, \
+            open(relationships_path, 'w', encoding='utf-8', newline='') as relationships_file:
+        nodes = csv.writer(nodes_file)
+        relationships = csv.writer(relationships_file)
+        nodes.writerow(NODE_HEADER)
+        relationships.writerow(RELATIONSHIP_HEADER)
+
+        for row in csv.DictReader(input_file):
+            subject, predicate, obj = row.get('Subject'), row.get('Predicate'), row.get('Object')
+            if not subject or not predicate or not obj:
+                continue
+
+            ids = []
+            for name in (subject, obj):
+                if name not in node_ids:
+                    node_ids[name] = len(node_ids)
+                    nodes.writerow([node_ids[name], name, 'Node'])
+                ids.append(node_ids[name])
+
+            relationship = sanitize_relationship(predicate).upper()
+            relationships.writerow([ids[0], ids[1], relationship])
+            relationship_count += 1
+
+            if parquet_writer:
+                for name, value in zip(columns, (subject, predicate, obj, ids[0], ids[1], relationship)):
+                    columns[name].append(value)
+                if len(columns['subject']) >= PARQUET_BATCH_SIZE:
+                    flush_parquet()
+
+    if parquet_writer:
+        flush_parquet()
+        parquet_writer.close()
+
+    print(f"Wrote {len(node_ids)} nodes to '{nodes_path}' and {relationship_count} relationships to "
+          f"'{relationships_path}'")
+    print(f"Load them into an empty database with: neo4j-admin database import full --id-type=INTEGER "
+          f"--nodes={nodes_path} --relationships={relationships_path} neo4j")
+
+
+def generate_import_files_from_store(store_dir, output_dir):
+    # The store already holds integer IDs: entity IDs become node IDs and each predicate is sanitized once
+    store = TripleStore.load(store_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    nodes_path = os.path.join(output_dir, 'nodes.csv')
+    relationships_path = os.path.join(output_dir, 'relationships.csv')
+
+    with open(nodes_path, 'w', encoding='utf-8', newline='') as nodes_file:
+        nodes = csv.writer(nodes_file)
+        nodes.writerow(NODE_HEADER)
+        nodes.writerows((node_id, name, 'Node') for node_id, name in enumerate(store.entities.terms))
+
+    relationship_types = [sanitize_relationship(predicate).upper() for predicate in store.predicates.terms]
+    with open(relationships_path, 'w', encoding='utf-8', newline='') as relationships_file:
+        relationships = csv.writer(relationships_file)
+        relationships.writerow(RELATIONSHIP_HEADER)
+        relationships.writerows((s, o, relationship_types[p]) for s, p, o in store.ids())
+
+    print(f"Wrote {len(store.entities)} nodes to '{nodes_path}' and {len(store)} relationships to "
+          f"'{relationships_path}'")
+    print(f"Load them into an empty database with: neo4j-admin database import full --id-type=INTEGER "
+          f"--nodes={nodes_path} --relationships={relationships_path} neo4j")
+
+
+def main(parquet=False):
+    input_file_path = 'data/out_clean_trip/triples.csv'
+    output_directory = 'data/out_csv_to_import'
+    if TripleStore.exists(STORE_DIR) and not parquet:
+        # clean_trip saved the interned triples, so no strings need hashing again
+        generate_import_files_from_store(STORE_DIR, output_directory)
+    else:
+        generate_import_files(input_file_path, output_directory, parquet=parquet)
+
+
+if __name__ == "__main__":
+    # Run with --parquet to also write data/out_csv_to_import/triples.parquet
+    main(parquet="--parquet" in sys.argv[1:])
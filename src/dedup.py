@@ -0,0 +1,173 @@
+# Near-duplicate requirement detection between clean_req and group_req. Long specifications restate the same
+# requirement in several sections, and without this every restatement is sent to call_api_trip for triples.
+# Each requirement is cut into character shingles and summarized by a MinHash signature. The signatures are split
+# into bands, and only requirements that share a band are compared (locality-sensitive hashing), so the work grows
+# with the number of requirements rather than the number of pairs. Each cluster of near-duplicates is replaced by
+# one canonical requirement that lists the chunk_id of every copy.
+
+import re
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+import numpy as np
+
+from src import clean_req
+
+# Bytes per shingle (at most 8, so a shingle fits in a 64-bit integer); requirements are short,
+# so one changed word leaves most character shingles intact
+SHINGLE_SIZE = 5
+# 20 bands of 6 rows: pairs with a Jaccard similarity of 0.8 share a band 99.8% of the time, pairs at 0.5 27%
+# and pairs at 0.3 1%; more rows per band compare fewer pairs but miss more near-duplicates
+BANDS = 20
+ROWS = 6
+# Requirements whose shingles have at least this Jaccard similarity are duplicates
+THRESHOLD = 0.8
+# Signatures are computed for this many requirements at a time, bounding the memory of the hash matrix
+SIGNATURE_BATCH = 128
+SEED = 1
+
+WORD = re.compile(r"\w+")
+
+OUTPUT_FILE = 'data/out_dedup/requirements.json'
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Return the byte shingles of a text as integers, ignoring case, punctuation and spacing.
+
+    Each run of `size` bytes is read as one big-endian number, so equal shingles are equal integers.
+    """
+    data = " ".join(WORD.findall(text.lower())).encode("utf-8")
+    if len(data) <= size:
+        return np.array([int.from_bytes(data, "big")], dtype=np.uint64)
+    values = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+    count = len(data) - size + 1
+    codes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        codes = (codes << np.uint64(8)) | values[offset:offset + count]
+    return codes
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class MinHasher:
+    """MinHash signatures from multiply-shift hash functions, (a * x + b) >> 32 over 64-bit integers."""
+
+    def __init__(self, num_permutations: int = BANDS * ROWS, seed: int = SEED):
+        rng = np.random.default_rng(seed)
+        top = np.iinfo(np.uint64).max
+        # Odd multipliers keep every function a permutation of the 64-bit integers
+        self.a = rng.integers(top, size=num_permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(top, size=num_permutations, dtype=np.uint64)
+
+    def signatures(self, shingle_arrays: List[np.ndarray]) -> np.ndarray:
+        """Return one row of MinHash values per array of shingles."""
+        rows = np.empty((len(shingle_arrays), len(self.a)), dtype=np.uint32)
+        for start in range(0, len(shingle_arrays), SIGNATURE_BATCH):
+            batch = shingle_arrays[start:start + SIGNATURE_BATCH]
+            offsets = np.cumsum([0] + [len(codes) for codes in batch[:-1]])
+            # Every hash function applied to every shingle (one row per shingle), wrapping around at 64 bits,
+            # then the minimum over each requirement's rows
+            values = (np.concatenate(batch)[:, None] * self.a[None, :] + self.b[None, :]) >> np.uint64(32)
+            rows[start:start + len(batch)] = np.minimum.reduceat(values, offsets, axis=0)
+        return rows
+
+
+def buckets(signatures: np.ndarray, bands: int = BANDS) -> Iterator[np.ndarray]:
+    """Yield the indexes of the requirements that share a band of their signatures, for each band value shared."""
+    rows = signatures.shape[1] // bands
+    for band in range(bands):
+        # Each requirement's rows of this band as one opaque value, so equal bands can be found by sorting
+        band_rows = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = band_rows.view(np.dtype((np.void, rows * 4))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind="stable")
+        ends = np.cumsum(counts)
+        for group in np.flatnonzero(counts > 1):
+            yield order[ends[group] - counts[group]:ends[group]]
+
+
+def cluster(texts: List[str], threshold: float = THRESHOLD, bands: int = BANDS,
+            rows: int = ROWS) -> Tuple[List[List[int]], int]:
+    """Group the texts into clusters of near-duplicates, returning the clusters and the number of pairs compared.
+
+    Clusters list indexes into `texts` in order, and are ordered by their first member.
+    """
+    shingle_arrays = [shingles(text) for text in texts]
+    signatures = MinHasher(bands * rows).signatures(shingle_arrays)
+    # Sets for checking candidate pairs, made on first use since most requirements have no near-duplicate
+    shingle_sets: Dict[int, Set[int]] = {}
+
+    def shingle_set(index):
+        if index not in shingle_sets:
+            shingle_sets[index] = set(shingle_arrays[index].tolist())
+        return shingle_sets[index]
+    parent = list(range(len(texts)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    compared = 0
+    for bucket in buckets(signatures, bands):
+        # Within a bucket each requirement is compared with one member of each cluster found so far, so a
+        # bucket full of copies of the same requirement costs one comparison per copy
+        representatives: List[int] = []
+        for index in bucket.tolist():
+            root = find(index)
+            for representative in representatives:
+                if find(representative) == root:
+                    break
+                compared += 1
+                if jaccard(shingle_set(representative), shingle_set(index)) >= threshold:
+                    # The earlier requirement becomes the root, so clusters keep document order
+                    low, high = sorted((find(representative), root))
+                    parent[high] = low
+                    break
+            else:
+                representatives.append(index)
+
+    clusters: Dict[int, List[int]] = {}
+    for index in range(len(texts)):
+        clusters.setdefault(find(index), []).append(index)
+    return list(clusters.values()), compared
+
+
+def run(objects: List[Dict[str, Any]], threshold: float = THRESHOLD) -> List[Dict[str, Any]]:
+    """Return one canonical requirement per cluster of near-duplicates, in document order.
+
+    The canonical requirement is the copy the model was most sure of (the first one on a tie). It gets a
+    "chunk_ids" list with the chunk of every copy and a "duplicates" count of the copies it replaces.
+    Entries without a text, such as the null object of a chunk without requirements, are passed through as they are.
+    """
+    positions = [position for position, obj in enumerate(objects)
+                 if isinstance(obj, dict) and isinstance(obj.get("text"), str)]
+    requirements = [objects[position] for position in positions]
+    clusters, compared = cluster([obj["text"] for obj in requirements], threshold)
+    # Each cluster's canonical requirement takes the place of its first copy
+    canonical = {}
+    for members in clusters:
+        best = max(members, key=lambda index: (requirements[index].get("probability") or 0, -index))
+        chunk_ids = list(dict.fromkeys(requirements[index].get("chunk_id") for index in members))
+        canonical[positions[members[0]]] = {**requirements[best], "chunk_ids": chunk_ids,
+                                            "duplicates": len(members) - 1}
+    copies = set(positions) - set(canonical)
+    repeated = sum(1 for members in clusters if len(members) > 1)
+    print(f"Deduplicated {len(requirements)} requirements into {len(canonical)}: "
+          f"{len(copies)} near-duplicates in {repeated} clusters, {compared} pairs compared")
+    return [canonical.get(position, obj) for position, obj in enumerate(objects) if position not in copies]
+
+
+def save(objects: List[Dict[str, Any]], output_file: str = OUTPUT_FILE) -> None:
+    """Save the canonical requirements in clean_req's layout, for group_req to read."""
+    clean_req.save(objects, output_file)
+
+
+def main(input_file='data/out_clean_req/requirements.json', output_file=OUTPUT_FILE):
+    save(run(clean_req.APIResponseCleaner(input_file, '').load_input_file()), output_file)
+
+
+if __name__ == "__main__":
+    main()
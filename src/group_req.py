@@ -2,6 +2,15 @@ import json
 import os
 from pathlib import Path
 
+def extract_texts(entries):
+    # Yield the requirement text of each entry that has one
+    for entry in entries:
+        # Check the entry is an object with a text; the null object of a chunk without requirements has
+        # "text": null, and a response can hold arrays or plain values too
+        if isinstance(entry, dict) and isinstance(entry.get('text'), str):
+            # Strip any extra whitespace before passing the text on
+            yield entry['text'].strip()
+
 def extract_text_from_json(input_file, output_file):
     try:
         # Create data directory if it doesn't exist
@@ -18,12 +27,7 @@ def extract_text_from_json(input_file, output_file):
             data = json.load(f)
             
         # Extract text from each entry and join with newlines
-        texts = []
-        for entry in data:
-            # Check if 'text' key exists in the current entry
-            if 'text' in entry:
-                # Strip any extra whitespace and add the text to the list
-                texts.append(entry['text'].strip())
+        texts = list(extract_texts(data))
         
         # Combine all extracted text entries into a single string, separated by newlines
         combined_text = '\n'.join(texts)
@@ -50,11 +54,20 @@ def extract_text_from_json(input_file, output_file):
         print(f"Error: An unexpected error occurred: {str(e)}")
         return False
 
-def main():
-    # Define the input and output file paths
-    input_file = "data/out_clean_req/requirements.json"
-    output_file = "data/out_group_req/requirements_all.txt"
-    
+# Join the requirement texts of the objects clean_req returns into the text chunk_req splits up
+def run(entries):
+    return '\n'.join(extract_texts(entries))
+
+# Save the joined text where main() would write it
+def save(text, output_file="data/out_group_req/requirements_all.txt"):
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+# The input and output file paths default to the pipeline's data folders
+def main(input_file="data/out_clean_req/requirements.json", output_file="data/out_group_req/requirements_all.txt"):
     # Create output directory if it doesn't exist
     output_dir = os.path.dirname(output_file)
     if output_dir:
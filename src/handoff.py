@@ -0,0 +1,118 @@
+# In-memory mode for main.py: each step hands its result to the next as Python objects instead of writing
+# it to data/ for the next step to read back and parse. The intermediate files are still saved, for rerunning
+# single steps later, but by a background thread while the following steps run (or right away, or not at all).
+# The API stages always write their responses as they arrive, so an interrupted run keeps what it paid for.
+
+import contextlib
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+from src import (call_api_req, call_api_trip, chunk_pdf, chunk_req, clean_req, clean_trip, csv_to_cypher,
+                 dedup as requirement_dedup, group_req, metrics, prefilter as chunk_prefilter)
+
+# "background" saves the intermediate files in a writer thread, "sync" saves each before the next step starts
+# and "none" only keeps the API responses and the Cypher script
+PERSIST_MODES = ("background", "sync", "none")
+
+
+class BackgroundWriter:
+    """Runs save functions in a thread of its own, one at a time and in the order they were submitted."""
+
+    def __init__(self):
+        self.tasks: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.errors: List[Exception] = []
+        self.thread = threading.Thread(target=self._work, name="background-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, function: Callable[..., Any], *args: Any) -> None:
+        # The arguments are saved later, so they must not be changed after they are submitted
+        self.tasks.put((function, args))
+
+    def _work(self) -> None:
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            function, args = task
+            try:
+                function(*args)
+            except Exception as e:
+                # A failed save loses an intermediate file, not the run
+                self.errors.append(e)
+                print(f"Error saving in the background: {e}")
+
+    def close(self) -> None:
+        """Wait for every submitted save to finish."""
+        self.tasks.put(None)
+        self.thread.join()
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def run(incremental=False, batch=False, persist="background", prefilter=None, dedup=False, **api_options):
+    """Run the eight steps with their results passed along in memory.
+
+    prefilter ("skip" or "candidates") filters the chunks before they are sent, as with main.py --prefilter,
+    and dedup merges near-duplicate requirements before triple extraction, as with --dedup.
+    api_options (max_workers, use_cache and so on) go to both API stages.
+    """
+    if persist not in PERSIST_MODES:
+        raise ValueError(f"persist must be one of {', '.join(PERSIST_MODES)}, not '{persist}'")
+    # Each step is measured in main.py's run report as in the step-by-step run
+    report = metrics.active_report()
+
+    def stage(name):
+        return report.stage(name) if report is not None else contextlib.nullcontext()
+
+    writer = BackgroundWriter() if persist == "background" else None
+
+    def save(function, *args):
+        if writer is not None:
+            writer.submit(function, *args)
+        elif persist == "sync":
+            function(*args)
+
+    try:
+        with stage("chunk_pdf"):
+            chunks = chunk_pdf.run(incremental=incremental)
+            save(chunk_pdf.save, chunks)
+        if not chunks:
+            return
+        if prefilter:
+            with stage("prefilter"):
+                chunks = chunk_prefilter.run(chunks, prefilter)
+                save(chunk_prefilter.save, chunks)
+        with stage("call_api_req"):
+            records = call_api_req.run(chunks, incremental=incremental, batch=batch, **api_options)
+        with stage("clean_req"):
+            requirements = clean_req.run(records)
+            save(clean_req.save, requirements)
+        if dedup:
+            with stage("dedup"):
+                requirements = requirement_dedup.run(requirements)
+                save(requirement_dedup.save, requirements)
+        with stage("group_req"):
+            text = group_req.run(requirements)
+            save(group_req.save, text)
+        with stage("chunk_req"):
+            requirement_chunks = chunk_req.run(text, incremental=incremental)
+            save(chunk_req.save, requirement_chunks)
+        with stage("call_api_trip"):
+            records = call_api_trip.run(requirement_chunks, incremental=incremental, batch=batch, **api_options)
+        with stage("clean_trip"):
+            store, parsed = clean_trip.run(records)
+            save(clean_trip.save, store)
+            print(f"{len(store)} unique triples of {parsed} parsed, "
+                  f"{len(store.entities)} entities, {len(store.predicates)} predicates.")
+        with stage("csv_to_cypher"):
+            csv_to_cypher.run(store)
+    finally:
+        if writer is not None:
+            # Whatever the writer still has to do once the last step is done is measured on its own
+            with stage("persist"):
+                writer.close()
@@ -0,0 +1,102 @@
+# Content fingerprints for reprocessing only what changed when a revised document comes in
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List
+
+from src.jsonl import open_jsonl, read_jsonl
+
+MANIFEST_PATH = "data/out_chunk_pdf/manifest.json"
+
+# In incremental mode, chunk boundaries fall on roughly one sentence in every CUT_EVERY, chosen by content.
+# An edit then only moves the boundaries near it instead of every boundary after it.
+CUT_EVERY = 12
+
+PAGE_MARKER = re.compile(r'Page \d+:')
+
+
+def content_id(text: str, occurrence: int = 0) -> str:
+    """Return a short, stable ID for a piece of text.
+
+    Page markers and whitespace are ignored so a chunk keeps its ID when pages are inserted before it.
+    occurrence tells apart repeats of the same text (0 for the first), see ChunkIds.
+    """
+    normalized = ' '.join(PAGE_MARKER.sub(' ', text).split())
+    if occurrence:
+        normalized += f'#{occurrence}'
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+class ChunkIds:
+    """Gives the chunks of one document unique content IDs.
+
+    A chunk whose text appeared before (a repeated header, a "Reserved" section) is numbered by how many times
+    it did, so it gets an ID of its own that stays the same from run to run.
+    """
+
+    def __init__(self):
+        self.seen: Dict[str, int] = {}
+
+    def __call__(self, text: str) -> str:
+        first = content_id(text)
+        occurrence = self.seen.get(first, 0)
+        self.seen[first] = occurrence + 1
+        return content_id(text, occurrence)
+
+
+def is_cut_point(sentence: str, every: int = CUT_EVERY) -> bool:
+    """Return True for about one sentence in `every`, always the same sentences for the same text."""
+    digest = hashlib.md5(sentence.strip().encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % every == 0
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"pages": {}, "chunks": {}}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False)
+
+
+def report_changes(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Print how the pages and chunks differ from the previous run."""
+    old_pages, new_pages = old.get("pages", {}), new.get("pages", {})
+    changed = sum(1 for key, digest in new_pages.items() if key in old_pages and old_pages[key] != digest)
+    added = sum(1 for key in new_pages if key not in old_pages)
+    removed = sum(1 for key in old_pages if key not in new_pages)
+    old_chunks, new_chunks = set(old.get("chunks", {})), set(new.get("chunks", {}))
+    print(f"Pages since the last run: {added} new, {changed} changed, {removed} removed")
+    print(f"Chunks since the last run: {len(new_chunks - old_chunks)} new, "
+          f"{len(old_chunks - new_chunks)} removed, {len(new_chunks & old_chunks)} unchanged")
+
+
+def compact_jsonl(path: str, key: str, order: List[Any]) -> int:
+    """Rewrite a JSON Lines file with one record per key in `order`, in that order.
+
+    Records whose key is not in `order` are dropped, and a successful response wins over failed attempts.
+    Returns how many records were dropped.
+    """
+    if not os.path.exists(path):
+        return 0
+    latest: Dict[Any, Dict[str, Any]] = {}
+    total = 0
+    for record in read_jsonl(path):
+        total += 1
+        if "response" in record or "response" not in latest.get(record.get(key), {}):
+            latest[record.get(key)] = record
+    temp_path = path + ".tmp" + (".gz" if path.endswith(".gz") else "")
+    written = 0
+    with open_jsonl(temp_path, "wt") as file:
+        for item in dict.fromkeys(order):
+            if item in latest:
+                file.write(json.dumps(latest[item], ensure_ascii=False, separators=(",", ":")) + "\n")
+                written += 1
+    os.replace(temp_path, path)
+    return total - written
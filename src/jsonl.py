@@ -0,0 +1,109 @@
+# Helpers for the compact, append-only JSON Lines files written by the API stages
+
+import gzip
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+
+def jsonl_path(path: str, compress: bool = False) -> str:
+    """Return the path to write to, adding .gz when compression is requested."""
+    return path + ".gz" if compress and not path.endswith(".gz") else path
+
+
+def find_jsonl(path: str) -> str:
+    """Return whichever of `path` and `path.gz` exists, preferring the most recently written one."""
+    candidates = [p for p in (path, path + ".gz") if os.path.exists(p)]
+    if not candidates:
+        return path
+    return max(candidates, key=os.path.getmtime)
+
+
+def open_jsonl(path: str, mode: str = "rt"):
+    """Open a JSON Lines file as text, transparently handling gzip compression."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield one record per line without loading the whole file.
+
+    A run that was interrupted mid-write can leave a truncated last line (or gzip member);
+    that record is skipped so everything before it can still be used.
+    """
+    if not os.path.exists(path):
+        return
+    with open_jsonl(path, "rt") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping an incomplete record in '{path}'")
+        except (EOFError, gzip.BadGzipFile):
+            print(f"'{path}' ends with an incomplete record; using everything before it")
+
+
+def checkpoint_status(path: str, key: str) -> Tuple[Set[Any], Set[Any]]:
+    """Return the keys that already have a response and the keys whose latest attempt failed."""
+    done: Set[Any] = set()
+    failed: Set[Any] = set()
+    for record in read_jsonl(path):
+        if "response" in record:
+            done.add(record[key])
+            failed.discard(record[key])
+        elif record[key] not in done:
+            failed.add(record[key])
+    return done, failed
+
+
+class JSONLWriter:
+    """Appends records to a JSON Lines file as they arrive, flushing each one to disk.
+
+    Records written with an index are released in index order so the file follows the
+    original chunk order even though requests finish out of order.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open_jsonl(path, "at" if append else "wt")
+        self.lock = threading.Lock()
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.next_index = 0
+        self.count = 0
+
+    def _write_line(self, record: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.count += 1
+
+    def write(self, record: Dict[str, Any], index: Optional[int] = None) -> None:
+        with self.lock:
+            if index is None:
+                self._write_line(record)
+            else:
+                # Hold the record until every earlier one has been written
+                self.pending[index] = record
+                while self.next_index in self.pending:
+                    self._write_line(self.pending.pop(self.next_index))
+                    self.next_index += 1
+            self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            # After an interruption some records may still be waiting on earlier ones; keep them anyway
+            for index in sorted(self.pending):
+                self._write_line(self.pending.pop(index))
+            self.file.close()
+
+    def __enter__(self) -> "JSONLWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
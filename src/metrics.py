@@ -0,0 +1,274 @@
+# Run report for main.py: how long each stage took, how much CPU and memory it used,
+# and what the API stages sent, waited for and spent. Saved as JSON and as a Prometheus textfile.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then left out of the report
+    resource = None
+
+REPORT_DIR = "data/reports"
+# Point node_exporter's textfile collector at this file to scrape the latest run
+PROMETHEUS_PATH = os.path.join(REPORT_DIR, "reqify.prom")
+
+# US dollars per million tokens: (prompt, cached prompt, completion). Update these when the price list changes.
+PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+# The Batch API charges half price
+BATCH_DISCOUNT = 0.5
+
+PERCENTILES = (50, 95, 99)
+
+
+def reset_peak_memory() -> bool:
+    """Restart the process's peak memory count, returning False where the OS doesn't allow it."""
+    # Linux resets the VmHWM high-water mark when 5 is written to clear_refs
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory() -> Optional[int]:
+    """Return the process's peak resident memory in bytes, or None if it can't be read."""
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def cpu_seconds() -> float:
+    # CPU time of this process and of the worker processes it has finished with, e.g. chunk_pdf's extractors
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Return the nearest-rank percentile of the values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def request_cost(model: str, prompt: int, cached: int, completion: int, batch: bool = False) -> Optional[float]:
+    """Estimate the price of one request in US dollars, or None for a model without a price."""
+    prices = PRICES.get(model)
+    if prices is None:
+        # Dated model names like gpt-4o-2024-08-06 are priced like their family
+        family = max((name for name in PRICES if model.startswith(name + "-")), key=len, default=None)
+        if family is None:
+            return None
+        prices = PRICES[family]
+    cost = ((prompt - cached) * prices[0] + cached * prices[1] + completion * prices[2]) / 1e6
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+class APIStats:
+    """Requests, retries, latencies, tokens and cost for one model in one stage."""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.latencies: List[float] = []
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.unpriced = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "latency_seconds": {f"p{pct}": percentile(self.latencies, pct) for pct in PERCENTILES},
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost, 6),
+            "unpriced_requests": self.unpriced,
+        }
+
+
+class RunReport:
+    """Collects the measurements of one pipeline run. Safe to record into from worker threads."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.api: Dict[str, Dict[str, APIStats]] = {}
+        self.current_stage = "other"
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure the wall time, CPU time and peak memory of the code run inside the block."""
+        previous = self.current_stage
+        self.current_stage = name
+        reset_peak_memory()
+        wall, cpu = time.perf_counter(), cpu_seconds()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "wall_seconds": round(time.perf_counter() - wall, 6),
+                "cpu_seconds": round(cpu_seconds() - cpu, 6),
+                # Without a resettable counter (e.g. on macOS) this is the peak of the whole run so far
+                "peak_memory_bytes": peak_memory(),
+            }
+            self.current_stage = previous
+
+    def record_request(self, model: str, result: Dict[str, Any], latency: Optional[float] = None,
+                       attempts: int = 1, batch: bool = False) -> None:
+        """Record one API request's result; cached responses count as cache hits only."""
+        with self.lock:
+            stats = self.api.setdefault(self.current_stage, {}).setdefault(model, APIStats())
+            if result.get("cached"):
+                stats.cache_hits += 1
+                return
+            stats.requests += 1
+            stats.retries += max(0, attempts - 1)
+            if latency is not None:
+                stats.latencies.append(latency)
+            if result.get("status") != 200:
+                stats.failures += 1
+                return
+            usage = result["response"].get("usage") or {}
+            prompt = usage.get("prompt_tokens", 0)
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+            completion = usage.get("completion_tokens", 0)
+            stats.prompt_tokens += prompt
+            stats.cached_tokens += cached
+            stats.completion_tokens += completion
+            cost = request_cost(result["response"].get("model") or model, prompt, cached, completion, batch)
+            if cost is None:
+                stats.unpriced += 1
+            else:
+                stats.cost += cost
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            api = {stage: {model: stats.to_dict() for model, stats in models.items()}
+                   for stage, models in self.api.items()}
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(time.time() - self.started, 6),
+            "stages": self.stages,
+            "api": api,
+            "cost_usd": round(sum(models[model]["cost_usd"] for models in api.values() for model in models), 6),
+        }
+
+    def prometheus(self) -> str:
+        """Return the report in the Prometheus text exposition format."""
+        report = self.to_dict()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP reqify_{name} {help_text}")
+            lines.append(f"# TYPE reqify_{name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"reqify_{name}{{{label_text}}} {value}" if label_text else f"reqify_{name} {value}")
+
+        stages = report["stages"]
+        metric("stage_wall_seconds", "gauge", "Wall time of each pipeline stage.",
+               [({"stage": stage}, values["wall_seconds"]) for stage, values in stages.items()])
+        metric("stage_cpu_seconds", "gauge", "CPU time of each pipeline stage, including its worker processes.",
+               [({"stage": stage}, values["cpu_seconds"]) for stage, values in stages.items()])
+        metric("stage_peak_memory_bytes", "gauge", "Peak resident memory during each pipeline stage.",
+               [({"stage": stage}, values["peak_memory_bytes"]) for stage, values in stages.items()])
+
+        api = [({"stage": stage, "model": model}, values)
+               for stage, models in report["api"].items() for model, values in models.items()]
+        for key, help_text in (("requests", "API requests sent."),
+                               ("failures", "API requests that failed."),
+                               ("retries", "API request attempts that were retried."),
+                               ("cache_hits", "Requests answered from the response cache."),
+                               ("prompt_tokens", "Prompt tokens billed."),
+                               ("cached_tokens", "Prompt tokens billed at the cached rate."),
+                               ("completion_tokens", "Completion tokens billed.")):
+            metric(f"api_{key}_total", "counter", help_text, [(labels, values[key]) for labels, values in api])
+        metric("api_latency_seconds", "summary", "Latency of API requests, including retries but not rate limit waits.",
+               [({**labels, "quantile": str(pct / 100)}, values["latency_seconds"][f"p{pct}"])
+                for labels, values in api for pct in PERCENTILES])
+        metric("api_cost_usd_total", "counter", "Estimated API cost in US dollars.",
+               [(labels, values["cost_usd"]) for labels, values in api])
+        metric("run_wall_seconds", "gauge", "Wall time of the whole run.", [({}, report["wall_seconds"])])
+        return "\n".join(lines) + "\n"
+
+    def save(self, directory: str = REPORT_DIR, prometheus_path: str = PROMETHEUS_PATH) -> str:
+        """Write the report as JSON (one file per run) and as the Prometheus textfile, returning the JSON path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("run_%Y%m%d_%H%M%S.json", time.localtime(self.started)))
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=4)
+        # Write to a temporary file first so a scrape never reads half a file
+        with open(prometheus_path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(self.prometheus())
+        os.replace(prometheus_path + ".tmp", prometheus_path)
+        return path
+
+    def summary(self) -> str:
+        """Return a few human-readable lines about the run."""
+        report = self.to_dict()
+        lines = [f"{stage}: {values['wall_seconds']:.2f}s wall, {values['cpu_seconds']:.2f}s CPU"
+                 + (f", {values['peak_memory_bytes'] / 1e6:.0f} MB peak" if values["peak_memory_bytes"] else "")
+                 for stage, values in report["stages"].items()]
+        for stage, models in report["api"].items():
+            for model, values in models.items():
+                p50, p95 = values["latency_seconds"]["p50"], values["latency_seconds"]["p95"]
+                latency = f", p50 {p50:.2f}s, p95 {p95:.2f}s" if p50 is not None else ""
+                lines.append(f"{stage} {model}: {values['requests']} requests, {values['retries']} retries, "
+                             f"{values['cache_hits']} cached{latency}, "
+                             f"{values['prompt_tokens'] + values['completion_tokens']} tokens, ${values['cost_usd']:.4f}")
+        lines.append(f"Estimated API cost: ${report['cost_usd']:.4f}")
+        return "\n".join(lines)
+
+
+# The report API clients record into while main.py runs; None when the stages run on their own
+_active: Optional[RunReport] = None
+
+
+def start_report() -> RunReport:
+    """Start a new run report that every API client records into until stop_report() is called."""
+    global _active
+    _active = RunReport()
+    return _active
+
+
+def active_report() -> Optional[RunReport]:
+    return _active
+
+
+def stop_report() -> None:
+    global _active
+    _active = None
@@ -0,0 +1,277 @@
+# A local stand-in for the chat completions API so the API stages can be exercised without spending money.
+# Run it directly and set API_URL="http://127.0.0.1:8000/v1/chat/completions" in api-key.env to use it.
+# It also implements the files and batches endpoints that batch mode uses.
+
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+
+# Words per event when a reply is streamed
+STREAM_WORDS = 5
+
+
+def echo_responder(request: Dict[str, Any]) -> str:
+    """Default reply: echo the last user message back."""
+    messages = request.get("messages", [])
+    return messages[-1].get("content", "") if messages else ""
+
+
+def completion_body(request: Dict[str, Any], content: Optional[str], request_id: str) -> Dict[str, Any]:
+    """Wrap a reply in the body the chat completions API returns."""
+    prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+    # A responder returning None sends "content": null, as a refusal does
+    completion_tokens = len(content.split()) if content else 0
+    return {
+        "id": request_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", ""),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class MockAPIServer(ThreadingHTTPServer):
+    """An HTTP server that mimics /v1/chat/completions with configurable latency and throttling."""
+
+    daemon_threads = True
+    # The default backlog of 5 makes concurrent clients wait on TCP retransmits when they all connect at once
+    request_queue_size = 128
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 throttle_rate: float = 0.0, error_rate: float = 0.0, retry_after: float = 1.0,
+                 responder: Callable[[Dict[str, Any]], str] = echo_responder, batch_latency: float = 0.0):
+        super().__init__((host, port), MockAPIHandler)
+        # Seconds to wait before answering each request
+        self.latency = latency
+        # Fraction of requests answered with 429 and a Retry-After header
+        self.throttle_rate = throttle_rate
+        # Fraction of requests answered with 500
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.responder = responder
+        # Seconds a batch stays in progress before its output file is ready
+        self.batch_latency = batch_latency
+        # Uploaded files and submitted batches, by ID
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        # Counters so callers can check how the server was used
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.throttled_count = 0
+        self.error_count = 0
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> "MockAPIServer":
+        """Serve in a background thread and return self."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def add_file(self, data: bytes) -> str:
+        with self.lock:
+            file_id = f"file-mock-{len(self.files) + 1}"
+            self.files[file_id] = data
+        return file_id
+
+    def run_batch(self, batch: Dict[str, Any]) -> None:
+        """Answer every request in a batch's input file and attach the output and error files."""
+        time.sleep(self.batch_latency)
+        outputs, errors = [], []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            request_id = f"req-mock-{batch['id']}-{len(outputs) + len(errors) + 1}"
+            if random.random() < self.error_rate:
+                errors.append({"id": request_id, "custom_id": item.get("custom_id"), "response": None,
+                               "error": {"code": "server_error", "message": "The server had an error"}})
+                continue
+            body = completion_body(item.get("body", {}), self.responder(item.get("body", {})), request_id)
+            outputs.append({"id": request_id, "custom_id": item.get("custom_id"),
+                            "response": {"status_code": 200, "request_id": request_id, "body": body}, "error": None})
+        output_file_id = self.add_file("".join(json.dumps(o) + "\n" for o in outputs).encode("utf-8")) if outputs else None
+        error_file_id = self.add_file("".join(json.dumps(e) + "\n" for e in errors).encode("utf-8")) if errors else None
+        with self.lock:
+            batch["output_file_id"] = output_file_id
+            batch["error_file_id"] = error_file_id
+            batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs),
+                                       "failed": len(errors)}
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        # Keep the console quiet
+        pass
+
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server: MockAPIServer = self.server
+        path = self.path.rstrip("/")
+        if path.startswith("/v1/batches/"):
+            batch = server.batches.get(path[len("/v1/batches/"):])
+            if batch is None:
+                self.send_json(404, {"error": {"message": "No such batch"}})
+                return
+            with server.lock:
+                self.send_json(200, batch)
+            return
+        if path.startswith("/v1/files/") and path.endswith("/content"):
+            data = server.files.get(path[len("/v1/files/"):-len("/content")])
+            if data is None:
+                self.send_json(404, {"error": {"message": "No such file"}})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def upload_file(self, body: bytes) -> None:
+        # Pull the file out of the multipart form the files endpoint receives
+        message = BytesParser(policy=default_policy).parsebytes(
+            b"Content-Type: " + self.headers.get("Content-Type", "").encode("latin-1") + b"\r\n\r\n" + body)
+        fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                  for part in message.iter_parts()}
+        if "file" not in fields:
+            self.send_json(400, {"error": {"message": "Missing file"}})
+            return
+        file_id = self.server.add_file(fields["file"])
+        self.send_json(200, {"id": file_id, "object": "file", "bytes": len(fields["file"]),
+                             "purpose": (fields.get("purpose") or b"").decode("utf-8")})
+
+    def create_batch(self, body: bytes) -> None:
+        server: MockAPIServer = self.server
+        request = json.loads(body or b"{}")
+        if request.get("input_file_id") not in server.files:
+            self.send_json(400, {"error": {"message": "Unknown input_file_id"}})
+            return
+        with server.lock:
+            batch = {"id": f"batch-mock-{len(server.batches) + 1}", "object": "batch",
+                     "endpoint": request.get("endpoint"), "input_file_id": request["input_file_id"],
+                     "completion_window": request.get("completion_window"), "status": "in_progress",
+                     "output_file_id": None, "error_file_id": None, "created_at": int(time.time())}
+            server.batches[batch["id"]] = batch
+            snapshot = dict(batch)
+        threading.Thread(target=server.run_batch, args=(batch,), daemon=True).start()
+        self.send_json(200, snapshot)
+
+    def do_POST(self):
+        server: MockAPIServer = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        if self.path.rstrip("/") == "/v1/files":
+            self.upload_file(body)
+            return
+        if self.path.rstrip("/") == "/v1/batches":
+            self.create_batch(body)
+            return
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        with server.lock:
+            server.request_count += 1
+
+        # Decide whether this request is throttled or fails before doing any work
+        roll = random.random()
+        if roll < server.throttle_rate:
+            with server.lock:
+                server.throttled_count += 1
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                           {"Retry-After": str(server.retry_after)})
+            return
+        if roll < server.throttle_rate + server.error_rate:
+            with server.lock:
+                server.error_count += 1
+            self.send_json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+            return
+
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        content = server.responder(request)
+        body = completion_body(request, content, f"chatcmpl-mock-{server.request_count}")
+        if request.get("stream"):
+            self.send_stream(request, body)
+            return
+        time.sleep(server.latency)
+        self.send_json(200, body)
+
+    def send_event(self, data: Dict[str, Any]) -> None:
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def send_stream(self, request: Dict[str, Any], body: Dict[str, Any]) -> None:
+        # Send the reply as server-sent events a few words at a time, spreading the latency over them
+        server: MockAPIServer = self.server
+        words = (body["choices"][0]["message"]["content"] or "").split(" ")
+        pieces = [" ".join(words[i:i + STREAM_WORDS]) + (" " if i + STREAM_WORDS < len(words) else "")
+                  for i in range(0, len(words), STREAM_WORDS)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        event = {key: body[key] for key in ("id", "created", "model")}
+        event["object"] = "chat.completion.chunk"
+        for piece in pieces:
+            time.sleep(server.latency / len(pieces))
+            self.send_event({**event, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        self.send_event({**event, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self.send_event({**event, "choices": [], "usage": body["usage"]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def main():
+    # Serve on a fixed port until interrupted
+    server = MockAPIServer(port=8000, latency=0.5, throttle_rate=0.05)
+    print(f"Mock API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Local prefilter between chunk_pdf and call_api_req: scores each sentence by the modal verbs the requirements
+# prompt lists (shall, must, will, should, could, may, might) and a few other wording cues, then drops the chunks
+# without a candidate sentence ("skip") or sends only the candidates with a sentence of context ("candidates").
+# Tables of contents, glossaries and boilerplate then cost nothing. Measure what it misses with
+# python -m benchmarks.bench_prefilter before relying on it for a new kind of document.
+
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src import call_api_req, chunk_pdf
+from src.chunker import get_encoding, split_sentences
+
+MODES = ("skip", "candidates")
+
+# How strongly each modal verb marks a requirement; shall and must almost always do
+MODAL_WEIGHTS = {"shall": 1.0, "must": 1.0, "will": 0.5, "should": 0.5, "could": 0.5, "may": 0.5, "might": 0.5}
+# "May" followed by a number is a date
+MODAL_PATTERN = re.compile(r"\b(" + "|".join(MODAL_WEIGHTS) + r")\b(?!\s+\d)", re.IGNORECASE)
+# Wording of requirements stated without a modal verb, e.g. "The contractor is required to ..."
+CUE_PATTERN = re.compile(r"\b(required|requirements?|responsible for|capable of|able to|ensures?|provides?|"
+                         r"supports?|compl(?:y|ies)|mandatory|prohibited)\b", re.IGNORECASE)
+CUE_WEIGHT = 0.5
+# Dot leaders of a table of contents, turned into one ellipsis before the text is split at full stops
+DOT_LEADER = re.compile(r"\.(?:\s?\.){3,}")
+# A table of contents entry (title, leader and page number) isn't a requirement, whatever words the title has
+TOC_ENTRY = re.compile(r"[^…]*…+\s*\d+")
+
+# A sentence scoring at least this is a candidate: by default any modal verb or cue is enough
+THRESHOLD = 0.5
+# Sentences kept on each side of a candidate in "candidates" mode, so the model sees what it refers to
+CONTEXT_SENTENCES = 1
+
+OUTPUT_FILE = 'data/out_prefilter/spec_chunks.json'
+
+
+def score_sentence(sentence: str) -> float:
+    """Score how likely a sentence is to state a requirement: 0 for none of the signs, up to 1.5."""
+    sentence = TOC_ENTRY.sub(" ", sentence)
+    modal = max((MODAL_WEIGHTS[match.lower()] for match in MODAL_PATTERN.findall(sentence)), default=0.0)
+    return modal + (CUE_WEIGHT if CUE_PATTERN.search(sentence) else 0.0)
+
+
+def filter_text(text: str, mode: str = "skip", threshold: float = THRESHOLD,
+                context: int = CONTEXT_SENTENCES) -> Tuple[Optional[str], int, int]:
+    """Filter one chunk's text, returning (the text to send or None to skip it, candidates, sentences)."""
+    # In "candidates" mode the text sent keeps the ellipses in place of the dot leaders
+    sentences = list(split_sentences([DOT_LEADER.sub("…", text)]))
+    candidates = [index for index, sentence in enumerate(sentences) if score_sentence(sentence) >= threshold]
+    if not candidates:
+        return None, 0, len(sentences)
+    if mode == "skip":
+        return text, len(candidates), len(sentences)
+
+    keep = set()
+    for index in candidates:
+        keep.update(range(max(0, index - context), min(len(sentences), index + context + 1)))
+    # Sentences keep their own leading whitespace; runs that weren't next to each other go on separate lines
+    runs: List[List[int]] = []
+    for index in sorted(keep):
+        if runs and index == runs[-1][-1] + 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    text = "\n".join("".join(sentences[index] for index in run).strip() for run in runs)
+    return text, len(candidates), len(sentences)
+
+
+def count_tokens(texts: List[str], encoding) -> int:
+    return sum(len(tokens) for tokens in encoding.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1))
+
+
+def filter_chunks(chunks: List[Dict[str, Any]], mode: str = "skip", threshold: float = THRESHOLD,
+                  context: int = CONTEXT_SENTENCES) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Filter chunk_pdf's chunks, returning the ones to send and what was saved.
+
+    Kept chunks keep their chunk_id, so requirements still point back to their pages.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}, not '{mode}'")
+    kept = []
+    candidates = sentences = 0
+    for chunk in chunks:
+        text, chunk_candidates, chunk_sentences = filter_text(chunk["chunk"], mode, threshold, context)
+        candidates += chunk_candidates
+        sentences += chunk_sentences
+        if text is not None:
+            kept.append({**chunk, "chunk": text})
+
+    # Every request also carries the system prompt, so a skipped chunk saves its prompt tokens too
+    encoding = get_encoding(call_api_req.MODEL)
+    prompt_tokens = len(encoding.encode_ordinary(call_api_req.load_system_prompt()))
+    chunk_tokens = count_tokens([chunk["chunk"] for chunk in chunks], encoding)
+    kept_tokens = count_tokens([chunk["chunk"] for chunk in kept], encoding)
+    stats = {
+        "mode": mode,
+        "chunks": len(chunks),
+        "kept_chunks": len(kept),
+        "sentences": sentences,
+        "candidate_sentences": candidates,
+        "chunk_tokens": chunk_tokens,
+        "kept_tokens": kept_tokens,
+        "tokens_saved": chunk_tokens - kept_tokens + (len(chunks) - len(kept)) * prompt_tokens,
+        "tokens_sent": kept_tokens + len(kept) * prompt_tokens,
+    }
+    return kept, stats
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    total = stats["tokens_saved"] + stats["tokens_sent"]
+    return (f"Prefilter ({stats['mode']}): {stats['kept_chunks']} of {stats['chunks']} chunks kept, "
+            f"{stats['candidate_sentences']} of {stats['sentences']} sentences are candidates; "
+            f"{stats['chunks'] - stats['kept_chunks']} requests and {stats['tokens_saved']} input tokens saved "
+            f"({stats['tokens_saved'] / total:.0%} of the input tokens)" if total else "Prefilter: no chunks")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def recall(requirements: Iterable[Dict[str, Any]], chunks: List[Dict[str, Any]],
+           kept: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Measure how many labeled requirements still reach the model after filtering.
+
+    `requirements` are objects with chunk_id and text, e.g. clean_req's output from a run without the
+    prefilter or a hand-labeled sample. Only requirements found verbatim in their chunk are counted,
+    since the model sometimes repairs words broken by the PDF extraction.
+    """
+    original = {chunk["chunk_id"]: normalize(chunk["chunk"]) for chunk in chunks}
+    filtered = {chunk["chunk_id"]: normalize(chunk["chunk"]) for chunk in kept}
+    labels = found = still_sent = 0
+    missed = []
+    for requirement in requirements:
+        if "text" not in requirement:
+            continue
+        labels += 1
+        text = normalize(requirement["text"])
+        if text not in original.get(str(requirement.get("chunk_id")), ""):
+            continue
+        found += 1
+        if text in filtered.get(str(requirement.get("chunk_id")), ""):
+            still_sent += 1
+        else:
+            missed.append(requirement["text"])
+    return {"labels": labels, "found": found, "kept": still_sent,
+            "recall": still_sent / found if found else None, "missed": missed}
+
+
+def run(chunks: List[Dict[str, Any]], mode: str = "skip", threshold: float = THRESHOLD,
+        context: int = CONTEXT_SENTENCES) -> List[Dict[str, Any]]:
+    """Return the chunks worth sending to call_api_req and print what was saved."""
+    kept, stats = filter_chunks(chunks, mode, threshold, context)
+    print(format_stats(stats))
+    return kept
+
+
+def save(chunks: List[Dict[str, Any]], output_file: str = OUTPUT_FILE) -> None:
+    """Save the filtered chunks in chunk_pdf's layout, for call_api_req to read."""
+    chunk_pdf.save(chunks, output_file)
+
+
+def main(mode="skip", input_file='data/out_chunk_pdf/spec_chunks.json', output_file=OUTPUT_FILE):
+    with open(input_file, 'r', encoding='utf-8') as file:
+        chunks = json.load(file)
+    save(run(chunks, mode), output_file)
+    print(f"Filtered chunks saved to '{output_file}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# On-disk cache of API responses so unchanged chunks are never sent to the API twice
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_PATH = "data/cache/responses.sqlite"
+
+# Evict least recently used responses once the cache grows past this size
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(data: Dict[str, Any]) -> str:
+    """Hash everything in a request that determines its response: the model, the prompts and the options."""
+    # Other options that change the output (e.g. response_format) are part of the key too.
+    # Streaming only changes how the response is delivered, so it is left out.
+    keyed = {k: v for k, v in data.items() if k not in ("stream", "stream_options")}
+    encoded = json.dumps(keyed, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """A SQLite-backed, content-addressed response cache with size-based LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 refresh: bool = False):
+        self.path = path
+        self.max_bytes = max_bytes
+        # When refresh is set, lookups always miss but fresh responses still replace the old ones
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.connection.commit()
+
+    def get(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a request, or None."""
+        key = cache_key(data)
+        with self.lock:
+            if self.refresh:
+                self.misses += 1
+                return None
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            # Touch the entry so it counts as recently used
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, data: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Store the response for a request and evict old entries if the cache is too big."""
+        key = cache_key(data)
+        encoded = json.dumps(response, ensure_ascii=False)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, encoded, len(encoded), time.time())
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self) -> None:
+        # Drop the least recently used entries until the total size fits
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self) -> None:
+        """Invalidate every cached response."""
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+        self.connection.execute("VACUUM")
+
+    def report(self, stage: str) -> None:
+        """Print the hit/miss counters for a stage."""
+        print(f"{stage} cache: {self.hits} hits, {self.misses} misses")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def main():
+    # Invalidate the whole cache so the next run re-sends every chunk
+    cache = ResponseCache()
+    cache.clear()
+    cache.close()
+    print(f"Cleared the response cache at '{DEFAULT_CACHE_PATH}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# Streaming mode for main.py: runs steps 2 to 8 at the same time, connected by a bounded queue,
+# so triple extraction starts as soon as the first requirements come back instead of after the last one.
+
+import csv
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src import call_api_req, call_api_trip, chunk_req, csv_to_cypher
+from src.api_client import APIClient, load_api_key, DEFAULT_MAX_WORKERS
+from src.chunker import split_sentences, pack_sentences, get_encoding
+from src.clean_req import APIResponseCleaner, JSONArrayWriter, StreamingJSONParser
+from src.clean_trip import parse_triples
+from src.group_req import extract_texts
+from src.jsonl import JSONLWriter
+from src.response_cache import ResponseCache
+from src.triple_store import TripleStore, STORE_DIR
+
+# Requirements waiting to be batched; when full, the requirements stage waits for the triple stage
+QUEUE_SIZE = 1000
+
+# Marks the end of the requirement stream
+_DONE = object()
+
+
+class InOrder:
+    """Releases items in index order as they arrive out of order from worker threads."""
+
+    def __init__(self):
+        self.pending = {}
+        self.next_index = 0
+
+    def release(self, index, item):
+        """Add an item and return every item that can now be handled, in order."""
+        self.pending[index] = item
+        ready = []
+        while self.next_index in self.pending:
+            ready.append(self.pending.pop(self.next_index))
+            self.next_index += 1
+        return ready
+
+
+def run(max_workers=DEFAULT_MAX_WORKERS, max_tokens=chunk_req.MAX_TOKENS, use_cache=True, sse=False):
+    """Run the requirement, cleaning, grouping, chunking, triple and CSV steps as one stream.
+
+    Reads the chunks written by chunk_pdf and writes the same files as running the steps one by one.
+    With sse=True the requirement responses are streamed, and each requirement moves on as soon as
+    it has been written instead of when its whole response is done.
+    """
+    api_key = load_api_key()
+    system_prompt = call_api_req.load_system_prompt()
+    axiom_prompt = call_api_trip.load_axiom_prompt()
+
+    with open("data/out_chunk_pdf/spec_chunks.json", "r", encoding="utf-8") as file:
+        doc_chunks = json.load(file)
+
+    # Each API stage keeps its own client because rate limits apply per model
+    cache = ResponseCache() if use_cache else None
+    req_client = APIClient(api_key, max_workers=max_workers, cache=cache)
+    trip_client = APIClient(api_key, max_workers=max_workers, cache=cache)
+    tokenizer = get_encoding(chunk_req.MODEL)
+    cleaner = APIResponseCleaner("", "data/out_clean_req/requirements.json")
+    # The intermediate requirement files are written as requirements arrive, so later steps can be rerun on their own
+    requirements_writer = JSONArrayWriter("data/out_clean_req/requirements.json")
+
+    for directory in ("data/out_call_api_req", "data/out_call_api_trip", "data/out_group_req", "data/out_chunk_req",
+                      "data/out_clean_trip"):
+        os.makedirs(directory, exist_ok=True)
+
+    requirement_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    req_order = InOrder()
+    req_writer = JSONLWriter("data/out_call_api_req/api_response.jsonl")
+    texts_file = open("data/out_group_req/requirements_all.txt", "w", encoding="utf-8")
+    text_count = 0
+
+    def emit(objects):
+        nonlocal text_count
+        for obj in objects:
+            requirements_writer.write(obj)
+        # Step 4: only the requirement text moves on
+        for text in extract_texts(objects):
+            texts_file.write(("\n" if text_count else "") + text)
+            text_count += 1
+            requirement_queue.put(text)
+
+    # With sse=True, the objects parsed so far from each response still arriving, and how many have moved on.
+    # Only the earliest unfinished chunk's objects move on right away so the chunk order is kept.
+    parsers = {}
+    streamed = {}
+    forwarded = {}
+
+    def forward(index):
+        objects = streamed.get(index, [])
+        emit(objects[forwarded.get(index, 0):])
+        forwarded[index] = max(forwarded.get(index, 0), len(objects))
+
+    def handle_delta(index, text):
+        parser = parsers.setdefault(index, StreamingJSONParser())
+        if text is None:
+            # The response broke off and is being retried; objects that already moved on are not sent twice
+            parser.reset()
+            streamed[index] = []
+            return
+        streamed.setdefault(index, []).extend(parser.feed(text))
+        if index == req_order.next_index:
+            forward(index)
+
+    # Step 2 and 3: as each chunk comes back, extract its requirements and queue their text in chunk order
+    def handle_requirements(index, result):
+        chunk = doc_chunks[index]
+        if result["status"] == 200:
+            req_writer.write({"chunk_id": chunk["chunk_id"], "response": result["response"]}, index)
+            print(f"Chunk ID {chunk['chunk_id']} sent to API")
+        else:
+            req_writer.write({"chunk_id": chunk["chunk_id"], "status": result["status"], "error": result["error"]}, index)
+            print(f"Error with Chunk ID {chunk['chunk_id']}: {result['status']}, {result['error']}")
+
+        for ready_index, ready in req_order.release(index, (index, result)):
+            if ready["status"] != 200:
+                continue
+            if streamed.get(ready_index) or forwarded.get(ready_index):
+                # Send on whatever the stream parsed since the chunk's last objects moved on
+                forward(ready_index)
+                for state in (parsers, streamed, forwarded):
+                    state.pop(ready_index, None)
+                continue
+            try:
+                content = ready["response"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError) as e:
+                print(f"[Entry {ready_index + 1}] Skipping due to missing keys: {e}")
+                continue
+            # Cached and non-streamed responses are parsed whole
+            emit(cleaner.extract_objects(content, ready_index + 1))
+
+        # The next chunk in line may already have streamed objects waiting
+        if req_order.next_index in streamed:
+            forward(req_order.next_index)
+
+    producer_errors = []
+
+    def send_requirements():
+        try:
+            req_client.map([call_api_req.build_payload(chunk, system_prompt, stream=sse) for chunk in doc_chunks],
+                           on_result=handle_requirements, on_delta=handle_delta if sse else None)
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            requirement_queue.put(_DONE)
+
+    producer = threading.Thread(target=send_requirements, daemon=True)
+    producer.start()
+
+    # Step 6 and 7: each finished batch of triples is written to the CSV in batch order
+    trip_writer = JSONLWriter("data/out_call_api_trip/api_response.jsonl")
+    trip_order = InOrder()
+    trip_lock = threading.Lock()
+    csv_file = open("data/out_clean_trip/triples.csv", "w", newline="")
+    csv_writer = csv.writer(csv_file)
+    csv_writer.writerow(['Subject', 'Predicate', 'Object'])
+    # As in clean_trip, each distinct triple is written once, in the spelling it first appeared in
+    store = TripleStore()
+    triple_count = 0
+
+    def send_triples(index, filename, content):
+        nonlocal triple_count
+        result = trip_client.post(call_api_trip.build_payload(content, axiom_prompt))
+        with trip_lock:
+            if result["status"] == 200:
+                trip_writer.write({"filename": filename, "response": result["response"]}, index)
+                print(f"File '{filename}' sent to API")
+            else:
+                trip_writer.write({"filename": filename, "status": result["status"], "error": result["error"]}, index)
+                print(f"Error with File '{filename}': {result['status']}, {result['error']}")
+            for ready in trip_order.release(index, result):
+                if ready["status"] != 200:
+                    continue
+                choices = ready["response"].get("choices", [])
+                if choices and choices[0].get("message", {}).get("content"):
+                    for triple in parse_triples(choices[0]["message"]["content"]):
+                        triple_count += 1
+                        if store.add(*triple):
+                            csv_writer.writerow(store.triple(-1))
+
+    # Step 5: pack the requirements into token-limited batches as they arrive and dispatch each one immediately
+    requirements = iter(requirement_queue.get, _DONE)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        sentences = ((sentence, []) for sentence in split_sentences(requirements))
+        # Requirements are tokenized one at a time as they come off the queue; reading ahead for a larger
+        # batch would hold back the first triple request until that many requirements were cleaned
+        batches = pack_sentences(sentences, max_tokens, tokenizer, chunk_req.OVERLAP_TOKENS, joiner="", batch_size=1)
+        for index, (batch, _) in enumerate(batches):
+            filename = f"requirements_{index + 1}.txt"
+            with open(os.path.join("data/out_chunk_req", filename), "w", encoding="utf-8") as file:
+                file.write(batch)
+            futures.append(executor.submit(send_triples, index, filename, batch))
+        # Raise any error from the triple workers
+        for future in futures:
+            future.result()
+
+    producer.join()
+    req_writer.close()
+    trip_writer.close()
+    csv_file.close()
+    requirements_writer.close()
+    texts_file.close()
+    if producer_errors:
+        raise producer_errors[0]
+    print(f"Collected {requirements_writer.count} JSON objects and {text_count} requirements")
+    store.save(STORE_DIR)
+    print(f"{len(futures)} requirement batches produced {triple_count} triples, {len(store)} of them unique")
+
+    if cache is not None:
+        cache.report("Streaming")
+        cache.close()
+
+    # Step 8: the Cypher script needs every node up front, so it is generated once the triples are in
+    csv_to_cypher.main()
@@ -0,0 +1,257 @@
+# Answers questions about the extracted triples without a Neo4j server.
+# Run it with a pattern, e.g. python -m src.triple_query "?s must be ?o"
+
+import csv
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.triple_store import Dictionary, TripleStore, STORE_DIR
+
+INDEX_DIR = "data/out_clean_trip/index"
+TRIPLES_CSV = "data/out_clean_trip/triples.csv"
+
+# Each index holds every triple with its columns reordered so one term leads, sorted by (first, second, third).
+# Indexes are stored as three rows (one per column) so a column can be binary-searched in place.
+ORDERS = {"spo": (0, 1, 2), "pos": (1, 2, 0), "osp": (2, 0, 1)}
+
+# Variables (?name), quoted terms and bare words of a pattern
+PATTERN_TOKENS = re.compile(r'\?\w+|"[^"]*"|[^\s"?]+')
+
+
+def build_index(store_dir: str = STORE_DIR, index_dir: str = INDEX_DIR) -> None:
+    """Sort the triple store's ID columns into the SPO, POS and OSP indexes and save them for memory-mapping."""
+    if TripleStore.exists(store_dir):
+        store = TripleStore.load(store_dir)
+    else:
+        # Output from before clean_trip saved a store only has the CSV
+        store = TripleStore()
+        with open(TRIPLES_CSV, "r", newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            for row in reader:
+                if len(row) == 3:
+                    store.add(*row)
+    columns = np.stack([np.frombuffer(store.subjects, dtype=np.uint32),
+                        np.frombuffer(store.predicate_ids, dtype=np.uint32),
+                        np.frombuffer(store.objects, dtype=np.uint32)], axis=1)
+    os.makedirs(index_dir, exist_ok=True)
+    for name, order in ORDERS.items():
+        permuted = columns[:, order]
+        # lexsort sorts by its last key first
+        permuted = permuted[np.lexsort((permuted[:, 2], permuted[:, 1], permuted[:, 0]))]
+        np.save(os.path.join(index_dir, f"{name}.npy"), np.ascontiguousarray(permuted.T))
+    # The term lists are read from the index directory so it can be used on its own
+    store.entities.save(os.path.join(index_dir, "entities.txt"))
+    store.predicates.save(os.path.join(index_dir, "predicates.txt"))
+
+
+def prefix_range(index: np.ndarray, first: int, second: Optional[int] = None) -> Tuple[int, int]:
+    """Return the range of triples in a sorted index that start with `first` (and `second`)."""
+    # Searching with a Python int would convert the whole uint32 column to int64 first
+    first = np.uint32(first)
+    second = None if second is None else np.uint32(second)
+    lo = int(np.searchsorted(index[0], first, side="left"))
+    hi = int(np.searchsorted(index[0], first, side="right"))
+    if second is not None and lo < hi:
+        column = index[1, lo:hi]
+        lo, hi = lo + int(np.searchsorted(column, second, side="left")), lo + int(np.searchsorted(column, second, side="right"))
+    return lo, hi
+
+
+class TripleIndex:
+    """Pattern, neighborhood and path queries over memory-mapped SPO, POS and OSP indexes.
+
+    Opening maps the index files without reading them; the term lists load on first use.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR):
+        self.index_dir = index_dir
+        self.indexes = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r") for name in ORDERS}
+        self._entities: Optional[Dictionary] = None
+        self._predicates: Optional[Dictionary] = None
+
+    @classmethod
+    def open(cls, index_dir: str = INDEX_DIR, store_dir: str = STORE_DIR) -> "TripleIndex":
+        """Open the index, building it first if it is missing or older than the triple store."""
+        marker = os.path.join(index_dir, "spo.npy")
+        source = os.path.join(store_dir, "subjects.bin") if TripleStore.exists(store_dir) else TRIPLES_CSV
+        if not os.path.exists(marker) or (os.path.exists(source) and
+                                          os.path.getmtime(source) > os.path.getmtime(marker)):
+            build_index(store_dir, index_dir)
+        return cls(index_dir)
+
+    @property
+    def entities(self) -> Dictionary:
+        if self._entities is None:
+            self._entities = Dictionary.load(os.path.join(self.index_dir, "entities.txt"))
+        return self._entities
+
+    @property
+    def predicates(self) -> Dictionary:
+        if self._predicates is None:
+            self._predicates = Dictionary.load(os.path.join(self.index_dir, "predicates.txt"))
+        return self._predicates
+
+    def __len__(self) -> int:
+        return self.indexes["spo"].shape[1]
+
+    def match_ids(self, s: Optional[int] = None, p: Optional[int] = None,
+                  o: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+        """Yield the (s, p, o) ID triples matching the bound positions; None matches anything."""
+        # Use the index whose leading columns are the bound ones
+        if s is not None:
+            name, first, second, third = ("spo", s, p, o) if o is None or p is not None else ("osp", o, s, None)
+        elif p is not None:
+            name, first, second, third = "pos", p, o, None
+        elif o is not None:
+            name, first, second, third = "osp", o, None, None
+        else:
+            name, first, second, third = "spo", None, None, None
+        index = self.indexes[name]
+        lo, hi = (0, index.shape[1]) if first is None else prefix_range(index, first, second)
+        columns = index[:, lo:hi]
+        if third is not None:
+            columns = columns[:, columns[2] == np.uint32(third)]
+        # Put the columns back in subject, predicate, object order
+        for s, p, o in columns[np.argsort(ORDERS[name])].T.tolist():
+            yield s, p, o
+
+    def edges(self, node: int) -> List[Tuple[int, int, int]]:
+        """Return the ID triples an entity ID is the subject or object of, each once."""
+        outgoing = list(self.match_ids(s=node))
+        # Triples from the entity to itself are already among the outgoing ones
+        return outgoing + [triple for triple in self.match_ids(o=node) if triple[0] != node]
+
+    def match(self, subject: Optional[str] = None, predicate: Optional[str] = None,
+              obj: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """Return the triples matching the given terms; None matches anything."""
+        ids = []
+        for term, dictionary in ((subject, self.entities), (predicate, self.predicates), (obj, self.entities)):
+            term_id = None if term is None else dictionary.get(term)
+            if term is not None and term_id is None:
+                return []
+            ids.append(term_id)
+        return [(self.entities[s], self.predicates[p], self.entities[o]) for s, p, o in self.match_ids(*ids)]
+
+    def query(self, pattern: str) -> List[Dict[str, str]]:
+        """Answer a pattern like '?s must be ?o' or '"the system" ?p ?o' with one binding per matching triple.
+
+        Terms are variables (?name), quoted text, or runs of bare words; there must be three of them.
+        """
+        terms: List[str] = []
+        words: List[str] = []
+        for token in PATTERN_TOKENS.findall(pattern):
+            if token.startswith("?") or token.startswith('"'):
+                if words:
+                    terms.append(" ".join(words))
+                    words = []
+                terms.append(token.strip('"') if token.startswith('"') else token)
+            else:
+                words.append(token)
+        if words:
+            terms.append(" ".join(words))
+        if len(terms) != 3:
+            raise ValueError(f"A pattern needs a subject, predicate and object; got {terms}")
+
+        variables = [term[1:] if term.startswith("?") else None for term in terms]
+        bound = [None if variable else term for variable, term in zip(variables, terms)]
+        results = []
+        for triple in self.match(*bound):
+            binding = {}
+            # A variable used twice must match the same term both times
+            if all(binding.setdefault(variable, value) == value
+                   for variable, value in zip(variables, triple) if variable):
+                results.append(binding)
+        return results
+
+    def neighbors(self, entity: str) -> List[Tuple[str, str, str]]:
+        """Return every triple the entity is the subject or object of."""
+        entity_id = self.entities.get(entity)
+        if entity_id is None:
+            return []
+        return [(self.entities[s], self.predicates[p], self.entities[o]) for s, p, o in self.edges(entity_id)]
+
+    def expand(self, entity: str, hops: int = 1) -> Set[str]:
+        """Return the entities within `hops` relationships of the entity, in either direction."""
+        start = self.entities.get(entity)
+        if start is None:
+            return set()
+        seen = {start}
+        frontier = [start]
+        for _ in range(hops):
+            next_frontier = []
+            for node in frontier:
+                for s, _, o in self.edges(node):
+                    other = o if s == node else s
+                    if other not in seen:
+                        seen.add(other)
+                        next_frontier.append(other)
+            frontier = next_frontier
+        seen.discard(start)
+        return {self.entities[node] for node in seen}
+
+    def path(self, start: str, end: str, max_hops: int = 3) -> Optional[List[Tuple[str, str, str]]]:
+        """Return the triples of a shortest path between two entities (either direction), or None."""
+        source, target = self.entities.get(start), self.entities.get(end)
+        if source is None or target is None:
+            return None
+        # Breadth-first search from both ends, always growing the smaller frontier,
+        # remembering the triple each entity was reached through
+        reached_by: List[Dict[int, Optional[Tuple[int, int, int]]]] = [{source: None}, {target: None}]
+        frontiers = [[source], [target]]
+        meeting = source if source == target else None
+        for _ in range(max_hops):
+            if meeting is not None:
+                break
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            next_frontier = []
+            for node in frontiers[side]:
+                for s, p, o in self.edges(node):
+                    other = o if s == node else s
+                    if other not in reached_by[side]:
+                        reached_by[side][other] = (s, p, o)
+                        next_frontier.append(other)
+                        if other in reached_by[1 - side]:
+                            meeting = other
+                            break
+                if meeting is not None:
+                    break
+            if not next_frontier:
+                return None
+            frontiers[side] = next_frontier
+        if meeting is None:
+            return None
+
+        halves = []
+        for side in (0, 1):
+            steps, node = [], meeting
+            while reached_by[side][node] is not None:
+                s, p, o = reached_by[side][node]
+                steps.append((self.entities[s], self.predicates[p], self.entities[o]))
+                node = s if o == node else o
+            halves.append(steps)
+        return halves[0][::-1] + halves[1]
+
+
+def main():
+    pattern = " ".join(sys.argv[1:]) or "?s ?p ?o"
+    start = time.perf_counter()
+    index = TripleIndex.open()
+    opened = time.perf_counter()
+    results = index.query(pattern)
+    answered = time.perf_counter()
+    for binding in results[:50]:
+        print(", ".join(f"{name}={value}" for name, value in binding.items()))
+    if len(results) > 50:
+        print(f"... {len(results) - 50} more")
+    print(f"{len(results)} results from {len(index)} triples "
+          f"(opened in {(opened - start) * 1000:.1f} ms, answered in {(answered - opened) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# A compact, deduplicated store for the triples clean_trip extracts.
+# Each distinct entity and predicate is kept once in a dictionary; triples are three columns of integer IDs.
+
+import os
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+STORE_DIR = "data/out_clean_trip/store"
+
+# Typecode of the ID columns: unsigned 32-bit integers
+ID_TYPE = "I"
+# Starting size of the table for spotting duplicate triples (a power of two)
+MIN_SLOTS = 1024
+
+
+def normalize(term: str) -> str:
+    """Return the key a term is interned under: case and runs of whitespace don't matter."""
+    return " ".join(term.split()).casefold()
+
+
+class Dictionary:
+    """Maps terms to consecutive integer IDs, merging terms that only differ in case or spacing.
+
+    A term's text is the first spelling seen, with its whitespace tidied.
+    """
+
+    def __init__(self, terms: Optional[Iterable[str]] = None):
+        self.terms: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for term in terms or []:
+            self.intern(term)
+
+    def intern(self, term: str) -> int:
+        key = normalize(term)
+        term_id = self.ids.get(key)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.ids[key] = term_id
+            self.terms.append(" ".join(term.split()))
+        return term_id
+
+    def get(self, term: str) -> Optional[int]:
+        """Return a term's ID without adding it, or None if it was never interned."""
+        return self.ids.get(normalize(term))
+
+    def __getitem__(self, term_id: int) -> str:
+        return self.terms[term_id]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def save(self, path: str) -> None:
+        # One term per line; normalizing whitespace guarantees no term contains a newline
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(self.terms))
+
+    @classmethod
+    def load(cls, path: str) -> "Dictionary":
+        with open(path, "r", encoding="utf-8") as file:
+            text = file.read()
+        return cls(text.split("\n") if text else [])
+
+
+class TripleStore:
+    """Deduplicated triples as subject, predicate and object ID columns.
+
+    Subjects and objects share the entity dictionary, so an entity has one ID wherever it appears.
+    """
+
+    def __init__(self):
+        self.entities = Dictionary()
+        self.predicates = Dictionary()
+        self.subjects = array(ID_TYPE)
+        self.predicate_ids = array(ID_TYPE)
+        self.objects = array(ID_TYPE)
+        # Hash table for spotting duplicates, kept at most half full: each slot holds the index of a stored
+        # triple plus one, or 0 if empty, and the triple itself is compared in the ID columns
+        self.slots = array(ID_TYPE, bytes(MIN_SLOTS * 4))
+
+    def _slot(self, s: int, p: int, o: int) -> int:
+        # Probe from the triple's hash until the slot holding it or an empty one
+        mask = len(self.slots) - 1
+        slot = hash((s, p, o)) & mask
+        while True:
+            index = self.slots[slot] - 1
+            if index < 0 or (self.subjects[index] == s and self.predicate_ids[index] == p
+                             and self.objects[index] == o):
+                return slot
+            slot = (slot + 1) & mask
+
+    def _rehash(self, size: int) -> None:
+        self.slots = array(ID_TYPE, bytes(size * 4))
+        for index, (s, p, o) in enumerate(self.ids(), start=1):
+            self.slots[self._slot(s, p, o)] = index
+
+    def add(self, subject: str, predicate: str, obj: str) -> bool:
+        """Add a triple, returning False if it was already stored."""
+        s, p, o = self.entities.intern(subject), self.predicates.intern(predicate), self.entities.intern(obj)
+        slot = self._slot(s, p, o)
+        if self.slots[slot]:
+            return False
+        self.subjects.append(s)
+        self.predicate_ids.append(p)
+        self.objects.append(o)
+        self.slots[slot] = len(self.subjects)
+        if 2 * len(self.subjects) > len(self.slots):
+            self._rehash(2 * len(self.slots))
+        return True
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def triple(self, index: int) -> Tuple[str, str, str]:
+        """Return the text of the triple at `index` (negative indexes count from the end)."""
+        return (self.entities[self.subjects[index]], self.predicates[self.predicate_ids[index]],
+                self.entities[self.objects[index]])
+
+    def ids(self) -> Iterator[Tuple[int, int, int]]:
+        """Yield each triple as (subject ID, predicate ID, object ID)."""
+        return zip(self.subjects, self.predicate_ids, self.objects)
+
+    def __iter__(self) -> Iterator[Tuple[str, str, str]]:
+        """Yield each triple as (subject, predicate, object) text."""
+        entities, predicates = self.entities.terms, self.predicates.terms
+        for s, p, o in self.ids():
+            yield entities[s], predicates[p], entities[o]
+
+    def save(self, directory: str = STORE_DIR) -> None:
+        """Write the dictionaries as text and the ID columns as raw unsigned 32-bit integers in native byte order."""
+        os.makedirs(directory, exist_ok=True)
+        self.entities.save(os.path.join(directory, "entities.txt"))
+        self.predicates.save(os.path.join(directory, "predicates.txt"))
+        # subjects.bin etc. can also be opened directly with numpy.fromfile(path, dtype=numpy.uint32)
+        for name, column in (("subjects", self.subjects), ("predicates", self.predicate_ids),
+                             ("objects", self.objects)):
+            with open(os.path.join(directory, f"{name}.bin"), "wb") as file:
+                column.tofile(file)
+
+    @classmethod
+    def load(cls, directory: str = STORE_DIR) -> "TripleStore":
+        store = cls()
+        store.entities = Dictionary.load(os.path.join(directory, "entities.txt"))
+        store.predicates = Dictionary.load(os.path.join(directory, "predicates.txt"))
+        for name, column in (("subjects", store.subjects), ("predicates", store.predicate_ids),
+                             ("objects", store.objects)):
+            path = os.path.join(directory, f"{name}.bin")
+            with open(path, "rb") as file:
+                column.fromfile(file, os.path.getsize(path) // column.itemsize)
+        size = MIN_SLOTS
+        while size < 2 * len(store):
+            size *= 2
+        store._rehash(size)
+        return store
+
+    @classmethod
+    def exists(cls, directory: str = STORE_DIR) -> bool:
+        return os.path.exists(os.path.join(directory, "subjects.bin"))